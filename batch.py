@@ -0,0 +1,361 @@
+import argparse
+import functools
+import itertools
+import json
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chess32 import (CODES, ENDGAME_SCORES, KNIGHT_TARGETS, MIDGAME_SCORES,
+                     NAMES, PHASES, PIECE_VALUES, RAY_SQUARES,
+                     SLIDE_DIRECTIONS, TOTAL_PHASE, ChessBoard)
+
+# Positions packed and scored at once, which bounds the memory used: scoring
+# a chunk takes under a kilobyte per position
+CHUNK_SIZE = 4096
+
+# Centipawns for each square a knight, bishop, rook or queen can move to
+MOBILITY_WEIGHT = 2
+
+# Piece codes of the twelve planes of a one-hot (N, 12, 64) array: white's
+# pawn, knight, bishop, rook, queen and king, then black's
+PLANE_CODES = [code for code, name in enumerate(NAMES) if name != '']
+
+# Code stored past the last square, so that padded lookups of off board
+# squares find a square that neither player can move to
+OFF_BOARD = 255
+
+# FEN placement letters as piece codes, and digits as runs of empty squares
+# ('.' is code 0 once translated), for packing without building boards
+FEN_CODES = bytes.maketrans(
+    b'.' + bytes(ord(name[1].upper() if name[0] == 'w' else name[1])
+                 for name in NAMES if name != ''),
+    bytes([0] + PLANE_CODES))
+FEN_EMPTY = str.maketrans({str(count): '.' * count for count in range(1, 9)}
+                          | {'/': ''})
+
+
+class Tables():
+    '''
+    NumPy lookup tables for scoring packed positions, built from the
+    ChessBoard tables. Building them takes a moment, so lookup_tables()
+    builds them once and the batch functions share that copy.
+
+    Attributes:
+        scores: middlegame and endgame scores by piece code and square, 0
+                for the unused codes
+        phases: phase weight of each piece code
+        material: piece value of each piece code, negative for black
+        knights: knight targets of every square, padded with square 64
+        rays: squares along each ray of every square, nearest first,
+              padded with square 64
+        colors: color of each code: 1 for white, 2 for black and 3 for
+                OFF_BOARD, so two codes are of opposite colors when the xor
+                of their colors is 3
+        slides: whether each code moves along each of the eight directions
+        knight_codes: whether each code is a knight
+    '''
+
+    def __init__(self):
+        self.scores = [
+            np.array([row if row is not None else [0] * 64 for row in table],
+                     dtype=np.int32)
+            for table in (MIDGAME_SCORES, ENDGAME_SCORES)]
+        self.phases = np.array(PHASES, dtype=np.int32)
+        self.material = np.array(
+            [0 if name == '' else
+             PIECE_VALUES[name[1]] * (1 if name[0] == 'w' else -1)
+             for name in NAMES], dtype=np.int32)
+
+        # Square 64 is the OFF_BOARD column added past the last square
+        self.knights = np.full((64, 8), 64, dtype=np.intp)
+        self.rays = np.full((64, 8, 7), 64, dtype=np.intp)
+        for square in range(64):
+            targets = KNIGHT_TARGETS[square]
+            self.knights[square, :len(targets)] = targets
+            for direction in range(8):
+                ray = RAY_SQUARES[square][direction]
+                self.rays[square, direction, :len(ray)] = ray
+
+        self.colors = np.zeros(256, dtype=np.uint8)
+        self.colors[1:7] = 1
+        self.colors[9:15] = 2
+        self.colors[OFF_BOARD] = 3
+
+        self.slides = np.zeros((8, 256), dtype=bool)
+        self.knight_codes = np.zeros(256, dtype=bool)
+        for code, name in enumerate(NAMES):
+            if name != '' and name[1] in SLIDE_DIRECTIONS:
+                self.slides[list(SLIDE_DIRECTIONS[name[1]]), code] = True
+            elif name[1:] == 'n':
+                self.knight_codes[code] = True
+
+
+def _require_numpy():
+    # Batch evaluation is optional: raise a clear error without NumPy
+    if np is None:
+        raise ImportError('batch evaluation needs NumPy (pip install numpy)')
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_tables():
+    '''
+    Returns the Tables, built the first time they are needed.
+    '''
+    _require_numpy()
+    return Tables()
+
+
+def pack_fens(fens):
+    '''
+    Returns the piece codes of a list of FEN strings as an (N, 64) uint8
+    array, in the order of ChessBoard.squares (rank * 8 + file, rank 0 is
+    black's back rank), and the side to move as an (N,) array of 0 for white
+    and 1 for black. Only the piece placement and side to move are read.
+    '''
+    _require_numpy()
+    placements = []
+    turns = []
+    for fen in fens:
+        fields = fen.split()
+        placement = fields[0].translate(FEN_EMPTY)
+        if len(placement) != 64:
+            raise ValueError(f'bad piece placement in FEN: {fen!r}')
+        placements.append(placement.encode('ascii'))
+        turns.append(len(fields) > 1 and fields[1] == 'b')
+    codes = np.frombuffer(b''.join(placements).translate(FEN_CODES),
+                          dtype=np.uint8).reshape(-1, 64)
+    if codes.size and codes.max() > 14:
+        raise ValueError('unknown piece letter in FEN')
+    return codes, np.array(turns, dtype=np.uint8)
+
+
+def pack_boards(boards):
+    '''
+    Returns the piece codes and sides to move of a list of boards as in
+    pack_fens. A ChessBoard's squares are copied as they are; other boards
+    are read through their state view.
+    '''
+    _require_numpy()
+    placements = []
+    turns = []
+    for board in boards:
+        squares = getattr(board, 'squares', None)
+        if squares is None:
+            squares = bytes(CODES[name] for rank in board.state
+                            for name in rank)
+        placements.append(bytes(squares))
+        turns.append(board.turn == 'b')
+    codes = np.frombuffer(b''.join(placements),
+                          dtype=np.uint8).reshape(-1, 64)
+    return codes, np.array(turns, dtype=np.uint8)
+
+
+def pack(positions):
+    '''
+    Returns the piece codes and sides to move of a list of positions, each
+    a FEN string or a board, as in pack_fens.
+    '''
+    positions = list(positions)
+    if positions and isinstance(positions[0], str):
+        return pack_fens(positions)
+    return pack_boards(positions)
+
+
+def planes(codes):
+    '''
+    Returns an (N, 64) array of piece codes as an (N, 12, 64) uint8 array
+    with a 1 where each square holds the piece of each plane (PLANE_CODES).
+    '''
+    _require_numpy()
+    piece_codes = np.array(PLANE_CODES, dtype=np.uint8)
+    return (codes[:, None, :] == piece_codes[None, :, None]).view(np.uint8)
+
+
+def mobility(codes, tables=None):
+    '''
+    Returns, for an (N, 64) array of piece codes, the number of squares
+    white's knights, bishops, rooks and queens can move to minus black's.
+    This approximates mobility: pins, checks and the kings' safety are
+    ignored, and a move counts when its square is empty or holds an enemy
+    piece. tables are the lookup tables to use (lookup_tables() by default).
+    '''
+    if tables is None:
+        tables = lookup_tables()
+    # Squares are the rows here, so that looking up a target square for
+    # every position copies one row
+    padded = np.full((65, len(codes)), OFF_BOARD, dtype=np.uint8)
+    padded[:64] = codes.T
+    colors = tables.colors[padded[:64]]
+    moves = np.zeros(colors.shape, dtype=np.uint8)
+
+    def step(moving, targets):
+        # Count the moves of the moving pieces to their target squares, and
+        # return which of them can carry on past an empty square
+        target_codes = padded[targets]
+        empty = target_codes == 0
+        captures = (colors ^ tables.colors[target_codes]) == 3
+        np.add(moves, moving & (empty | captures), out=moves)
+        return moving & empty
+
+    # Knights jump once to each target, and the sliding pieces step along
+    # every ray of theirs until they reach a piece or the edge
+    knights = tables.knight_codes[padded[:64]]
+    for jump in range(8):
+        step(knights, tables.knights[:, jump])
+    for direction in range(8):
+        moving = tables.slides[direction][padded[:64]]
+        for distance in range(7):
+            if not moving.any():
+                break
+            moving = step(moving, tables.rays[:, direction, distance])
+
+    white = np.where(colors == 1, moves, 0).sum(axis=0, dtype=np.int32)
+    black = np.where(colors == 2, moves, 0).sum(axis=0, dtype=np.int32)
+    return white - black
+
+
+def score_terms(codes, tables=None):
+    '''
+    Returns a dict of (N,) int32 arrays for an (N, 64) array of piece codes,
+    all from white's point of view: 'material', 'squares' (the square
+    bonuses blended between the middlegame and endgame tables as in
+    ChessBoard.evaluate), 'mobility' (see mobility) and 'phase'. tables are
+    the lookup tables to use (lookup_tables() by default).
+    '''
+    if tables is None:
+        tables = lookup_tables()
+    columns = np.arange(64)
+    middlegame = tables.scores[0][codes, columns].sum(axis=1)
+    endgame = tables.scores[1][codes, columns].sum(axis=1)
+    phase = np.minimum(tables.phases[codes].sum(axis=1), TOTAL_PHASE)
+
+    # The same blend as ChessBoard.evaluate, rounded towards zero
+    blend = middlegame * phase + endgame * (TOTAL_PHASE - phase)
+    blend = np.sign(blend) * (np.abs(blend) // TOTAL_PHASE)
+    material = tables.material[codes].sum(axis=1)
+    return {
+        'material': material.astype(np.int32),
+        'squares': (blend - material).astype(np.int32),
+        'mobility': mobility(codes, tables),
+        'phase': phase.astype(np.int32)
+    }
+
+
+def score_codes(codes, turns, mobility_weight=MOBILITY_WEIGHT,
+                tables=None):
+    '''
+    Returns the scores in centipawns of an (N, 64) array of piece codes as
+    an (N,) int32 array, each from the point of view of its side to move
+    (turns, 1 for black): material and square bonuses, which match
+    ChessBoard.evaluate, plus mobility_weight for each square of mobility.
+    tables are passed on to score_terms.
+    '''
+    terms = score_terms(codes, tables)
+    score = terms['material'] + terms['squares']
+    if mobility_weight != 0:
+        score = score + mobility_weight * terms['mobility']
+    return np.where(turns == 1, -score, score).astype(np.int32)
+
+
+def evaluate_batch(positions, chunk_size=CHUNK_SIZE,
+                   mobility_weight=MOBILITY_WEIGHT):
+    '''
+    Returns the scores of any number of positions (FEN strings or boards,
+    from any iterable, such as the lines of a file) as an (N,) int32 array,
+    as in score_codes. The positions are packed and scored chunk_size at a
+    time, so only the scores are held for the whole input.
+    '''
+    tables = lookup_tables()
+    positions = iter(positions)
+    scores = []
+    while True:
+        chunk = list(itertools.islice(positions, chunk_size))
+        if chunk == []:
+            break
+        codes, turns = pack(chunk)
+        scores.append(score_codes(codes, turns, mobility_weight, tables))
+    if scores == []:
+        return np.zeros(0, dtype=np.int32)
+    return np.concatenate(scores)
+
+
+def _read_fens(lines):
+    # FEN strings from lines of text, skipping blank lines
+    for line in lines:
+        line = line.strip()
+        if line != '':
+            yield line
+
+
+def main(argv=None):
+    '''
+    Command line entry point: scores the FEN positions in a file, one per
+    line, and prints the number of positions, the time taken and the mean
+    score as JSON. The scores can be saved as a NumPy array with --output.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Score many FEN positions at once with NumPy.')
+    parser.add_argument('fens', help="file of FEN positions, or '-' for stdin")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'positions scored at once (default '
+                        f'{CHUNK_SIZE})')
+    parser.add_argument('--mobility-weight', type=int,
+                        default=MOBILITY_WEIGHT,
+                        help=f'centipawns per square of mobility (default '
+                        f'{MOBILITY_WEIGHT}, 0 matches ChessBoard.evaluate)')
+    parser.add_argument('--output', help='save the scores to this .npy file')
+    parser.add_argument('--check', type=int, default=0, metavar='N',
+                        help='compare the first N scores with '
+                        'ChessBoard.evaluate (needs --mobility-weight 0)')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print('batch.py needs NumPy: pip install numpy', file=sys.stderr)
+        return 1
+
+    if args.check > 0 and args.mobility_weight != 0:
+        parser.error('--check needs --mobility-weight 0')
+    if args.check > 0 and args.fens == '-':
+        parser.error('--check needs a file, not stdin')
+
+    start = time.perf_counter()
+    if args.fens == '-':
+        scores = evaluate_batch(_read_fens(sys.stdin), args.chunk_size,
+                                args.mobility_weight)
+    else:
+        with open(args.fens) as lines:
+            scores = evaluate_batch(_read_fens(lines), args.chunk_size,
+                                    args.mobility_weight)
+    seconds = time.perf_counter() - start
+
+    result = {
+        'positions': len(scores),
+        'seconds': round(seconds, 3),
+        'positions_per_second': round(len(scores) / seconds, 1),
+        'mean_score': round(float(scores.mean()), 2) if len(scores) else 0
+    }
+    if args.check > 0:
+        # Score the first positions one board at a time to compare
+        with open(args.fens) as lines:
+            fens = list(itertools.islice(_read_fens(lines), args.check))
+        start = time.perf_counter()
+        expected = [ChessBoard.from_fen(fen).evaluate() for fen in fens]
+        seconds = time.perf_counter() - start
+        result['checked'] = len(expected)
+        result['mismatches'] = int(
+            (scores[:len(expected)] != np.array(expected)).sum())
+        result['board_positions_per_second'] = round(
+            len(expected) / seconds, 1)
+    if args.output is not None:
+        np.save(args.output, scores)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,687 @@
+import sys
+
+from chess32 import (ChessBoard, SLIDES, KNIGHT_TARGETS, KING_TARGETS,
+                     PAWN_TARGETS, RAY_SQUARES, OPPOSITE, ZOBRIST_PIECES,
+                     CASTLE_BITS, CODES, MIDGAME_SCORES, ENDGAME_SCORES,
+                     PHASES, main)
+
+# Squares are numbered rank * 8 + file, so bit 0 is a8 and bit 63 is h1,
+# matching the indexing of ChessBoard.state
+FULL = (1 << 64) - 1
+RANK_MASKS = [0xFF << (8 * rank) for rank in range(8)]
+
+
+def _masks(table):
+    '''
+    Turns a lookup table from chess32, with a list of square numbers for
+    every square, into a list with the mask of those squares for every
+    square.
+    '''
+    masks = []
+    for targets in table:
+        mask = 0
+        for target in targets:
+            mask |= 1 << target
+        masks.append(mask)
+    return masks
+
+
+# Precomputed attack masks for the jumping pieces and pawns. A pawn's
+# attack mask for a color is also where enemy pawns attacking it stand
+KNIGHT_MASKS = _masks(KNIGHT_TARGETS)
+KING_MASKS = _masks(KING_TARGETS)
+PAWN_ATTACKS = {'w': _masks(PAWN_TARGETS['w']),
+                'b': _masks(PAWN_TARGETS['b'])}
+
+# Precomputed rays for the sliding pieces. Rays that go towards higher
+# square numbers meet their first blocker at the lowest set bit, the others
+# at the highest set bit
+RAYS = {
+    step: _masks([rays[direction] for rays in RAY_SQUARES])
+    for direction, step in enumerate(SLIDES['q'])
+}
+INCREASING = {step: step[0] * 8 + step[1] > 0 for step in SLIDES['q']}
+
+# Squares that have to be empty for each castle, by color and side
+CASTLE_GAPS = {
+    ('w', 'k'): (1 << 61) | (1 << 62),
+    ('w', 'q'): (1 << 57) | (1 << 58) | (1 << 59),
+    ('b', 'k'): (1 << 5) | (1 << 6),
+    ('b', 'q'): (1 << 1) | (1 << 2) | (1 << 3)
+}
+
+
+def slide_attacks(square, occupied, steps):
+    '''
+    Returns the mask of squares attacked from square by a piece sliding along
+    the given steps, stopping at (and including) the first occupied square on
+    each ray.
+    '''
+    attacks = 0
+    for step in steps:
+        ray = RAYS[step][square]
+        blockers = ray & occupied
+        if blockers:
+            # Cut the ray off behind the first blocker
+            if INCREASING[step]:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= RAYS[step][first]
+        attacks |= ray
+    return attacks
+
+
+def squares(mask):
+    '''
+    Yields the square number of every set bit in the mask, lowest first.
+    '''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitChessBoard(ChessBoard):
+    '''
+    ChessBoard that stores the position as twelve 64-bit integer bitboards,
+    one per colored piece such as 'wq', plus an occupancy mask for each
+    color. Attack detection and move generation use shifts and the
+    precomputed masks above. Every ChessBoard method keeps working; state is
+    a view derived from the bitboards, so a position is loaded by assigning
+    a whole nested list to state (editing the view does not change the
+    board). Methods added or overridden:
+
+    piece_on(square) : Returns the piece name on a square number, or ''
+
+    attacked(square, by) : Returns True or False depending on whether the
+                           player by attacks the square, worked out from
+                           the bitboards instead of attack maps
+
+    check_info(player) : Returns the checkers, pins and king danger squares
+                         of the player, worked out from the bitboards
+    '''
+    __slots__ = ('bitboards', 'occupancy')
+
+    def __init__(self):
+        self._view = None
+        # ChessBoard sets the starting position through the state setter
+        super().__init__()
+
+    @property
+    def state(self):
+        # Rebuild the nested list view only after the board changed
+        if self._view is None:
+            view = [["", "", "", "", "", "", "", ""] for rank in range(8)]
+            for name, bits in self.bitboards.items():
+                for square in squares(bits):
+                    view[square // 8][square % 8] = name
+            self._view = view
+        return self._view
+
+    @state.setter
+    def state(self, state):
+        # Load the bitboards from a nested list of piece names
+        self.bitboards = {
+            f'{color}{piece}': 0 for color in 'wb' for piece in 'kqrbnp'
+        }
+        self.occupancy = {'w': 0, 'b': 0}
+        for rank in range(8):
+            for file in range(8):
+                name = state[rank][file]
+                if name != '':
+                    bit = 1 << (rank * 8 + file)
+                    self.bitboards[name] |= bit
+                    self.occupancy[name[0]] |= bit
+        self._load_trackers()
+
+    def copy(self):
+        '''
+        Returns an independent copy of the board, copying the bitboard and
+        occupancy dicts (their values are integers) and the history.
+        '''
+        board = self.__class__.__new__(self.__class__)
+        board.bitboards = dict(self.bitboards)
+        board.occupancy = dict(self.occupancy)
+        board.attacks = None
+        self._copy_trackers(board)
+        return board
+
+    def _rank_codes(self, rank):
+        # Piece codes of the squares of a rank, read from the state view
+        return bytes([CODES[name] for name in self.state[rank]])
+
+    def find_kings(self):
+        '''
+        Stores the locations of both kings in the king tracker, read
+        straight from the king bitboards.
+        '''
+        self.kings = {'w': None, 'b': None}
+        for color in 'wb':
+            king = self.bitboards[f'{color}k']
+            if king:
+                self.kings[color] = divmod(king.bit_length() - 1, 8)
+
+    def find_attacks(self):
+        '''
+        BitChessBoard keeps no attack maps, as attacks are found from the
+        bitboards when they are needed.
+        '''
+        self.attacks = None
+
+    def piece_on(self, square):
+        '''
+        Returns the name of the piece on a square number, or '' if the square
+        is empty.
+        '''
+        bit = 1 << square
+        for color in 'wb':
+            if self.occupancy[color] & bit:
+                for piece in 'pnbrqk':
+                    if self.bitboards[f'{color}{piece}'] & bit:
+                        return f'{color}{piece}'
+        return ''
+
+    def attacked(self, square, by):
+        '''
+        Checks whether any piece of the player by attacks the square
+        (returns True) or not (returns False).
+        '''
+        return self._attacked(square[0] * 8 + square[1], by)
+
+    def _attacked(self, square, by):
+        '''
+        Checks whether any piece of the player by attacks the square number
+        (returns True) or not (returns False).
+        '''
+        boards = self.bitboards
+        occupied = self.occupancy['w'] | self.occupancy['b']
+
+        # Enemy pawns attacking a square stand where a pawn of the other
+        # color on that square would attack
+        if by == 'w':
+            if PAWN_ATTACKS['b'][square] & boards['wp']:
+                return True
+        else:
+            if PAWN_ATTACKS['w'][square] & boards['bp']:
+                return True
+        if KNIGHT_MASKS[square] & boards[f'{by}n']:
+            return True
+        if KING_MASKS[square] & boards[f'{by}k']:
+            return True
+        queens = boards[f'{by}q']
+        if slide_attacks(square, occupied,
+                         SLIDES['b']) & (boards[f'{by}b'] | queens):
+            return True
+        if slide_attacks(square, occupied,
+                         SLIDES['r']) & (boards[f'{by}r'] | queens):
+            return True
+        return False
+
+    def in_check(self, player):
+        '''
+        Checks whether a given player is in check (returns True)
+        or not (returns False) by looking up attacks on the king's square.
+        '''
+        king = self.kings[player]
+        if player == 'w':
+            return self._attacked(king[0] * 8 + king[1], 'b')
+        return self._attacked(king[0] * 8 + king[1], 'w')
+
+    def check_info(self, player):
+        '''
+        Returns (checkers, block, pins, danger) as ChessBoard.check_info
+        does, walking out from the king with the occupancy masks and finding
+        checking knights and pawns from the masks of the king's square.
+        '''
+        if self._checks is None:
+            self._checks = {}
+        elif player in self._checks:
+            return self._checks[player]
+
+        boards = self.bitboards
+        own = self.occupancy[player]
+        king = self.kings[player][0] * 8 + self.kings[player][1]
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+        occupied = own | self.occupancy[enemy]
+        queens = boards[f'{enemy}q']
+        checkers = []
+        block = set()
+        pins = {}
+        danger = set()
+
+        # The first of the player's pieces on a ray is pinned if the next
+        # piece is an enemy slider that moves along the ray
+        rays = RAY_SQUARES[king]
+        for direction in range(8):
+            if direction < 4:
+                sliders = queens | boards[f'{enemy}r']
+            else:
+                sliders = queens | boards[f'{enemy}b']
+            ray = rays[direction]
+            pinned = None
+            for distance, square in enumerate(ray):
+                bit = 1 << square
+                if not occupied & bit:
+                    continue
+                if own & bit:
+                    if pinned is not None:
+                        break
+                    pinned = square
+                    continue
+                if sliders & bit:
+                    if pinned is None:
+                        checkers.append(square)
+                        block.update(ray[:distance + 1])
+                        behind = rays[OPPOSITE[direction]]
+                        if behind:
+                            danger.add(behind[0])
+                    else:
+                        pins[pinned] = set(ray[:distance + 1])
+                break
+
+        # Knights and pawns check from where they stand
+        for square in squares(KNIGHT_MASKS[king] & boards[f'{enemy}n']):
+            checkers.append(square)
+            block.add(square)
+        for square in squares(PAWN_ATTACKS[player][king]
+                              & boards[f'{enemy}p']):
+            checkers.append(square)
+            block.add(square)
+
+        if len(checkers) == 0:
+            block = None
+        elif len(checkers) > 1:
+            block = set()
+
+        self._checks[player] = (checkers, block, pins, danger)
+        return self._checks[player]
+
+    def _targets(self, player, piece, square):
+        '''
+        Returns the mask of squares that the player's piece on a square
+        number can move to by its move pattern, ignoring whether the move
+        leaves the king in check.
+        '''
+        own = self.occupancy[player]
+        occupied = own | self.occupancy['b' if player == 'w' else 'w']
+        if piece == 'n':
+            return KNIGHT_MASKS[square] & ~own
+        elif piece == 'k':
+            return KING_MASKS[square] & ~own
+        elif piece == 'p':
+            empty = ~occupied & FULL
+            enemy = occupied ^ own
+            bit = 1 << square
+            # Pushes by shifting a rank forward, twice from the home rank
+            if player == 'w':
+                one = (bit >> 8) & empty
+                two = ((one & RANK_MASKS[5]) >> 8) & empty
+                # The rights hold the en passant pawn's square number + 1
+                if self.rights >> 4 != 0:
+                    enemy |= 1 << ((self.rights >> 4) - 1 - 8)
+            else:
+                one = (bit << 8) & empty
+                two = ((one & RANK_MASKS[2]) << 8) & empty
+                if self.rights >> 4 != 0:
+                    enemy |= 1 << ((self.rights >> 4) - 1 + 8)
+            return one | two | (PAWN_ATTACKS[player][square] & enemy)
+        return slide_attacks(square, occupied, SLIDES[piece]) & ~own
+
+    def _legal(self, player, piece, start, end):
+        '''
+        Checks whether a move that fits the piece's move pattern keeps the
+        player out of check, from the checkers and pins found by check_info.
+        '''
+        checkers, block, pins, danger = self.check_info(player)
+        end_square = end[0] * 8 + end[1]
+
+        # A king can't move onto an attacked square, or back along the ray
+        # of a sliding piece checking it
+        if piece == 'k':
+            if player == 'w':
+                enemy = 'b'
+            else:
+                enemy = 'w'
+            if self._attacked(end_square, enemy):
+                return False
+            return end_square not in danger
+
+        # An en passant capture takes a pawn off a square the move doesn't
+        # end on, which can uncover a check along the rank, so make the
+        # move on the board, test for check, then take it back
+        if piece == 'p' and start[1] != end[1] and not (
+                (self.occupancy['w'] | self.occupancy['b'])
+                & (1 << end_square)):
+            undo = self.make_move(player, piece, start, end)
+            check = self.in_check(player)
+            self.unmake_move(undo)
+            return check == False
+
+        # Any other move must stop a check, and keep a pinned piece on its
+        # pin ray
+        if block is not None and end_square not in block:
+            return False
+        start_square = start[0] * 8 + start[1]
+        if start_square in pins and end_square not in pins[start_square]:
+            return False
+        return True
+
+    def valid_move(self, player, piece, start, end):
+        '''
+        Checks whether a specified move from start to end by piece
+        is valid (returns True) or not (returns False), using the
+        precomputed masks for the move pattern.
+        '''
+        square = start[0] * 8 + start[1]
+        if not self._targets(player, piece, square) & (1 <<
+                                                       (end[0] * 8 + end[1])):
+            return False
+        return self._legal(player, piece, start, end)
+
+    def valid_castle(self, player, side):
+        '''
+        Checks whether the player can castle on the specified side (returns
+        True) or not (returns False).
+        '''
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+        if self.rights & CASTLE_BITS[player][side] == 0:
+            return False
+        if self.in_check(player) == True:
+            return False
+
+        # Squares between rook and king must be empty
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        if occupied & CASTLE_GAPS[(player, side)]:
+            return False
+
+        # King must not pass through or land on an attacked square
+        if side == 'k':
+            path = [5, 6]
+        else:
+            path = [3, 2]
+        for file in path:
+            if self._legal(player, 'k', (rank, 4), (rank, file)) == False:
+                return False
+        return True
+
+    def _castle_rook(self, end):
+        '''
+        Returns the mask of the rook's start and end squares for a castle
+        that brings the king to end.
+        '''
+        if end[1] == 6:  # kingside
+            return (1 << (end[0] * 8 + 7)) | (1 << (end[0] * 8 + 5))
+        return (1 << (end[0] * 8)) | (1 << (end[0] * 8 + 3))  # queenside
+
+    def _hash_move(self, player, piece, start, end, promote):
+        '''
+        Toggles the moving piece (and the rook when castling) between its
+        start and end squares in the Zobrist key. Doing it twice undoes it.
+        '''
+        self.zobrist ^= ZOBRIST_PIECES[f'{player}{piece}'][start[0]][start[1]]
+        if promote is None:
+            self.zobrist ^= ZOBRIST_PIECES[f'{player}{piece}'][end[0]][end[1]]
+        else:
+            self.zobrist ^= ZOBRIST_PIECES[f'{player}{promote}'][end[0]][
+                end[1]]
+        if piece == 'k' and abs(start[1] - end[1]) == 2:
+            rook = ZOBRIST_PIECES[f'{player}r'][end[0]]
+            if end[1] == 6:  # kingside
+                self.zobrist ^= rook[7] ^ rook[5]
+            else:  # queenside
+                self.zobrist ^= rook[0] ^ rook[3]
+
+    def _move_score(self, player, piece, start, end, promote, sign):
+        '''
+        Changes the running scores for the piece moving from start to end
+        (sign 1) or back (sign -1), including a promotion and the rook of a
+        castle.
+        '''
+        moved = CODES[player + piece]
+        placed = moved
+        if promote is not None:
+            placed = CODES[player + promote]
+            self.phase += sign * (PHASES[placed] - PHASES[moved])
+        before = start[0] * 8 + start[1]
+        after = end[0] * 8 + end[1]
+        middlegame = (MIDGAME_SCORES[placed][after]
+                      - MIDGAME_SCORES[moved][before])
+        endgame = (ENDGAME_SCORES[placed][after]
+                   - ENDGAME_SCORES[moved][before])
+        if piece == 'k' and abs(start[1] - end[1]) == 2:
+            rook = CODES[player + 'r']
+            if end[1] == 6:  # kingside
+                before = end[0] * 8 + 7
+                after = end[0] * 8 + 5
+            else:  # queenside
+                before = end[0] * 8
+                after = end[0] * 8 + 3
+            middlegame += (MIDGAME_SCORES[rook][after]
+                           - MIDGAME_SCORES[rook][before])
+            endgame += (ENDGAME_SCORES[rook][after]
+                        - ENDGAME_SCORES[rook][before])
+        self.middlegame += sign * middlegame
+        self.endgame += sign * endgame
+
+    def make_move(self, player, piece, start, end, promote=None):
+        '''
+        Changes the bitboards for a move of a piece from start to end without
+        checking whether it is legal, and returns the same undo token as
+        ChessBoard.make_move.
+        '''
+        boards = self.bitboards
+        occupancy = self.occupancy
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+        from_bit = 1 << (start[0] * 8 + start[1])
+        to_bit = 1 << (end[0] * 8 + end[1])
+
+        # Find and remove the captured piece, which is beside the target
+        # square when a pawn captures en passant
+        capture_square = end
+        if piece == 'p' and start[1] != end[1] and not (occupancy[enemy]
+                                                        & to_bit):
+            capture_square = (start[0], end[1])
+        capture_bit = 1 << (capture_square[0] * 8 + capture_square[1])
+        captured = ''
+        if occupancy[enemy] & capture_bit:
+            for kind in 'pnbrqk':
+                if boards[f'{enemy}{kind}'] & capture_bit:
+                    captured = f'{enemy}{kind}'
+                    boards[captured] ^= capture_bit
+                    self.zobrist ^= ZOBRIST_PIECES[captured][
+                        capture_square[0]][capture_square[1]]
+                    self._add_score(CODES[captured], capture_square[0] * 8
+                                    + capture_square[1], -1)
+                    break
+            occupancy[enemy] ^= capture_bit
+
+        undo = (player, piece, start, end, promote, captured, capture_square,
+                self.rights)
+
+        # Move the piece, changing it when a pawn promotes
+        boards[f'{player}{piece}'] ^= from_bit
+        if promote is None:
+            boards[f'{player}{piece}'] |= to_bit
+        else:
+            boards[f'{player}{promote}'] |= to_bit
+        occupancy[player] ^= from_bit | to_bit
+        self._move_score(player, piece, start, end, promote, 1)
+
+        # Update the king tracker, and move the rook as well when castling
+        if piece == 'k':
+            self.kings[player] = end
+            if abs(start[1] - end[1]) == 2:
+                boards[f'{player}r'] ^= self._castle_rook(end)
+                occupancy[player] ^= self._castle_rook(end)
+
+        self._hash_move(player, piece, start, end, promote)
+        self._update_trackers(player, piece, start, end)
+        self._view = None
+        self._checks = None
+        return undo
+
+    def unmake_move(self, undo):
+        '''
+        Restores the bitboards from before the move that returned the undo
+        token. Moves must be unmade in the reverse order they were made.
+        '''
+        (player, piece, start, end, promote, captured, capture_square,
+         rights) = undo
+        boards = self.bitboards
+        occupancy = self.occupancy
+        from_bit = 1 << (start[0] * 8 + start[1])
+        to_bit = 1 << (end[0] * 8 + end[1])
+
+        # Take the piece back, turning a promoted piece back into a pawn
+        if promote is None:
+            boards[f'{player}{piece}'] ^= to_bit
+        else:
+            boards[f'{player}{promote}'] ^= to_bit
+        boards[f'{player}{piece}'] |= from_bit
+        occupancy[player] ^= from_bit | to_bit
+        self._move_score(player, piece, start, end, promote, -1)
+
+        # Restore the captured piece
+        if captured != '':
+            capture_bit = 1 << (capture_square[0] * 8 + capture_square[1])
+            boards[captured] |= capture_bit
+            occupancy[captured[0]] |= capture_bit
+            self.zobrist ^= ZOBRIST_PIECES[captured][capture_square[0]][
+                capture_square[1]]
+            self._add_score(CODES[captured], capture_square[0] * 8
+                            + capture_square[1], 1)
+
+        # Put the king tracker back, and the rook as well when castling
+        if piece == 'k':
+            self.kings[player] = start
+            if abs(start[1] - end[1]) == 2:
+                boards[f'{player}r'] ^= self._castle_rook(end)
+                occupancy[player] ^= self._castle_rook(end)
+
+        self._hash_move(player, piece, start, end, promote)
+        self._restore_trackers(player, rights)
+        self._view = None
+        self._checks = None
+
+    def generate_legal_moves(self, player):
+        '''
+        Yields every legal move for the player as a tuple
+        (piece, start, end, promote), in the same form as
+        ChessBoard.generate_legal_moves. Targets come from the precomputed
+        masks, and pawn pushes for all pawns at once from shifting the pawn
+        bitboard.
+        '''
+        boards = self.bitboards
+        for piece in 'nbrqk':
+            for square in squares(boards[f'{player}{piece}']):
+                start = divmod(square, 8)
+                for target in squares(self._targets(player, piece, square)):
+                    end = divmod(target, 8)
+                    if self._legal(player, piece, start, end):
+                        yield (piece, start, end, None)
+
+        # Pawn pushes, shifting every pawn a rank forward at once. back is
+        # the distance from the target square back to the pawn
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        empty = ~occupied & FULL
+        pawns = boards[f'{player}p']
+        if player == 'w':
+            one = (pawns >> 8) & empty
+            two = ((one & RANK_MASKS[5]) >> 8) & empty
+            back = 8
+            last = 0
+        else:
+            one = (pawns << 8) & empty
+            two = ((one & RANK_MASKS[2]) << 8) & empty
+            back = -8
+            last = 7
+        pushes = [(target + back, target) for target in squares(one)]
+        pushes += [(target + 2 * back, target) for target in squares(two)]
+
+        # Pawn captures, including en passant
+        enemy = self.occupancy['b' if player == 'w' else 'w']
+        if self.rights >> 4 != 0:
+            enemy |= 1 << ((self.rights >> 4) - 1 - back)
+        for square in squares(pawns):
+            for target in squares(PAWN_ATTACKS[player][square] & enemy):
+                pushes.append((square, target))
+
+        for square, target in pushes:
+            start = divmod(square, 8)
+            end = divmod(target, 8)
+            if self._legal(player, 'p', start, end):
+                if end[0] == last:
+                    for promote in ['q', 'r', 'b', 'n']:
+                        yield ('p', start, end, promote)
+                else:
+                    yield ('p', start, end, None)
+
+        # Castling
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+        for side, file in [('k', 6), ('q', 2)]:
+            if self.valid_castle(player, side) == True:
+                yield ('k', (rank, 4), (rank, file), None)
+
+    def generate_captures(self, player):
+        '''
+        Yields the legal captures, including en passant, and promotions for
+        the player, like ChessBoard.generate_captures, masking the targets
+        with the enemy pieces.
+        '''
+        boards = self.bitboards
+        enemy = self.occupancy['b' if player == 'w' else 'w']
+        for piece in 'nbrqk':
+            for square in squares(boards[f'{player}{piece}']):
+                start = divmod(square, 8)
+                for target in squares(
+                        self._targets(player, piece, square) & enemy):
+                    end = divmod(target, 8)
+                    if self._legal(player, piece, start, end):
+                        yield (piece, start, end, None)
+
+        if player == 'w':
+            last = 0
+        else:
+            last = 7
+        for square in squares(boards[f'{player}p']):
+            start = divmod(square, 8)
+            for target in squares(self._targets(player, 'p', square)):
+                end = divmod(target, 8)
+                # Pawn pushes only count when they promote
+                if start[1] == end[1] and end[0] != last:
+                    continue
+                if self._legal(player, 'p', start, end):
+                    if end[0] == last:
+                        for promote in ['q', 'r', 'b', 'n']:
+                            yield ('p', start, end, promote)
+                    else:
+                        yield ('p', start, end, None)
+
+    def generate_packed_moves(self, player, buffer):
+        '''
+        Writes every legal move for the player into buffer as 16-bit packed
+        moves, like ChessBoard.generate_packed_moves, and returns how many
+        it wrote.
+        '''
+        count = 0
+        for move in self.generate_legal_moves(player):
+            buffer[count] = self.pack_move(*move)
+            count += 1
+        return count
+
+
+if __name__ == "__main__":
+    main(BitChessBoard, ansi='--ansi' in sys.argv[1:])
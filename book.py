@@ -0,0 +1,256 @@
+import argparse
+import fileinput
+import json
+import mmap
+import random
+import struct
+import sys
+
+from chess32 import ChessBoard, main as play
+from replay import read_games, parse_san, parse_uci, play_move
+from engine import move_name
+
+# Each book entry is a position key, a move packed into 16 bits (see
+# chess32.encode_move) and a weight, big endian so that a file sorted by key
+# can be searched directly
+ENTRY = struct.Struct('>QHH')
+
+# Points a move earns towards its weight for each game it was played in, by
+# how the game went for the player who made it. Moves only ever played by
+# the losing side are left out of the book
+POINTS = {'win': 2, 'draw': 1, 'loss': 0}
+
+
+class OpeningBook():
+    '''
+    Opening book stored as a file of fixed width entries (position key, move,
+    weight) sorted by key. The file is memory mapped and searched by binary
+    search, so opening it reads nothing and a lookup only touches the pages
+    it needs, however large the book is. Methods include:
+
+    entries(key) : Returns a list of (move code, weight) for the position key
+
+    moves(board) : Returns the book moves for the board's position as a list
+                   of (move, weight), most played first
+
+    choose(board) : Returns a book move picked at random by weight, or None
+
+    close() : Closes the book file
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.size = ENTRY.size
+        self.count = 0
+        self.map = None
+        length = self.file.seek(0, 2)
+        # An empty file can't be mapped, and has no entries anyway
+        if length > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            self.count = length // self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *error):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the memory map and the book file.
+        '''
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def _key(self, index):
+        # Position key of the entry at index
+        return ENTRY.unpack_from(self.map, index * self.size)[0]
+
+    def entries(self, key):
+        '''
+        Returns a list of (move code, weight) for every entry of the position
+        key, found by binary search for its first entry.
+        '''
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self.count:
+            entry_key, code, weight = ENTRY.unpack_from(self.map,
+                                                        low * self.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            low += 1
+        return found
+
+    def moves(self, board):
+        '''
+        Returns the book moves for the board's position as a list of
+        (move, weight), with move a tuple (piece, start, end, promote),
+        sorted from the highest weight down. Moves that aren't legal in the
+        position (from a key collision) are left out.
+        '''
+        player = board.turn
+        found = []
+        for code, weight in self.entries(board.key()):
+            move = board.unpack_move(code)
+            piece, start, end, promote = move
+            if piece == '' or board.state[start[0]][start[1]][0] != player:
+                continue
+            # Castling is written as the king moving two squares
+            if piece == 'k' and abs(end[1] - start[1]) == 2:
+                if end[1] == 6:
+                    legal = board.valid_castle(player, 'k')
+                else:
+                    legal = board.valid_castle(player, 'q')
+            else:
+                legal = board.valid_move(player, piece, start, end)
+            if legal == True:
+                found.append((move, weight))
+        found.sort(key=lambda entry: entry[1], reverse=True)
+        return found
+
+    def choose(self, board, rng=random):
+        '''
+        Returns one of the book moves for the board's position picked at
+        random in proportion to its weight, or None if the position isn't in
+        the book.
+        '''
+        found = self.moves(board)
+        if not found:
+            return None
+        moves = [entry[0] for entry in found]
+        weights = [entry[1] for entry in found]
+        return rng.choices(moves, weights)[0]
+
+
+def build(games, path, plies=20, notation='san', min_weight=1):
+    '''
+    Compiles an opening book from a stream of games (from replay.read_pgn or
+    read_uci) and writes it to path. The first plies moves of every game are
+    replayed from the starting position; each adds to the weight of its
+    move in the position it was played from, according to POINTS and the
+    game's result. A game stops counting at its first illegal move. Entries
+    with less than min_weight are left out. Returns the number of entries.
+    '''
+    if notation == 'san':
+        parse = parse_san
+    else:
+        parse = parse_uci
+
+    # Total weight of each (position key, move code)
+    weights = {}
+    for game in games:
+        # Only games from the standard starting position belong in the book
+        if 'FEN' in game['tags']:
+            continue
+        board = ChessBoard()
+        player = 'w'
+        for text in game['moves'][:plies]:
+            move = parse(board, player, text)
+            if move == "Illegal Move":
+                break
+            key = board.key()
+            code = board.pack_move(*move)
+            if play_move(board, player, move) == "Illegal Move":
+                break
+
+            # Points for the player who made the move
+            if game['result'] == '1/2-1/2' or game['result'] == '*':
+                outcome = 'draw'
+            elif (game['result'] == '1-0') == (player == 'w'):
+                outcome = 'win'
+            else:
+                outcome = 'loss'
+            entry = (key, code)
+            weights[entry] = weights.get(entry, 0) + POINTS[outcome]
+
+            if player == 'w':
+                player = 'b'
+            else:
+                player = 'w'
+
+    count = 0
+    with open(path, 'wb') as out:
+        for (key, code), weight in sorted(weights.items()):
+            if weight < min_weight:
+                continue
+            # Weights are capped at the largest the entry can hold
+            out.write(ENTRY.pack(key, code, min(weight, 65535)))
+            count += 1
+    return count
+
+
+def main(argv=None):
+    '''
+    Command line entry point. 'build' compiles a book from PGN or UCI files,
+    'show' prints the book moves for a position as JSON, and 'play' starts a
+    console game that shows the book moves on every turn (optionally against
+    the engine, which plays from the book while it can).
+    '''
+    parser = argparse.ArgumentParser(description='Opening book tools.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser(
+        'build', help='compile a book from recorded games')
+    build_parser.add_argument('files', nargs='*',
+                              help='PGN or UCI files to read (default stdin)')
+    build_parser.add_argument('-o', '--output', default='book.bin',
+                              help='book file to write (default book.bin)')
+    build_parser.add_argument('--format', choices=['pgn', 'uci'],
+                              default='pgn', help='input format (default pgn)')
+    build_parser.add_argument('--plies', type=int, default=20,
+                              help='moves of each game to add (default 20)')
+    build_parser.add_argument('--min-weight', type=int, default=1,
+                              help='leave out entries below this weight')
+
+    show_parser = commands.add_parser(
+        'show', help='print the book moves for a position')
+    show_parser.add_argument('book', help='book file')
+    show_parser.add_argument('--fen', help='position (default start)')
+
+    play_parser = commands.add_parser(
+        'play', help='play a game showing the book moves')
+    play_parser.add_argument('book', help='book file')
+    play_parser.add_argument('--computer', choices=['white', 'black'],
+                             help='colour for the engine to play')
+    play_parser.add_argument('--time', type=int, default=1000,
+                             help='engine time per move in milliseconds')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        notation = 'san' if args.format == 'pgn' else 'uci'
+        with fileinput.input(args.files) as lines:
+            count = build(read_games(lines, notation), args.output,
+                          args.plies, notation, args.min_weight)
+        print(json.dumps({'book': args.output, 'entries': count}))
+    elif args.command == 'show':
+        if args.fen is None:
+            board = ChessBoard()
+        else:
+            board = ChessBoard.from_fen(args.fen)
+        with OpeningBook(args.book) as book:
+            found = book.moves(board)
+        print(json.dumps([{
+            'move': move_name(move),
+            'weight': weight
+        } for move, weight in found]))
+    else:
+        computer = None
+        if args.computer is not None:
+            computer = args.computer[0]
+        play(ChessBoard, computer, args.time, book=args.book)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
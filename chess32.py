@@ -1,4 +1,277 @@
-import copy
+import random
+import sys
+from array import array
+
+# Directions that the sliding pieces move along, as (rank, file) steps
+SLIDES = {
+    'r': ((-1, 0), (1, 0), (0, -1), (0, 1)),
+    'b': ((-1, -1), (-1, 1), (1, -1), (1, 1)),
+    'q': ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1),
+          (1, 1))
+}
+
+# Jumps that knights and kings can make, as (rank, file) steps
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (-1, 2), (1, -2),
+                (-1, -2))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0),
+              (1, 1))
+
+
+def _targets(square, steps):
+    # Squares on the board reached from square (rank * 8 + file) by steps
+    rank, file = divmod(square, 8)
+    return tuple((rank + step[0]) * 8 + file + step[1] for step in steps
+                 if 0 <= rank + step[0] < 8 and 0 <= file + step[1] < 8)
+
+
+# Lookup tables built once, indexed by square number (rank * 8 + file): the
+# square as (rank, file), the squares a knight or king jumps to, and the
+# squares each color's pawns attack (diagonally forward, towards rank 0 for
+# white)
+COORDINATES = [divmod(square, 8) for square in range(64)]
+KNIGHT_TARGETS = [_targets(square, KNIGHT_STEPS) for square in range(64)]
+KING_TARGETS = [_targets(square, KING_STEPS) for square in range(64)]
+PAWN_TARGETS = {
+    'w': [_targets(square, ((-1, -1), (-1, 1))) for square in range(64)],
+    'b': [_targets(square, ((1, -1), (1, 1))) for square in range(64)]
+}
+
+# Squares along each of the eight directions of SLIDES['q'] from every
+# square, nearest first: RAY_SQUARES[square][direction]. Directions 0 to 3
+# run along ranks and files and 4 to 7 along diagonals, and the opposite of
+# each direction is OPPOSITE[direction]
+RAY_SQUARES = [[_targets(square, [(step[0] * distance, step[1] * distance)
+                                  for distance in range(1, 8)])
+                for step in SLIDES['q']] for square in range(64)]
+OPPOSITE = [SLIDES['q'].index((-step[0], -step[1])) for step in SLIDES['q']]
+
+# Directions each sliding piece moves in
+SLIDE_DIRECTIONS = {'q': range(8), 'r': range(4), 'b': range(4, 8)}
+
+# Direction of the ray from one square to another, or None when they are
+# not on a shared rank, file or diagonal: RAY_DIRECTIONS[start][end]
+RAY_DIRECTIONS = [[None] * 64 for square in range(64)]
+for _square in range(64):
+    for _direction in range(8):
+        for _end in RAY_SQUARES[_square][_direction]:
+            RAY_DIRECTIONS[_square][_end] = _direction
+
+# Random 64-bit numbers for Zobrist keys of positions: one for each piece on
+# each square, one for each combination of castling rights, one for each en
+# passant file and one for black to move. The generator is seeded so that a
+# position gets the same key in every run
+_zobrist_random = random.Random(32)
+ZOBRIST_PIECES = {
+    f'{color}{piece}': [[_zobrist_random.getrandbits(64) for file in range(8)]
+                        for rank in range(8)]
+    for color in 'wb' for piece in 'kqrbnp'
+}
+_castle_numbers = [_zobrist_random.getrandbits(64) for right in range(4)]
+ZOBRIST_CASTLE = [0] * 16
+for _index in range(16):
+    for _right in range(4):
+        if _index & (1 << _right):
+            ZOBRIST_CASTLE[_index] ^= _castle_numbers[_right]
+ZOBRIST_ENPASS = [_zobrist_random.getrandbits(64) for file in range(8)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+# Integer codes of the pieces stored in the board's squares: 0 for an empty
+# square, 1 to 6 for white's pieces and 9 to 14 for black's. NAMES turns a
+# code back into the piece's name and CODES a name into its code
+NAMES = ['', 'wp', 'wn', 'wb', 'wr', 'wq', 'wk', '', '', 'bp', 'bn', 'bb',
+         'br', 'bq', 'bk', '']
+CODES = {name: code for code, name in enumerate(NAMES) if name != ''}
+CODES[''] = 0
+
+# Zobrist numbers by piece code and square number (rank * 8 + file)
+ZOBRIST_SQUARES = [[ZOBRIST_PIECES[name][square // 8][square % 8]
+                    for square in range(64)] if name != '' else None
+                   for name in NAMES]
+
+# Bits of the castling rights in the board's rights number. The en passant
+# pawn's square number plus one is stored above them, 0 when there is none
+CASTLE_BITS = {'w': {'k': 1, 'q': 2}, 'b': {'k': 4, 'q': 8}}
+
+# Castling right lost when a piece leaves or lands on each rook home square
+ROOK_HOMES = {56: 2, 63: 1, 0: 8, 7: 4}
+
+# Where each player's counts start in the attack map
+SIDES = {'w': 0, 'b': 64}
+
+# Moves can be packed into 16-bit integers: the start square number in the
+# low 6 bits, the end square number in the next 6 and a flag in the top 4.
+# Flags 1 to 4 promote a pawn to PROMOTIONS[flag]; the others mark the
+# special moves
+PROMOTIONS = ' nbrq'
+DOUBLE_PUSH = 5
+CASTLE = 6
+EN_PASSANT = 7
+
+# Piece values in centipawns for the evaluation. The king is never
+# captured, so it has no material value
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# Bonuses in centipawns for a piece standing on each square, from white's
+# side with a8 first (the same order as the square numbers). Black's pieces
+# use the square mirrored across the middle of the board. The king has one
+# table for the middlegame, where it should hide behind its pawns, and one
+# for the endgame, where it should come to the centre
+PIECE_SQUARES = {
+    'p': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'n': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'b': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'r': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'k': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20]
+}
+KING_ENDGAME_SQUARES = [-50, -40, -30, -20, -20, -30, -40, -50,
+                        -30, -20, -10, 0, 0, -10, -20, -30,
+                        -30, -10, 20, 30, 30, 20, -10, -30,
+                        -30, -10, 30, 40, 40, 30, -10, -30,
+                        -30, -10, 30, 40, 40, 30, -10, -30,
+                        -30, -10, 20, 30, 30, 20, -10, -30,
+                        -30, -30, 0, 0, 0, 0, -30, -30,
+                        -50, -30, -30, -30, -30, -30, -30, -50]
+
+# How much each piece counts towards the game phase. The phase is
+# TOTAL_PHASE with all the pieces on the board (the middlegame) and falls to
+# 0 as they are traded off (the endgame)
+PHASE_WEIGHTS = {'p': 0, 'n': 1, 'b': 1, 'r': 2, 'q': 4, 'k': 0}
+TOTAL_PHASE = 24
+
+
+def _square_scores(king_squares):
+    # Value plus square bonus of each piece code on each square, positive
+    # for white's pieces and negative for black's
+    scores = []
+    for name in NAMES:
+        if name == '':
+            scores.append(None)
+            continue
+        table = PIECE_SQUARES[name[1]]
+        if name[1] == 'k':
+            table = king_squares
+        if name[0] == 'w':
+            scores.append([PIECE_VALUES[name[1]] + table[square]
+                           for square in range(64)])
+        else:
+            scores.append([-PIECE_VALUES[name[1]] - table[square ^ 56]
+                           for square in range(64)])
+    return scores
+
+
+# Scores by piece code and square number in the middlegame and the endgame,
+# and the phase weight of each piece code
+MIDGAME_SCORES = _square_scores(PIECE_SQUARES['k'])
+ENDGAME_SCORES = _square_scores(KING_ENDGAME_SQUARES)
+PHASES = [PHASE_WEIGHTS[name[1]] if name != '' else 0 for name in NAMES]
+
+# Set to True to check every evaluate() against a full recount of the
+# scores, which is slow but finds a running total that went wrong
+DEBUG_EVALUATION = False
+
+# Most legal moves there can be in a position (218 is the known maximum),
+# which is the size of a move buffer
+MAX_MOVES = 256
+
+
+def encode_move(start, end, flag=0):
+    '''
+    Returns the 16-bit packed move from start to end (square numbers) with
+    the flag.
+    '''
+    return start | (end << 6) | (flag << 12)
+
+
+def decode_move(code):
+    '''
+    Returns the start square number, end square number and flag of a 16-bit
+    packed move.
+    '''
+    return code & 63, (code >> 6) & 63, code >> 12
+
+
+def move_buffer():
+    '''
+    Returns a new buffer for ChessBoard.generate_packed_moves: an array of
+    MAX_MOVES unsigned 16-bit integers, allocated once and reused for every
+    position.
+    '''
+    return array('H', bytes(2 * MAX_MOVES))
+
+# Unicode glyph printed for each piece
+PIECE_GLYPHS = {
+    'bk': '\u2654',
+    'bq': '\u2655',
+    'br': '\u2656',
+    'bb': '\u2657',
+    'bn': '\u2658',
+    'bp': '\u2659',
+    'wk': '\u265a',
+    'wq': '\u265b',
+    'wr': '\u265c',
+    'wb': '\u265d',
+    'wn': '\u265e',
+    'wp': '\u265f'
+}
+
+# Four characters printed for each piece code on a square, first on the
+# hatched squares (where rank + file is even) then on the blank ones
+SQUARE_GLYPHS = [
+    [f"#{PIECE_GLYPHS[name]} #" if name != '' else '#' * 4 for name in NAMES],
+    [f" {PIECE_GLYPHS[name]}  " if name != '' else ' ' * 4 for name in NAMES]
+]
+
+# Hatching printed above and below the squares of even and odd ranks, and
+# the file labels printed under the board
+RANK_EDGES = ['   ' + (("#" * 4 + " " * 4) * 4),
+              '   ' + (((" " * 4) + ("#") * 4) * 4)]
+FILE_LABELS = '\n    a   b   c   d   e   f   g   h'
+
+# Lines taken by a printed board: three per rank, a blank line and the labels
+BOARD_LINES = 26
 
 
 class ChessBoard():
@@ -10,8 +283,28 @@ class ChessBoard():
     __init__() : Initializes variables that store the board state
     __str__() : Returns a string that when printed resembles a chess board
     
+    find_kings() : Stores the locations of both kings in the king tracker
+
+    find_attacks() : Counts the attackers of every square for both players
+
+    attacked(square, by) : Returns True or False depending on whether the
+                           player by attacks the square
+
+    find_key() : Computes the Zobrist key of the position from scratch
+
+    from_fen(fen) : Class method that returns a new board holding the
+                    position in a FEN string
+
+    to_fen() : Returns the position as a FEN string
+
+    key() : Returns the Zobrist key of the position
+
     in_check(player) : Returns True or False depending on whether the player
                         is in check
+
+    check_info(player) : Returns the pieces checking the player's king, the
+                         player's pinned pieces with the squares they may
+                         move to, and the squares the king may not step to
                         
     valid_move(player, piece, start, end) : Returns True or False depending on
                                             whether a move of the piece from
@@ -23,17 +316,76 @@ class ChessBoard():
                                         returns None. If the move is illegal,
                                         it returns the string "Illegal Move"
                                         
+    valid_castle(player, side) : Returns True or False depending on whether
+                                 the player can castle on the specified side
+
     castle(player, side) : If a castle by a player on the specified side is
                             legal, it edits the board state to reflect this
                             move and returns None. If it is illegal, it
                             returns the string "Illegal Move"
-                            
+
+    generate_legal_moves(player) : Yields every legal move of the player as
+                                   a tuple (piece, start, end, promote)
+
+    generate_captures(player) : Yields only the legal captures and
+                                promotions of the player
+
+    generate_packed_moves(player, buffer) : Writes every legal move of the
+                                            player into a move buffer as a
+                                            16-bit packed move and returns
+                                            how many there are
+
+    pack_move(piece, start, end, promote) : Returns a move packed into 16 bits
+
+    unpack_move(code) : Returns the tuple (piece, start, end, promote) of a
+                        packed move
+
+    find_scores() : Adds up the material and square scores from scratch
+
+    evaluate(player) : Returns the score of the position in centipawns for
+                       the player, from the running scores
+
+    undo() : Takes back the last move made with move or castle
+
+    redo() : Plays again the last move taken back
+
+    goto(ply) : Takes back or plays again moves until ply moves have been
+                made
+
     stalemate(player) : Returns True or False depending on whether the player
                         is stalemated
+
+    copy() : Returns an independent copy of the board
     '''
+    # Boards are kept in bulk by servers and caches, so they store only these
+    # attributes, without a per-board dict
+    __slots__ = ('squares', 'rights', 'turn', 'kings', 'attacks', 'zobrist',
+                 'middlegame', 'endgame', 'phase', 'history', 'ply', '_view',
+                 '_ranks', '_checks')
+
     def __init__(self):
-        # Store state of the board as nested list, with a square being indexed
-        # first by its rank (row) then by its file (column)
+        self._view = None
+        self._ranks = None
+        self._checks = None
+
+        # Keep track of whether castling is legal for each color, on the
+        # king's side and queen's side (have the king and rooks been moved or
+        # not), and of whether en passant is possible for some turn with the
+        # location of the vulnerable piece, packed into one number (see
+        # CASTLE_BITS). Read and written as enpass, w_castle and b_castle.
+        # Gets changed on every move by make_move
+        self.rights = 15
+
+        # Keep track of whose turn it is. Gets changed to the opponent of
+        # the player that moves by make_move
+        self.turn = 'w'
+
+        # Store the board as a flat bytearray of piece codes (see NAMES),
+        # with the square at (rank, file) at index rank * 8 + file. The state
+        # property is a view of it as a nested list of piece names, indexed
+        # first by its rank (row) then by its file (column). Assigning the
+        # state also finds the kings, the attack map, the Zobrist key and the
+        # scores of the new position (see _load_trackers)
         self.state = [["br", "bn", "bb", "bq", "bk", "bb", "bn", "br"],
                       ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
                       ["", "", "", "", "", "", "", ""],
@@ -43,252 +395,613 @@ class ChessBoard():
                       ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
                       ["wr", "wn", "wb", "wq", "wk", "wb", "wn", "wr"]]
 
-        # Keep track of whether en passant is possible for some turn
-        # and record the location of the vulnerable piece.
-        # Gets reset when a move is made
-        self.enpass = [False, (0, 0)]
+        # Keep a history of the moves made with move and castle, packed into
+        # one 8-byte integer per ply (see _record), and how many of them
+        # have been made. Moves after ply were taken back and can be played
+        # again. Gets changed by move, castle, undo, redo and goto
+        self.history = None
+        self.ply = 0
 
-        # Keep track of whether castling is legal for each color, on
-        # the king's side and queen's side. Have the king and
-        # rooks been moved or not. Gets changed when rooks and kings
-        # make first move by move method
-        self.w_castle = {'k': True, 'q': True}
-        self.b_castle = {'k': True, 'q': True}
+    def find_kings(self):
+        '''
+        Searches the board for both kings and stores their locations in the
+        king tracker. Only needed after the board state is replaced as a
+        whole; moves keep the tracker up to date.
+        '''
+        self.kings = {'w': None, 'b': None}
+        for color in 'wb':
+            square = self.squares.find(CODES[f'{color}k'])
+            if square != -1:
+                self.kings[color] = divmod(square, 8)
 
-    def __str__(self):
-        # Conversion to unicode for each chess piece
-        piece_uni = {
-            'bk': '\u2654',
-            'bq': '\u2655',
-            'br': '\u2656',
-            'bb': '\u2657',
-            'bn': '\u2658',
-            'bp': '\u2659',
-            'wk': '\u265a',
-            'wq': '\u265b',
-            'wr': '\u265c',
-            'wb': '\u265d',
-            'wn': '\u265e',
-            'wp': '\u265f'
-        }
+    def find_attacks(self):
+        '''
+        Counts how many pieces of each player attack every square and stores
+        the counts in the attack map. Only needed after the board state is
+        replaced as a whole; moves keep the map up to date.
+        '''
+        # One count per square for white, then one per square for black
+        self.attacks = bytearray(128)
+        for square in range(64):
+            if self.squares[square] != 0:
+                self._add_attacks(self.squares[square], square, 1)
+
+    def _add_attacks(self, code, square, count):
+        '''
+        Adds count to the attack map entry of every square attacked by the
+        piece with code standing on square (a square number). Sliding pieces
+        attack up to and including the first occupied square on each ray.
+        '''
+        attacks = self.attacks
+        squares = self.squares
+        name = NAMES[code]
+        side = SIDES[name[0]]
+        piece = name[1]
+        if piece in ['q', 'r', 'b']:  # sliding pieces
+            rays = RAY_SQUARES[square]
+            for direction in SLIDE_DIRECTIONS[piece]:
+                for target in rays[direction]:
+                    attacks[side + target] += count
+                    if squares[target] != 0:
+                        break
+        else:  # jumping pieces, and pawns diagonally forward
+            if piece == 'n':
+                targets = KNIGHT_TARGETS[square]
+            elif piece == 'k':
+                targets = KING_TARGETS[square]
+            else:
+                targets = PAWN_TARGETS[name[0]][square]
+            for target in targets:
+                attacks[side + target] += count
 
-        board = ""
-        # Add each rank to the print statement at a time
+    def _place(self, square, code):
+        '''
+        Puts the piece with code on square (a square number; code 0 empties
+        it) and updates the attack map, the Zobrist key and the running
+        scores to match. Used by
+        make_move and unmake_move for every change to the board state.
+        '''
+        squares = self.squares
+        old = squares[square]
+        if old == code:
+            return
+        if old != 0:
+            self._add_attacks(old, square, -1)
+            self.zobrist ^= ZOBRIST_SQUARES[old][square]
+            self.middlegame -= MIDGAME_SCORES[old][square]
+            self.endgame -= ENDGAME_SCORES[old][square]
+            self.phase -= PHASES[old]
+
+        # When the square is emptied or filled, sliding pieces aiming at it
+        # now see past it or stop at it
+        if (old == 0) != (code == 0):
+            if code == 0:
+                count = 1
+            else:
+                count = -1
+            rays = RAY_SQUARES[square]
+            for direction in range(8):
+                # Find the first piece behind the square on this ray
+                slider = ''
+                for behind in rays[OPPOSITE[direction]]:
+                    if squares[behind] != 0:
+                        slider = NAMES[squares[behind]]
+                        break
+                if slider == '':
+                    continue
+                # Rooks slide along ranks and files, bishops along diagonals
+                if direction < 4:
+                    if slider[1] not in ['q', 'r']:
+                        continue
+                elif slider[1] not in ['q', 'b']:
+                    continue
+                # Change its attacks beyond the square, up to the next piece
+                side = SIDES[slider[0]]
+                for target in rays[direction]:
+                    self.attacks[side + target] += count
+                    if squares[target] != 0:
+                        break
+
+        squares[square] = code
+        self._view = None
+        if code != 0:
+            self._add_attacks(code, square, 1)
+            self.zobrist ^= ZOBRIST_SQUARES[code][square]
+            self.middlegame += MIDGAME_SCORES[code][square]
+            self.endgame += ENDGAME_SCORES[code][square]
+            self.phase += PHASES[code]
+
+    def find_key(self):
+        '''
+        Computes the Zobrist key of the position from scratch and stores it.
+        Only needed after the board state is replaced as a whole; moves keep
+        the key up to date.
+        '''
+        key = 0
         for rank in range(8):
-            # Even ranks start with a white square on
-            # the left (where the first rank is even)
-            if rank % 2 == 0:
-                board += '   ' + (("#" * 4 + " " * 4) * 4) + '\n'
-
-                # Add labels
-                board += f'{8 - rank}  '
-
-                # Add each square at a time
-                for file in range(8):
-                    # If square empty, add empty spaces
-                    if self.state[rank][file] == '':
-                        if file % 2 == 0:
-                            board += '#' * 4
-                        else:
-                            board += ' ' * 4
-                    # If square occupied, add the unicode value for a piece
-                    # in the print statement
-                    else:
-                        if file % 2 == 0:
-                            board += f"#{piece_uni[self.state[rank][file]]} #"
-                        else:
-                            board += f" {piece_uni[self.state[rank][file]]}  "
-                board += '\n'
-                board += '   ' + (("#" * 4 + " " * 4) * 4) + '\n'
-            # Same for odd ranks, just switch the hatching and the blank spaces
+            for file in range(8):
+                if self.state[rank][file] != '':
+                    key ^= ZOBRIST_PIECES[self.state[rank][file]][rank][file]
+        self.zobrist = key ^ self._tracker_key()
+
+    def find_scores(self):
+        '''
+        Adds up the material and square scores of every piece for the
+        middlegame and the endgame, and the game phase, from scratch. Only
+        needed after the board state is replaced as a whole; moves keep the
+        totals up to date.
+        '''
+        self.middlegame = 0
+        self.endgame = 0
+        self.phase = 0
+        for rank in range(8):
+            for file in range(8):
+                name = self.state[rank][file]
+                if name != '':
+                    self._add_score(CODES[name], rank * 8 + file, 1)
+
+    def _add_score(self, code, square, sign):
+        # Add (sign 1) or take away (sign -1) the scores of a piece code on
+        # a square number
+        self.middlegame += sign * MIDGAME_SCORES[code][square]
+        self.endgame += sign * ENDGAME_SCORES[code][square]
+        self.phase += sign * PHASES[code]
+
+    def evaluate(self, player=None):
+        '''
+        Returns the score of the position in centipawns from the point of
+        view of the player (the side to move by default): material and
+        square bonuses, blended between the middlegame and endgame totals
+        by how many pieces are left. Takes constant time, as the totals are
+        kept up to date by every move.
+        '''
+        if DEBUG_EVALUATION == True:
+            totals = (self.middlegame, self.endgame, self.phase)
+            self.find_scores()
+            if totals != (self.middlegame, self.endgame, self.phase):
+                raise RuntimeError(
+                    f'running scores {totals} differ from the recount '
+                    f'{(self.middlegame, self.endgame, self.phase)}')
+
+        if player is None:
+            player = self.turn
+        # Promotions can take the phase past its starting value
+        phase = min(self.phase, TOTAL_PHASE)
+        score = self.middlegame * phase + self.endgame * (TOTAL_PHASE - phase)
+        # Round towards zero, so both players get the same score
+        score = int(score / TOTAL_PHASE)
+        if player == 'w':
+            return score
+        else:
+            return -score
+
+    @property
+    def state(self):
+        '''
+        The board as a nested list of piece names ('' for an empty square),
+        indexed first by rank then by file. It is a view built from the
+        squares when first read after the board changes, so editing it does
+        not change the board; assigning a whole nested list loads a position.
+        '''
+        if self._view is None:
+            squares = self.squares
+            self._view = [[NAMES[code]
+                           for code in squares[rank * 8:rank * 8 + 8]]
+                          for rank in range(8)]
+        return self._view
+
+    @state.setter
+    def state(self, state):
+        self.squares = bytearray(
+            CODES[name] for rank in state for name in rank)
+        self._load_trackers()
+
+    def _load_trackers(self):
+        '''
+        Rebuilds everything worked out from the pieces after a whole new
+        position is loaded into the board. Used by the state setter.
+        '''
+        self._view = None
+        self._ranks = None
+        self._checks = None
+
+        # Keep track of where each king is as (rank, file), so checking for
+        # check can start at the king without searching the board. Gets
+        # changed when a king moves by make_move
+        self.find_kings()
+
+        # Keep count of how many pieces of each player attack every square,
+        # indexed like the squares from SIDES[player], so checking whether a
+        # square is attacked is a lookup. Gets changed on every move by
+        # make_move
+        self.find_attacks()
+
+        # Keep a Zobrist key of the position (pieces, side to move, castling
+        # and en passant) that identifies it in a single integer. Gets
+        # changed on every move by make_move
+        self.find_key()
+
+        # Keep running totals of the material and square scores of the
+        # position in the middlegame and the endgame (white's minus black's)
+        # and of the game phase, so evaluating it is a few multiplications.
+        # Gets changed on every move by make_move
+        self.find_scores()
+
+        # Moves made before can't be taken back in a new position
+        self.history = None
+        self.ply = 0
+
+    @property
+    def enpass(self):
+        '''
+        [True, (rank, file)] of the pawn that can be taken en passant on this
+        turn, or [False, (0, 0)], unpacked from the rights number. Assigning a
+        list in the same form packs it back. A pawn is only recorded when a
+        pawn of the side to move stands beside it to take it, so that
+        positions that only differ by an en passant capture nobody can make
+        are the same position, with the same key.
+        '''
+        square = self.rights >> 4
+        if square == 0:
+            return [False, (0, 0)]
+        return [True, divmod(square - 1, 8)]
+
+    @enpass.setter
+    def enpass(self, enpass):
+        rights = self.rights & 15
+        if enpass[0] == True:
+            rights |= self._en_passant_rights(
+                enpass[1][0] * 8 + enpass[1][1], self.turn)
+        self._set_rights(rights)
+
+    def _en_passant_rights(self, pawn, player):
+        # The en passant part of the rights number for a pawn on the square
+        # number that just moved two squares, or 0 if no pawn of the player
+        # stands beside it to take it
+        file = pawn % 8
+        for side in [file - 1, file + 1]:
+            if 0 <= side < 8:
+                if self.piece_on(pawn - file + side) == f'{player}p':
+                    return (pawn + 1) << 4
+        return 0
+
+    def _castle_rights(self, player):
+        # Castling rights of the player as a new dict
+        bits = CASTLE_BITS[player]
+        return {
+            'k': self.rights & bits['k'] != 0,
+            'q': self.rights & bits['q'] != 0
+        }
+
+    def _set_castle_rights(self, player, rights):
+        # Pack a dict of castling rights for the player into the rights number
+        packed = self.rights
+        for side in ['k', 'q']:
+            if rights[side] == True:
+                packed |= CASTLE_BITS[player][side]
             else:
-                board += "   " + (((" " * 4) + ("#") * 4) * 4) + '\n'
+                packed &= ~CASTLE_BITS[player][side]
+        self._set_rights(packed)
+
+    def _set_rights(self, rights):
+        # Replace the rights number, and its part of the Zobrist key
+        self.zobrist ^= self._tracker_key()
+        self.rights = rights
+        self.zobrist ^= self._tracker_key()
+        self._checks = None
+
+    @property
+    def w_castle(self):
+        '''
+        White's castling rights as a dict {'k': bool, 'q': bool}, unpacked
+        from the rights number. Editing the dict does not change the board;
+        assign a whole dict instead.
+        '''
+        return self._castle_rights('w')
 
-                # Add labels
-                board += f'{8 - rank}  '
+    @w_castle.setter
+    def w_castle(self, rights):
+        self._set_castle_rights('w', rights)
 
-                for file in range(8):
-                    if self.state[rank][file] == '':
-                        if file % 2 == 0:
-                            board += ' ' * 4
-                        else:
-                            board += '#' * 4
-                    else:
-                        if file % 2 == 0:
-                            board += f" {piece_uni[self.state[rank][file]]}  "
-                        else:
-                            board += f"#{piece_uni[self.state[rank][file]]} #"
-                board += '\n'
-                board += '   ' + (((" " * 4) + ("#") * 4) * 4) + '\n'
+    @property
+    def b_castle(self):
+        '''
+        Black's castling rights, in the same form as w_castle.
+        '''
+        return self._castle_rights('b')
 
-        # add labels
-        board += '\n    a   b   c   d   e   f   g   h'
+    @b_castle.setter
+    def b_castle(self, rights):
+        self._set_castle_rights('b', rights)
 
+    def copy(self):
+        '''
+        Returns an independent copy of the board. Only the squares, the
+        attack map, the king tracker and the history need copying, as
+        everything else is a number or a string.
+        '''
+        board = self.__class__.__new__(self.__class__)
+        board.squares = self.squares[:]
+        board.attacks = self.attacks[:]
+        self._copy_trackers(board)
         return board
 
-    def in_check(self, player):
+    def _copy_trackers(self, board):
         '''
-        Checks whether a given player is in check (returns True)
-        or not (returns False). Used to determine whether moves are
-        valid and when determining checkmate.
+        Copies the king tracker, rights, turn, key, scores and history into
+        a new board, and leaves its caches empty. Used by copy on both
+        boards, which copy their pieces themselves.
         '''
-        # Find location of king
-        for rank in range(8):
-            if f'{player}k' in self.state[rank]:
-                # Store as a touple with location = (rank, file)
-                loc = (rank, self.state[rank].index(f'{player}k'))
-
-        # Check in each direction if there is a piece that can hit the king
-        # Up:
-        for x in range(loc[0] - 1, -1, -1):  # vary the rank
-            # Check that test square is nonempty; if empty move on
-            if self.state[x][loc[1]] != '':
-                # Check if test square is a valid piece of opposite color
-                if self.state[x][loc[1]][0] != player and self.state[x][
-                        loc[1]][1] in ['q', 'r']:
-                    return True
-                break
+        board.kings = dict(self.kings)
+        board.rights = self.rights
+        board.turn = self.turn
+        board.zobrist = self.zobrist
+        board.middlegame = self.middlegame
+        board.endgame = self.endgame
+        board.phase = self.phase
+        board.history = None
+        if self.history is not None:
+            board.history = self.history[:]
+        board.ply = self.ply
+        board._view = None
+        board._ranks = None
+        board._checks = None
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        # A copy shares nothing that can change, so it is already deep
+        return self.copy()
+
+    def key(self):
+        '''
+        Returns the 64-bit Zobrist key of the position. Equal positions have
+        equal keys, so the key can stand in for the board in caches and
+        repetition tracking.
+        '''
+        return self.zobrist
 
-        # Down:
-        for x in range(loc[0] + 1, 8):  # vary the rank
-            if self.state[x][loc[1]] != '':
-                if self.state[x][loc[1]][0] != player and self.state[x][
-                        loc[1]][1] in ['q', 'r']:
-                    return True
-                break
+    def __eq__(self, other):
+        # Boards are equal when they hold the same position. A board changes
+        # as moves are made, so it has no hash: use key() where one is needed
+        if not isinstance(other, ChessBoard):
+            return NotImplemented
+        return (self.zobrist == other.zobrist and self.turn == other.turn
+                and self.rights == other.rights and self.state == other.state)
 
-        # Left:
-        for y in range(loc[1] - 1, -1, -1):  # vary the file
-            if self.state[loc[0]][y] != '':
-                if self.state[loc[0]][y][0] != player and self.state[
-                        loc[0]][y][1] in ['q', 'r']:
-                    return True
-                break
+    def attacked(self, square, by):
+        '''
+        Checks whether any piece of the player by attacks the square
+        (returns True) or not (returns False) by looking it up in the attack
+        map.
+        '''
+        return self.attacks[SIDES[by] + square[0] * 8 + square[1]] > 0
 
-        # Right:
-        for y in range(loc[1] + 1, 8):  # vary the file
-            if self.state[loc[0]][y] != '':
-                if self.state[loc[0]][y][0] != player and self.state[
-                        loc[0]][y][1] in ['q', 'r']:
-                    return True
-                break
+    @classmethod
+    def from_fen(cls, fen):
+        '''
+        Returns a new board holding the position in a FEN string, loaded
+        straight into the board state, the en passant, castling and turn
+        trackers without replaying any moves. The move counters at the end
+        of the FEN are optional and ignored.
+        '''
+        fields = fen.split()
+        board = cls()
+
+        # Piece placement, from rank 8 down, with digits for empty squares.
+        # Uppercase letters are white pieces and lowercase are black
+        state = []
+        for row in fields[0].split('/'):
+            rank = []
+            for char in row:
+                if char.isdigit():
+                    rank += [''] * int(char)
+                elif char.isupper():
+                    rank.append(f'w{char.lower()}')
+                else:
+                    rank.append(f'b{char}')
+            state.append(rank)
+
+        # Side to move, set before the pieces so that the key loaded with
+        # them includes it, and castling rights
+        board.turn = fields[1]
+        board.state = state
+        board.w_castle = {'k': 'K' in fields[2], 'q': 'Q' in fields[2]}
+        board.b_castle = {'k': 'k' in fields[2], 'q': 'q' in fields[2]}
+
+        # FEN gives the square behind a pawn that just moved two squares,
+        # while the en passant tracker records the pawn itself
+        board.enpass = [False, (0, 0)]
+        if fields[3] != '-':
+            file = ord(fields[3][0]) - ord('a')
+            if fields[3][1] == '3':  # white pawn on rank 4
+                board.enpass = [True, (4, file)]
+            else:  # black pawn on rank 5
+                board.enpass = [True, (3, file)]
+        return board
 
-        # Right Down Diagonal
-        check_loc = loc
-        while True:
-            # Incriment in diagonal direction
-            check_loc = (check_loc[0] + 1, check_loc[1] + 1)
-            # Check if the square is out of bounds
-            if check_loc[0] == 8 or check_loc[1] == 8:
-                break
-            # Grab value of square
-            check_piece = self.state[check_loc[0]][check_loc[1]]
-            # Same check as above directions
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] in ['q', 'b']:
-                    return True
-                break
+    def to_fen(self, halfmove=0, fullmove=1):
+        '''
+        Returns the position as a FEN string. The board does not count moves,
+        so the halfmove clock and fullmove number are taken as arguments.
+        '''
+        # Piece placement, counting runs of empty squares
+        rows = []
+        for rank in range(8):
+            row = ''
+            empty = 0
+            for file in range(8):
+                square = self.state[rank][file]
+                if square == '':
+                    empty += 1
+                    continue
+                if empty > 0:
+                    row += str(empty)
+                    empty = 0
+                if square[0] == 'w':
+                    row += square[1].upper()
+                else:
+                    row += square[1]
+            if empty > 0:
+                row += str(empty)
+            rows.append(row)
+
+        # Castling rights, '-' if neither side can castle
+        castle = ''
+        if self.w_castle['k'] == True:
+            castle += 'K'
+        if self.w_castle['q'] == True:
+            castle += 'Q'
+        if self.b_castle['k'] == True:
+            castle += 'k'
+        if self.b_castle['q'] == True:
+            castle += 'q'
+        if castle == '':
+            castle = '-'
+
+        # En passant target square, behind the pawn that can be captured
+        enpass = '-'
+        if self.enpass[0] == True:
+            pawn = self.enpass[1]
+            if pawn[0] == 4:  # white pawn, passed over rank 3
+                enpass = f"{'abcdefgh'[pawn[1]]}3"
+            else:  # black pawn, passed over rank 6
+                enpass = f"{'abcdefgh'[pawn[1]]}6"
+
+        return (f"{'/'.join(rows)} {self.turn} {castle} {enpass} "
+                f"{halfmove} {fullmove}")
+
+    def _rank_codes(self, rank):
+        # Piece codes of the squares of a rank, as bytes
+        return bytes(self.squares[rank * 8:rank * 8 + 8])
 
-        # Left Down Diagonal
-        check_loc = loc
-        while True:
-            check_loc = (check_loc[0] + 1, check_loc[1] - 1)
-            if check_loc[0] == 8 or check_loc[1] == -1:
-                break
-            check_piece = self.state[check_loc[0]][check_loc[1]]
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] in ['q', 'b']:
-                    return True
-                break
+    def __str__(self):
+        # Keep the printed lines of each rank with the piece codes they were
+        # printed from, so only the ranks changed since the board was last
+        # printed (usually the one or two a move touched) are printed again
+        if self._ranks is None:
+            self._ranks = [(None, '')] * 8
+        ranks = self._ranks
+        for rank in range(8):
+            codes = self._rank_codes(rank)
+            if ranks[rank][0] != codes:
+                # Hatching, the rank's label and squares, then hatching again
+                edge = RANK_EDGES[rank % 2]
+                squares = ''.join([SQUARE_GLYPHS[(rank + file) % 2][code]
+                                   for file, code in enumerate(codes)])
+                ranks[rank] = (codes,
+                               f'{edge}\n{8 - rank}  {squares}\n{edge}\n')
 
-        # Right Up Diagonal
-        check_loc = loc
-        while True:
-            check_loc = (check_loc[0] - 1, check_loc[1] + 1)
-            if check_loc[0] == -1 or check_loc[1] == 8:
-                break
-            check_piece = self.state[check_loc[0]][check_loc[1]]
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] in ['q', 'b']:
-                    return True
-                break
+        # add labels
+        return ''.join([text for codes, text in ranks]) + FILE_LABELS
 
-        # Left Up Diagonal
-        check_loc = loc
-        while True:
-            check_loc = (check_loc[0] - 1, check_loc[1] - 1)
-            if check_loc[0] == -1 or check_loc[1] == -1:
-                break
-            check_piece = self.state[check_loc[0]][check_loc[1]]
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] in ['q', 'b']:
-                    return True
-                break
+    def in_check(self, player):
+        '''
+        Checks whether a given player is in check (returns True)
+        or not (returns False) by looking up the king's square in the
+        attack maps. Used to determine whether moves are valid and when
+        determining checkmate.
+        '''
+        # Look up location of king as a touple with location = (rank, file)
+        loc = self.kings[player]
 
-        # Pawns:
-        # Checking two potential squares
+        # Check whether any of the opponent's pieces attack the king's square
         if player == 'w':
-            pawns = [(loc[0] - 1, loc[1] - 1), (loc[0] - 1, loc[1] + 1)]
+            return self.attacks[SIDES['b'] + loc[0] * 8 + loc[1]] > 0
         else:
-            pawns = [(loc[0] + 1, loc[1] - 1), (loc[0] + 1, loc[1] + 1)]
-        # Check if the squares are out of bounds
-        for square in range(1, -1, -1):
-            if (pawns[square][0] in [-1, 8]) or (pawns[square][1] in [-1, 8]):
-                pawns.pop(square)
-        # Check if any square contains an enemy pawn
-        for square in pawns:
-            check_piece = self.state[square[0]][square[1]]
-            if check_piece != "":
-                if check_piece[0] != player and check_piece[1] == 'p':
-                    return True
+            return self.attacks[SIDES['w'] + loc[0] * 8 + loc[1]] > 0
 
-        #Knights:
-        knights = [
-            (loc[0] + 2, loc[1] + 1),  # check 8 potential squares
-            (loc[0] + 2, loc[1] - 1),
-            (loc[0] - 2, loc[1] + 1),
-            (loc[0] - 2, loc[1] - 1),
-            (loc[0] + 1, loc[1] + 2),
-            (loc[0] - 1, loc[1] + 2),
-            (loc[0] + 1, loc[1] - 2),
-            (loc[0] - 1, loc[1] - 2)
-        ]
-        # Check squares in bounds
-        for square in range(7, -1, -1):
-            if (knights[square][0] in [-2, -1, 8, 9]) or (knights[square][1]
-                                                          in [-2, -1, 8, 9]):
-                knights.pop(square)
-        # Check if squares contain enemy knights
-        for square in knights:
-            check_piece = self.state[square[0]][square[1]]
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] == 'n':
-                    return True
+    def check_info(self, player):
+        '''
+        Finds what limits the player's moves in the position, working out
+        from the player's king, and returns it as a tuple
+        (checkers, block, pins, danger) of square numbers (rank * 8 + file):
+
+        checkers : list of the enemy pieces giving check
+        block : set of the squares that a move by any piece but the king
+                must end on (capturing or blocking the one checker), or None
+                when the king is not in check
+        pins : dict from each of the player's pinned pieces to the set of
+               squares along its pin ray, pinner included, it may move to
+        danger : set of the squares behind the king on the ray of a sliding
+                 checker, which the king can't step back onto even though
+                 the attack maps don't show them attacked
+
+        The result is kept until the board next changes (make_move and
+        unmake_move, and so move and castle, or a new state), so each
+        position is only worked out once per player.
+        '''
+        if self._checks is None:
+            self._checks = {}
+        elif player in self._checks:
+            return self._checks[player]
 
-        # King (used when checking valid moves for kings)
-        kings = [
-            (loc[0] - 1, loc[1] - 1),  # check 8 potential squares
-            (loc[0] - 1, loc[1]),
-            (loc[0] - 1, loc[1] + 1),
-            (loc[0], loc[1] - 1),
-            (loc[0], loc[1] + 1),
-            (loc[0] + 1, loc[1] - 1),
-            (loc[0] + 1, loc[1]),
-            (loc[0] + 1, loc[1] + 1)
-        ]
-        # Check squares in bounds
-        for square in range(7, -1, -1):
-            if (kings[square][0] in [-1, 8]) or (kings[square][1] in [-1, 8]):
-                kings.pop(square)
-        # Check if squares contain enemy king
-        for square in kings:
-            check_piece = self.state[square[0]][square[1]]
-            if check_piece != '':
-                if check_piece[0] != player and check_piece[1] == 'k':
-                    return True
+        squares = self.squares
+        king = self.kings[player][0] * 8 + self.kings[player][1]
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+        checkers = []
+        block = set()
+        pins = {}
+        danger = set()
+
+        # Walk out from the king along every ray. The first of the player's
+        # pieces on a ray is pinned if the next piece is an enemy slider that
+        # moves along the ray; an enemy slider with nothing in between checks
+        rays = RAY_SQUARES[king]
+        for direction in range(8):
+            if direction < 4:
+                sliders = ['q', 'r']
+            else:
+                sliders = ['q', 'b']
+            ray = rays[direction]
+            pinned = None
+            for distance, square in enumerate(ray):
+                code = squares[square]
+                if code == 0:
+                    continue
+                name = NAMES[code]
+                if name[0] == player:
+                    if pinned is not None:
+                        break  # two of the player's pieces shield the king
+                    pinned = square
+                    continue
+                if name[1] in sliders:
+                    if pinned is None:
+                        checkers.append(square)
+                        block.update(ray[:distance + 1])
+                        # The square behind the king stays attacked
+                        behind = rays[OPPOSITE[direction]]
+                        if behind:
+                            danger.add(behind[0])
+                    else:
+                        pins[pinned] = set(ray[:distance + 1])
+                break
 
-        # If piece not in check, return false
-        return False
+        # Knights and pawns check from where they stand, so only their square
+        # can be captured to stop the check. Enemy pawns attack the king from
+        # the squares that the player's pawns would attack
+        if self.attacks[SIDES[enemy] + king] > len(checkers):
+            for square in KNIGHT_TARGETS[king]:
+                if squares[square] == CODES[f'{enemy}n']:
+                    checkers.append(square)
+                    block.add(square)
+            for square in PAWN_TARGETS[player][king]:
+                if squares[square] == CODES[f'{enemy}p']:
+                    checkers.append(square)
+                    block.add(square)
+
+        # Only the king can move out of a double check
+        if len(checkers) == 0:
+            block = None
+        elif len(checkers) > 1:
+            block = set()
+
+        self._checks[player] = (checkers, block, pins, danger)
+        return self._checks[player]
 
     def valid_move(self, player, piece, start, end):
         '''
@@ -297,212 +1010,72 @@ class ChessBoard():
         move method and when checking for stalemate/checkmate
         '''
         # Check if the target square is occupied by own piece
-        if self.state[end[0]][end[1]] != '':
-            if self.state[end[0]][end[1]][0] == player:
+        target = self.squares[end[0] * 8 + end[1]]
+        if target != 0:
+            if NAMES[target][0] == player:
                 return False
 
-        # Check whether move would place the player in check.
-        # Move piece to new loc on hypothetical board
-        copy_board = copy.deepcopy(self)
-        copy_board.state[end[0]][end[1]] = f"{player}{piece}"
-        copy_board.state[start[0]][start[1]] = ""
-        # Check if hypothetical boardstate places player in check
-        if copy_board.in_check(player) == True:
+        # Check if target square can be targeted by piece
+        if self._reachable(player, piece, start, end) == False:
             return False
 
-        # Check if target square can be targeted by piece
-        if piece == 'q':  # queens
-            # Check whether the target square is on the same
-            # rank, file, or diagonal as the queen
-            if start[0] == end[0]:  # same rank
-                # Check which direction the target square is
-                if start[1] > end[1]:  # left
-                    # Incriment in direction of the target square
-                    # until find a piece or target square
-                    square = start
-                    while True:
-                        square = (square[0], square[1] - 1)
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-                else:  # right
-                    square = start
-                    while True:
-                        square = (square[0], square[1] + 1)
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-            elif start[1] == end[1]:  # same file
-                if start[0] > end[0]:  # up
-                    square = start
-                    while True:
-                        square = (square[0] - 1, square[1])
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-                else:  # down
-                    square = start
-                    while True:
-                        square = (square[0] + 1, square[1])
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-            elif abs(start[0] - end[0]) == abs(start[1] - end[1]):  # diagonal
-                # Check whether target square is up or down
-                if start[0] > end[0]:  # up
-                    # Check whether target square is left or right
-                    if start[1] > end[1]:  # left
-                        # Incriment in direction of the target square
-                        # until find a piece or target square
-                        square = start
-                        while True:
-                            square = (square[0] - 1, square[1] - 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                    else:  # right
-                        square = start
-                        while True:
-                            square = (square[0] - 1, square[1] + 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                else:  # down
-                    if start[1] > end[1]:  # left
-                        square = start
-                        while True:
-                            square = (square[0] + 1, square[1] - 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                    else:  # right
-                        square = start
-                        while True:
-                            square = (square[0] + 1, square[1] + 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-            else:
-                return False  # target square not on rank, file, or diagonals
-        elif piece == 'r':  # rooks
-            # Same exact check as the queens, but only for files and ranks
-            if start[0] == end[0]:  # same rank
-                if start[1] > end[1]:  # left
-                    square = start
-                    while True:
-                        square = (square[0], square[1] - 1)
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-                else:  # right
-                    square = start
-                    while True:
-                        square = (square[0], square[1] + 1)
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-            elif start[1] == end[1]:  # same file
-                if start[0] > end[0]:  # up
-                    square = start
-                    while True:
-                        square = (square[0] - 1, square[1])
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-                else:  # down
-                    square = start
-                    while True:
-                        square = (square[0] + 1, square[1])
-                        if square == end:
-                            return True
-                        elif self.state[square[0]][square[1]] != '':
-                            return False
-            else:
-                return False  # target square not on rank or file
-        elif piece == 'b':  # bishops
-            # Same check as queens, but only for diagonals
-            if abs(start[0] - end[0]) == abs(start[1] - end[1]):  # diagonal
-                if start[0] > end[0]:  # up
-                    if start[1] > end[1]:  # left
-                        square = start
-                        while True:
-                            square = (square[0] - 1, square[1] - 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                    else:  # right
-                        square = start
-                        while True:
-                            square = (square[0] - 1, square[1] + 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                else:  # down
-                    if start[1] > end[1]:  # left
-                        square = start
-                        while True:
-                            square = (square[0] + 1, square[1] - 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-                    else:  # right
-                        square = start
-                        while True:
-                            square = (square[0] + 1, square[1] + 1)
-                            if square == end:
-                                return True
-                            elif self.state[square[0]][square[1]] != '':
-                                return False
-            else:
-                return False  # target square not on diagonals
-        elif piece == 'n':  # knights
-            # Check whether target square in the list of 8 possible
-            # positions for the knight
-            knights = [
-                (start[0] + 2, start[1] + 1),  # check 8 potential squares
-                (start[0] + 2, start[1] - 1),
-                (start[0] - 2, start[1] + 1),
-                (start[0] - 2, start[1] - 1),
-                (start[0] + 1, start[1] + 2),
-                (start[0] - 1, start[1] + 2),
-                (start[0] + 1, start[1] - 2),
-                (start[0] - 1, start[1] - 2)
-            ]
-            if end in knights:
-                return True
+        checkers, block, pins, danger = self.check_info(player)
+        end_square = end[0] * 8 + end[1]
+
+        # A king can't move onto an attacked square, or back along the ray
+        # of a sliding piece checking it
+        if piece == 'k':
+            if player == 'w':
+                enemy = 'b'
             else:
+                enemy = 'w'
+            if self.attacks[SIDES[enemy] + end_square] > 0:
                 return False
-        elif piece == 'k':  # kings
-            # Check whether target square in the list of 8 possible
-            # positions for the king
-            kings = [
-                (start[0] - 1, start[1] - 1),  # check 8 potential squares
-                (start[0] - 1, start[1]),
-                (start[0] - 1, start[1] + 1),
-                (start[0], start[1] - 1),
-                (start[0], start[1] + 1),
-                (start[0] + 1, start[1] - 1),
-                (start[0] + 1, start[1]),
-                (start[0] + 1, start[1] + 1)
-            ]
-            if end in kings:
-                return True
-            else:
+            return end_square not in danger
+
+        # An en passant capture takes a pawn off a square the move doesn't
+        # end on, which can uncover a check along the rank, so make the
+        # move on the board, test for check, then take it back
+        if piece == 'p' and start[1] != end[1] and target == 0:
+            undo = self.make_move(player, piece, start, end)
+            check = self.in_check(player)
+            self.unmake_move(undo)
+            return check == False
+
+        # Any other move must stop a check, and keep a pinned piece on its
+        # pin ray
+        if block is not None and end_square not in block:
+            return False
+        start_square = start[0] * 8 + start[1]
+        if start_square in pins and end_square not in pins[start_square]:
+            return False
+
+        return True
+
+    def _reachable(self, player, piece, start, end):
+        '''
+        Checks whether the target square can be reached by the piece's move
+        pattern from start, ignoring whether the move leaves the king in
+        check. Used by valid_move.
+        '''
+        start_square = start[0] * 8 + start[1]
+        end_square = end[0] * 8 + end[1]
+        if piece in ['q', 'r', 'b']:  # sliding pieces
+            # Check that the target square is on one of the piece's rays,
+            # then walk along it until finding a piece or the target square
+            direction = RAY_DIRECTIONS[start_square][end_square]
+            if direction is None or direction not in SLIDE_DIRECTIONS[piece]:
                 return False
+            for square in RAY_SQUARES[start_square][direction]:
+                if square == end_square:
+                    return True
+                elif self.squares[square] != 0:
+                    return False
+        elif piece == 'n':  # knights
+            # Check whether the target square is one the knight jumps to
+            return end_square in KNIGHT_TARGETS[start_square]
+        elif piece == 'k':  # kings
+            return end_square in KING_TARGETS[start_square]
         else:  # pawns
             # Have to check for each color: whether there is a piece in front
             # of the pawn, whether there are enemy pieces to the sides that
@@ -512,12 +1085,13 @@ class ChessBoard():
                 # Forward move (not attacking):
                 if start[1] == end[1]:
                     # Check space in front is clear:
-                    if self.state[start[0] - 1][start[1]] == '':
+                    if self.squares[(start[0] - 1) * 8 + start[1]] == 0:
                         if start[0] - end[0] == 1:  # move one space forward
                             return True
-                        elif start[0] - end[0] == 2:  # move two spaces
+                        elif start[0] - end[0] == 2 and start[0] == 6:
+                            # move two spaces from the home rank
                             # Check space two in front is clear
-                            if self.state[end[0]][end[1]] == '':
+                            if self.squares[end[0] * 8 + end[1]] == 0:
                                 return True
                             else:
                                 return False  # piece is two in front of pawn
@@ -526,14 +1100,15 @@ class ChessBoard():
                     else:
                         return False  # not open for pawn to move forward
                 # Attacking move:
-                elif end in [(start[0] - 1, start[1] - 1),
-                             (start[0] - 1, start[1] + 1)]:
+                elif end_square in PAWN_TARGETS['w'][start_square]:
                     # Check that opponent's piece occupies target square
-                    if self.state[end[0]][end[1]] != '':
-                        if self.state[end[0]][end[1]][0] == 'b':
+                    target = self.squares[end[0] * 8 + end[1]]
+                    if target != 0:
+                        if NAMES[target][0] == 'b':
                             return True
-                    # Check en passant is possible and is being used
-                    elif self.enpass == [True, (end[0] + 1, end[1])]:
+                    # Check en passant is possible and is being used (the
+                    # rights hold the vulnerable pawn's square number + 1)
+                    elif self.rights >> 4 == (end[0] + 1) * 8 + end[1] + 1:
                         return True
                     else:
                         return False  # no piece to attack
@@ -543,11 +1118,12 @@ class ChessBoard():
                 # Same checks as for white, just in reverse direction
                 # Forward move (not attacking):
                 if start[1] == end[1]:
-                    if self.state[start[0] + 1][start[1]] == '':
+                    if self.squares[(start[0] + 1) * 8 + start[1]] == 0:
                         if start[0] - end[0] == -1:  # move one space forward
                             return True
-                        elif start[0] - end[0] == -2:  # move two spaces
-                            if self.state[end[0]][end[1]] == '':
+                        elif start[0] - end[0] == -2 and start[0] == 1:
+                            # move two spaces from the home rank
+                            if self.squares[end[0] * 8 + end[1]] == 0:
                                 return True
                             else:
                                 return False  # piece is two in front of pawn
@@ -556,257 +1132,797 @@ class ChessBoard():
                     else:
                         return False  # not open for pawn to move forward
                 # Attacking move:
-                elif end in [(start[0] + 1, start[1] - 1),
-                             (start[0] + 1, start[1] + 1)]:
-                    if self.state[end[0]][end[1]] != '':
-                        if self.state[end[0]][end[1]][0] == 'w':
+                elif end_square in PAWN_TARGETS['b'][start_square]:
+                    target = self.squares[end[0] * 8 + end[1]]
+                    if target != 0:
+                        if NAMES[target][0] == 'w':
                             return True
-                    elif self.enpass == [True, (end[0] - 1, end[1])]:
+                    elif self.rights >> 4 == (end[0] - 1) * 8 + end[1] + 1:
                         return True
                     else:
                         return False  # no piece to attack
                 else:
                     return False  # target square not valid
 
-    def move(self, player, piece, start, end):
+    def move(self, player, piece, start=None, end=None, promote='q'):
         '''
         Updates the board state for a specified move of a piece from start
         to end. Keeps the castling tracker up to date as well as the en passant
-        tracker. Returns "Illegal Move" if move is not valid and returns None
-        if move is valid. Castling is done with different function.
+        tracker. A pawn reaching the last rank becomes the promote piece.
+        Returns "Illegal Move" if move is not valid and returns None
+        if move is valid. Castling is done with different function. The move
+        can also be given packed into 16 bits in place of piece, as from
+        pack_move, in which case start and end are left out (a packed castle
+        is passed on to castle).
         '''
+        if isinstance(piece, int):
+            code = piece
+            if code >> 12 == CASTLE:
+                return self.castle(player, code)
+            piece, start, end, packed_promote = self.unpack_move(code)
+            # The piece on the start square has to be the player's
+            if piece == '' or self.piece_on(code & 63)[0] != player:
+                return "Illegal Move"
+            if packed_promote is not None:
+                promote = packed_promote
+
         # Check if move is valid and change the board state if so
         if self.valid_move(player, piece, start, end) == True:
-            # Change board state
-            self.state[start[0]][start[1]] = ''
-            self.state[end[0]][end[1]] = f"{player}{piece}"
+            # Only pawns reaching the last rank are promoted
+            if piece != 'p' or end[0] not in [0, 7]:
+                promote = None
+            self._record(self.make_move(player, piece, start, end, promote))
+            return None
+        else:
+            return "Illegal Move"
 
-            # Remove piece if en passant is used
-            if self.enpass[0] == True:
-                if piece == 'p':
-                    if player == 'w':
-                        if (end[0] + 1, end[1]) == self.enpass[1]:
-                            self.state[self.enpass[1][0]][self.enpass[1]
-                                                          [1]] = ''
-                    else:
-                        if (end[0] - 1, end[1]) == self.enpass[1]:
-                            self.state[self.enpass[1][0]][self.enpass[1]
-                                                          [1]] = ''
+    def make_move(self, player, piece, start, end, promote=None):
+        '''
+        Changes the board state for a move of a piece from start to end
+        without checking whether it is legal, and returns an undo token that
+        unmake_move uses to restore the board exactly. Castling is given as
+        the king moving two squares and promote is the piece a pawn becomes
+        on the last rank (None otherwise). Keeps the king, castling and en
+        passant trackers, the attack map and the Zobrist key up to date.
+        '''
+        squares = self.squares
+        to_square = end[0] * 8 + end[1]
+        self._checks = None
+
+        # Find the captured piece, which is beside the target square
+        # when a pawn captures en passant
+        capture_square = end
+        if piece == 'p' and start[1] != end[1] and squares[to_square] == 0:
+            capture_square = (start[0], end[1])
+        captured = NAMES[squares[capture_square[0] * 8 + capture_square[1]]]
+
+        # Record everything the move changes so it can be undone
+        undo = (player, piece, start, end, promote, captured, capture_square,
+                self.rights)
+
+        # Change board state (a capture on the target square is replaced
+        # by the moving piece)
+        if capture_square != end:
+            self._place(capture_square[0] * 8 + capture_square[1], 0)
+        self._place(start[0] * 8 + start[1], 0)
+        if promote is None:
+            self._place(to_square, CODES[f"{player}{piece}"])
+        else:
+            self._place(to_square, CODES[f"{player}{promote}"])
 
-            # Change castling tracker if necessary
-            if piece == 'k':
-                if player == 'w':
-                    self.w_castle['k'] = False
-                    self.w_castle['q'] = False
-                else:
-                    self.b_castle['k'] = False
-                    self.b_castle['q'] = False
-            elif piece == 'r':
-                if player == 'w':
-                    if start == (7, 0):
-                        self.w_castle['q'] = False
-                    elif start == (7, 7):
-                        self.w_castle['k'] = False
-                else:
-                    if start == (0, 0):
-                        self.b_castle['q'] = False
-                    elif start == (0, 7):
-                        self.b_castle['k'] = False
-
-            # Reset en passant
-            self.enpass = [False, (0, 0)]
-            if piece == 'p':
-                if player == 'w':
-                    if start[0] == 6 and end[0] == 4:
-                        self.enpass = [True, end]
-                else:
-                    if start[0] == 1 and end[0] == 3:
-                        self.enpass = [True, end]
+        # Update the king tracker, and move the rook as well when castling
+        if piece == 'k':
+            self.kings[player] = end
+            if abs(start[1] - end[1]) == 2:
+                if end[1] == 6:  # kingside
+                    self._place(end[0] * 8 + 7, 0)
+                    self._place(end[0] * 8 + 5, CODES[f"{player}r"])
+                else:  # queenside
+                    self._place(end[0] * 8, 0)
+                    self._place(end[0] * 8 + 3, CODES[f"{player}r"])
 
-            return None
+        self._update_trackers(player, piece, start, end)
+
+        return undo
+
+    def _update_trackers(self, player, piece, start, end):
+        '''
+        Updates the castling, en passant and turn trackers after a move of a
+        piece from start to end, and their part of the Zobrist key. Used by
+        make_move.
+        '''
+        # Take the trackers out of the key before changing them
+        self.zobrist ^= self._tracker_key()
+
+        # Reset en passant, keeping only the castling rights
+        rights = self.rights & 15
+
+        # Change castling tracker if necessary
+        if piece == 'k':
+            rights &= ~(CASTLE_BITS[player]['k'] | CASTLE_BITS[player]['q'])
+
+        # A rook leaving its home square, or being captured on it, ends
+        # castling on that side
+        for square in [start[0] * 8 + start[1], end[0] * 8 + end[1]]:
+            if square in ROOK_HOMES:
+                rights &= ~ROOK_HOMES[square]
+
+        # A pawn moving two squares can be taken en passant, if an enemy
+        # pawn is beside it
+        if piece == 'p' and abs(start[0] - end[0]) == 2:
+            if player == 'w':
+                rights |= self._en_passant_rights(end[0] * 8 + end[1], 'b')
+            else:
+                rights |= self._en_passant_rights(end[0] * 8 + end[1], 'w')
+        self.rights = rights
+
+        # The opponent moves next
+        if player == 'w':
+            self.turn = 'b'
         else:
-            return "Illegal Move"
+            self.turn = 'w'
+
+        self.zobrist ^= self._tracker_key()
+
+    def _tracker_key(self):
+        '''
+        Returns the part of the Zobrist key that comes from the castling, en
+        passant and turn trackers.
+        '''
+        key = ZOBRIST_CASTLE[self.rights & 15]
+        if self.rights >> 4 != 0:
+            key ^= ZOBRIST_ENPASS[((self.rights >> 4) - 1) % 8]
+        if self.turn == 'b':
+            key ^= ZOBRIST_BLACK
+        return key
+
+    def unmake_move(self, undo):
+        '''
+        Restores the board state from before the move that returned the undo
+        token. Moves must be unmade in the reverse order they were made.
+        '''
+        (player, piece, start, end, promote, captured, capture_square,
+         rights) = undo
+        to_square = end[0] * 8 + end[1]
+        self._checks = None
+
+        # Put the moved piece back and restore any captured piece
+        if capture_square == end:
+            self._place(to_square, CODES[captured])
+        else:
+            self._place(to_square, 0)
+            self._place(capture_square[0] * 8 + capture_square[1],
+                        CODES[captured])
+        self._place(start[0] * 8 + start[1], CODES[f"{player}{piece}"])
+
+        # Put the king tracker back, and the rook as well when castling
+        if piece == 'k':
+            self.kings[player] = start
+            if abs(start[1] - end[1]) == 2:
+                if end[1] == 6:  # kingside
+                    self._place(end[0] * 8 + 5, 0)
+                    self._place(end[0] * 8 + 7, CODES[f"{player}r"])
+                else:  # queenside
+                    self._place(end[0] * 8 + 3, 0)
+                    self._place(end[0] * 8, CODES[f"{player}r"])
+
+        self._restore_trackers(player, rights)
+
+    def _restore_trackers(self, player, rights):
+        '''
+        Restores the en passant and castling rights saved in an undo token,
+        gives the turn back to the player who moved, and restores their part
+        of the Zobrist key. Used by unmake_move.
+        '''
+        self.zobrist ^= self._tracker_key()
+        self.rights = rights
+        self.turn = player
+        self.zobrist ^= self._tracker_key()
+
+    def valid_castle(self, player, side):
+        '''
+        Checks whether the player can castle on the specified side (returns
+        True) or not (returns False). Used by the castle method and when
+        generating legal moves.
+        '''
+        # Find the player's back rank
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+
+        # Check that the rook and king have not moved
+        if self.rights & CASTLE_BITS[player][side] == 0:
+            return False
+
+        # Check that the king is not castling out of check
+        if self.in_check(player) == True:
+            return False
+
+        # Check that squares between rook and king are empty and find the
+        # squares that the king passes through
+        if side == 'k':
+            between = [5, 6]
+            path = [5, 6]
+        else:
+            between = [1, 2, 3]
+            path = [3, 2]
+        for file in between:
+            if self.squares[rank * 8 + file] != 0:
+                return False
+
+        # Check that king is not moving through a check. The king is still
+        # on its square, but as it is not in check it blocks no attacks
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+        for file in path:
+            if self.attacks[SIDES[enemy] + rank * 8 + file] > 0:
+                return False
+
+        return True
 
     def castle(self, player, side):
         '''
         Performs castling on a specified side for a specified player. If
         castling is not possible, returns "Illegal Move". Returns None if
-        possible. Keeps en passant and castling trackers updated.
-        '''
-        if self.in_check(player) == False:  # king not in check
-            if player == 'w':  # white castle
-                if self.w_castle[side] == True:  # rook and king have not moved
-                    if side == 'k':  # kingside white castle
-                        # Check that squares between rook and king are empty
-                        if self.state[7][5] != '' or self.state[7][6] != '':
-                            return "Illegal Move"
-
-                        # Check that king is not moving through a check by
-                        # creating hypothetical boards and checking for checks
-                        copy_board = copy.deepcopy(self)
-                        copy_board.state[7][4] = ''
-                        copy_board.state[7][5] = 'wk'
-                        if copy_board.in_check('w') == True:
-                            return "Illegal Move"
-                        copy_board.state[7][5] = ''
-                        copy_board.state[7][6] = 'wk'
-                        if copy_board.in_check('w') == True:
-                            return "Illegal Move"
-
-                        # Move the king and rook
-                        self.state[7][4] = ''
-                        self.state[7][5] = 'wr'
-                        self.state[7][6] = 'wk'
-                        self.state[7][7] = ''
-
-                        # Update en passant tracker
-                        self.enpass = [False, (0, 0)]
-
-                        # Update castling tracker
-                        self.w_castle['k'] = False
-                        self.b_castle['q'] = False
-
-                        return None
-                    else:  # queenside white castle
-                        # Same checks as above
-                        if (self.state[7][1] != '' or self.state[7][2] != ''
-                                or self.state[7][3] != ''):
-                            return "Illegal Move"
-
-                        copy_board = copy.deepcopy(self)
-                        copy_board.state[7][4] = ''
-                        copy_board.state[7][3] = 'wk'
-                        if copy_board.in_check('w') == True:
-                            return "Illegal Move"
-                        copy_board.state[7][3] = ''
-                        copy_board.state[7][2] = 'wk'
-                        if copy_board.in_check('w') == True:
-                            return "Illegal Move"
-
-                        # Move the king and rook
-                        self.state[7][0] = ''
-                        self.state[7][2] = 'wk'
-                        self.state[7][3] = 'wr'
-                        self.state[7][4] = ''
-
-                        # Update en passant tracker
-                        self.enpass = [False, (0, 0)]
-
-                        # Update castling tracker
-                        self.w_castle['k'] = False
-                        self.b_castle['q'] = False
-
-                        return None
-            else:  # black castle
-                if self.b_castle[side] == True:  # rook and king have not moved
-                    if side == 'k':  # kingside black castle
-                        # Same checks as above
-                        if self.state[0][5] != '' or self.state[0][6] != '':
-                            return "Illegal Move"
-
-                        copy_board = copy.deepcopy(self)
-                        copy_board.state[0][4] = ''
-                        copy_board.state[0][5] = 'bk'
-                        if copy_board.in_check('b') == True:
-                            return "Illegal Move"
-                        copy_board.state[0][5] = ''
-                        copy_board.state[0][6] = 'bk'
-                        if copy_board.in_check('b') == True:
-                            return "Illegal Move"
-
-                        # Move the king and rook
-                        self.state[0][4] = ''
-                        self.state[0][5] = 'br'
-                        self.state[0][6] = 'bk'
-                        self.state[0][7] = ''
-
-                        # Update en passant tracker
-                        self.enpass = [False, (0, 0)]
-
-                        # Update castling tracker
-                        self.w_castle['k'] = False
-                        self.b_castle['q'] = False
-
-                        return None
-                    else:  # queenside black castle
-                        # Same checks as above
-                        if (self.state[0][1] != '' or self.state[0][2] != ''
-                                or self.state[0][3] != ''):
-                            return "Illegal Move"
-
-                        copy_board = copy.deepcopy(self)
-                        copy_board.state[0][4] = ''
-                        copy_board.state[0][3] = 'bk'
-                        if copy_board.in_check('b') == True:
-                            return "Illegal Move"
-                        copy_board.state[0][3] = ''
-                        copy_board.state[0][2] = 'bk'
-                        if copy_board.in_check('b') == True:
-                            return "Illegal Move"
-
-                        # Move the king and rook
-                        self.state[0][0] = ''
-                        self.state[0][2] = 'bk'
-                        self.state[0][3] = 'br'
-                        self.state[0][4] = ''
-
-                        # Update en passant tracker
-                        self.enpass = [False, (0, 0)]
-
-                        # Update castling tracker
-                        self.w_castle['k'] = False
-                        self.b_castle['q'] = False
-
-                        return None
-
-        return "Illegal Move"
+        possible. Keeps en passant and castling trackers updated. The side
+        can also be given as a castle packed into 16 bits, as from pack_move.
+        '''
+        if isinstance(side, int):
+            # Only the player's king going from its square two squares
+            # along its own back rank is a castle
+            start, end, flag = decode_move(side)
+            if player == 'w':
+                home = 7 * 8 + 4
+            else:
+                home = 4
+            if flag != CASTLE or start != home:
+                return "Illegal Move"
+            if end == home + 2:
+                side = 'k'
+            elif end == home - 2:
+                side = 'q'
+            else:
+                return "Illegal Move"
+
+        if self.valid_castle(player, side) == False:
+            return "Illegal Move"
+
+        # Move the king two squares, which also moves the rook and
+        # updates the en passant and castling trackers
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+        if side == 'k':
+            self._record(self.make_move(player, 'k', (rank, 4), (rank, 6)))
+        else:
+            self._record(self.make_move(player, 'k', (rank, 4), (rank, 2)))
+
+        return None
+
+    def _candidates(self, player, piece, start):
+        '''
+        Returns the list of squares that a piece on start could reach by its
+        move pattern, ignoring whether the move leaves the king in check.
+        Squares occupied by the player's own pieces are left out.
+        '''
+        squares = self.squares
+        square = start[0] * 8 + start[1]
+        targets = []
+        if piece in ['q', 'r', 'b']:  # sliding pieces
+            # Walk along each ray until leaving the board or hitting a piece
+            rays = RAY_SQUARES[square]
+            for direction in SLIDE_DIRECTIONS[piece]:
+                for end in rays[direction]:
+                    target = squares[end]
+                    if target == 0:
+                        targets.append(COORDINATES[end])
+                    else:
+                        # Enemy pieces can be captured, but block the ray
+                        if NAMES[target][0] != player:
+                            targets.append(COORDINATES[end])
+                        break
+        elif piece in ['n', 'k']:  # jumping pieces
+            if piece == 'n':
+                jumps = KNIGHT_TARGETS[square]
+            else:
+                jumps = KING_TARGETS[square]
+            for end in jumps:
+                target = squares[end]
+                if target == 0 or NAMES[target][0] != player:
+                    targets.append(COORDINATES[end])
+        else:  # pawns
+            # Find direction of travel and home rank for the color
+            if player == 'w':
+                forward = -1
+                home = 6
+            else:
+                forward = 1
+                home = 1
+            rank = start[0] + forward
+            if 0 <= rank < 8:
+                # Pushes one and two squares forward
+                if squares[rank * 8 + start[1]] == 0:
+                    targets.append((rank, start[1]))
+                    if (start[0] == home and
+                            squares[(rank + forward) * 8 + start[1]] == 0):
+                        targets.append((rank + forward, start[1]))
+                # Captures, including en passant (the rights hold the
+                # square number + 1 of the pawn beside it)
+                for end in PAWN_TARGETS[player][square]:
+                    target = squares[end]
+                    if target != 0 and NAMES[target][0] != player:
+                        targets.append(COORDINATES[end])
+                    elif self.rights >> 4 == end - forward * 8 + 1:
+                        targets.append(COORDINATES[end])
+        return targets
+
+    def generate_legal_moves(self, player):
+        '''
+        Yields every legal move for the player as a tuple
+        (piece, start, end, promote). Only the squares that each piece's
+        move pattern can reach are tested, instead of every square on the
+        board. Castling is yielded as the king moving two squares, and a pawn
+        reaching the last rank is yielded once for each piece it can promote
+        to (promote is None for every other move). The board should not be
+        changed while the generator is being consumed.
+        '''
+        for square, code in enumerate(self.squares):
+            name = NAMES[code]
+            if name == '' or name[0] != player:
+                continue
+            piece = name[1]
+            start = COORDINATES[square]
+            for end in self._candidates(player, piece, start):
+                if self.valid_move(player, piece, start, end) == True:
+                    if piece == 'p' and end[0] in [0, 7]:
+                        for promote in ['q', 'r', 'b', 'n']:
+                            yield (piece, start, end, promote)
+                    else:
+                        yield (piece, start, end, None)
+
+        # Castling
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+        for side, file in [('k', 6), ('q', 2)]:
+            if self.valid_castle(player, side) == True:
+                yield ('k', (rank, 4), (rank, file), None)
+
+    def generate_captures(self, player):
+        '''
+        Yields the legal captures, including en passant, and promotions for
+        the player, in the same form as generate_legal_moves. Quiet moves are
+        left out before they are checked for legality.
+        '''
+        squares = self.squares
+        for square, code in enumerate(squares):
+            name = NAMES[code]
+            if name == '' or name[0] != player:
+                continue
+            piece = name[1]
+            start = COORDINATES[square]
+            for end in self._candidates(player, piece, start):
+                if piece == 'p':
+                    # Pawn pushes only count when they promote
+                    if start[1] == end[1] and end[0] not in [0, 7]:
+                        continue
+                elif squares[end[0] * 8 + end[1]] == 0:
+                    continue
+                if self.valid_move(player, piece, start, end) == True:
+                    if piece == 'p' and end[0] in [0, 7]:
+                        for promote in ['q', 'r', 'b', 'n']:
+                            yield (piece, start, end, promote)
+                    else:
+                        yield (piece, start, end, None)
+
+    def generate_packed_moves(self, player, buffer):
+        '''
+        Writes every legal move for the player into buffer (from
+        move_buffer) as 16-bit packed moves, in the same order as
+        generate_legal_moves, and returns how many it wrote. The moves are
+        buffer[0] to buffer[count - 1]; the rest of the buffer is left as it
+        was. Reusing one buffer per search depth allocates nothing per move.
+        '''
+        squares = self.squares
+        count = 0
+        for square, code in enumerate(squares):
+            name = NAMES[code]
+            if name == '' or name[0] != player:
+                continue
+            piece = name[1]
+            start = COORDINATES[square]
+            for end in self._candidates(player, piece, start):
+                if self.valid_move(player, piece, start, end) == False:
+                    continue
+                target = end[0] * 8 + end[1]
+                move = square | (target << 6)
+                if piece == 'p':
+                    if end[0] in [0, 7]:
+                        # One move for each promotion piece, queen first
+                        for flag in [4, 3, 2, 1]:
+                            buffer[count] = move | (flag << 12)
+                            count += 1
+                        continue
+                    if abs(start[0] - end[0]) == 2:
+                        move |= DOUBLE_PUSH << 12
+                    elif start[1] != end[1] and squares[target] == 0:
+                        move |= EN_PASSANT << 12
+                buffer[count] = move
+                count += 1
+
+        # Castling
+        if player == 'w':
+            rank = 7
+        else:
+            rank = 0
+        for side, file in [('k', 6), ('q', 2)]:
+            if self.valid_castle(player, side) == True:
+                buffer[count] = encode_move(rank * 8 + 4, rank * 8 + file,
+                                            CASTLE)
+                count += 1
+        return count
+
+    def piece_on(self, square):
+        '''
+        Returns the name of the piece on a square number, or '' if the square
+        is empty.
+        '''
+        return NAMES[self.squares[square]]
+
+    def pack_move(self, piece, start, end, promote=None):
+        '''
+        Returns the move of a piece from start to end, as passed to move,
+        packed into a 16-bit integer (see encode_move), with the flag for a
+        promotion, castle, en passant capture or double pawn push worked out
+        from the position.
+        '''
+        flag = 0
+        if promote is not None:
+            flag = PROMOTIONS.index(promote)
+        elif piece == 'k' and abs(start[1] - end[1]) == 2:
+            flag = CASTLE
+        elif piece == 'p':
+            if abs(start[0] - end[0]) == 2:
+                flag = DOUBLE_PUSH
+            elif (start[1] != end[1]
+                  and self.piece_on(end[0] * 8 + end[1]) == ''):
+                flag = EN_PASSANT
+        return encode_move(start[0] * 8 + start[1], end[0] * 8 + end[1], flag)
+
+    def unpack_move(self, code):
+        '''
+        Returns the tuple (piece, start, end, promote) of a 16-bit packed
+        move, with the piece read from its start square ('' if it is empty).
+        '''
+        start, end, flag = decode_move(code)
+        piece = self.piece_on(start)[1:]
+        promote = None
+        if 1 <= flag <= 4:
+            promote = PROMOTIONS[flag]
+        return (piece, COORDINATES[start], COORDINATES[end], promote)
+
+    def _record(self, undo):
+        '''
+        Adds the move that returned the undo token to the history, packed
+        into one integer: the move packed into 16 bits (see encode_move),
+        the code of the moved piece in the next 4 bits, the code of the
+        captured piece (0 for none) in the 4 after and the rights before the
+        move above them. Moves that were taken back are dropped, as they
+        can't be played again after a different move.
+        '''
+        (player, piece, start, end, promote, captured, capture_square,
+         rights) = undo
+        if promote is not None:
+            flag = PROMOTIONS.index(promote)
+        elif capture_square != end:
+            flag = EN_PASSANT
+        elif piece == 'k' and abs(start[1] - end[1]) == 2:
+            flag = CASTLE
+        elif piece == 'p' and abs(start[0] - end[0]) == 2:
+            flag = DOUBLE_PUSH
+        else:
+            flag = 0
+        entry = encode_move(start[0] * 8 + start[1], end[0] * 8 + end[1], flag)
+        entry |= CODES[f'{player}{piece}'] << 16
+        entry |= CODES[captured] << 20
+        entry |= rights << 24
+
+        if self.history is None:
+            self.history = array('Q')
+        del self.history[self.ply:]
+        self.history.append(entry)
+        self.ply += 1
+
+    def _entry_move(self, entry):
+        # The player, piece, start, end and promotion piece of a history entry
+        start, end, flag = decode_move(entry & 0xFFFF)
+        name = NAMES[(entry >> 16) & 15]
+        promote = None
+        if 1 <= flag <= 4:
+            promote = PROMOTIONS[flag]
+        return name[0], name[1], COORDINATES[start], COORDINATES[end], promote
+
+    def undo(self):
+        '''
+        Takes back the last move made with move or castle, restoring the
+        position before it from its history entry. Returns "Illegal Move"
+        if there is no move to take back and None otherwise. The move can be
+        played again with redo until another move is made.
+        '''
+        if self.ply == 0:
+            return "Illegal Move"
+        entry = self.history[self.ply - 1]
+        player, piece, start, end, promote = self._entry_move(entry)
+
+        # An en passant capture took the pawn beside the end square
+        capture_square = end
+        if (entry >> 12) & 15 == EN_PASSANT:
+            capture_square = (start[0], end[1])
+        self.unmake_move((player, piece, start, end, promote,
+                          NAMES[(entry >> 20) & 15], capture_square,
+                          entry >> 24))
+        self.ply -= 1
+        return None
+
+    def redo(self):
+        '''
+        Plays again the last move taken back by undo. Returns "Illegal Move"
+        if there is no move to play again and None otherwise.
+        '''
+        if self.history is None or self.ply == len(self.history):
+            return "Illegal Move"
+        self.make_move(*self._entry_move(self.history[self.ply]))
+        self.ply += 1
+        return None
+
+    def goto(self, ply):
+        '''
+        Takes back moves or plays them again until ply moves of the history
+        have been made, one ply at a time. Returns "Illegal Move" if the
+        history doesn't reach ply and None otherwise.
+        '''
+        length = 0
+        if self.history is not None:
+            length = len(self.history)
+        if not 0 <= ply <= length:
+            return "Illegal Move"
+        while self.ply > ply:
+            self.undo()
+        while self.ply < ply:
+            self.redo()
+        return None
 
     def stalemate(self, player):
         '''
         Checks whether a player has no viable moves. Returns False
         if there are viable moves, returns True if there are no moves.
         '''
-        # Loop through all the pieces on the board and at every piece,
-        # check if there are any possible moves available to that piece.
-        # (Note castling is not possible if the king cannot move, so we
-        # don't need to check for that)
-        for r1 in range(8):
-            for f1 in range(8):
-                square = self.state[r1][f1]  # loop through all squares
-                if square != '':
-                    if square[0] == player:
-                        piece = square[1]  # check all of player's pieces
-                        for r2 in range(8):
-                            for f2 in range(8):
-                                # Check if piece can be moved anywhere on board
-                                if self.valid_move(player, piece, (r1, f1),
-                                                   (r2, f2)):
-                                    return False
+        # Stop at the first legal move the generator finds
+        for move in self.generate_legal_moves(player):
+            return False
         return True
 
 
-def main():
+class RepetitionTracker():
+    '''
+    Keeps the position keys (ChessBoard.key) of the game since the last
+    irreversible move, one per ply, with a count of how often each key has
+    been seen. A position can only come back through reversible moves, so
+    captures, pawn moves and castling clear the window. Adding a position
+    costs O(1).
+
+    Attributes:
+        keys: list of position keys since the last irreversible move
+        counts: dict from position key to times it appears in keys
+        windows: the keys lists of the earlier windows, oldest first
+
+    Methods:
+        add: records the position after a move and returns its count
+        undo: forgets the last position, when its move is taken back
+        count: returns how often the current position has occurred
+        threefold: checks if the current position has occurred three times
+    '''
+
+    def __init__(self, key):
+        # Starting position
+        self.keys = [key]
+        self.counts = {key: 1}
+
+        # Earlier windows are kept so that taking back an irreversible move
+        # can bring its window back
+        self.windows = []
+
+    def add(self, key, irreversible=False):
+        '''
+        Records the position key after a move and returns how many times the
+        position has now occurred. irreversible is True for captures, pawn
+        moves and castling, after which no earlier position can repeat.
+        '''
+        if irreversible == True:
+            self.windows.append(self.keys)
+            self.keys = []
+            self.counts = {}
+        self.keys.append(key)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return self.counts[key]
+
+    def undo(self):
+        '''
+        Forgets the last position added, when the move that led to it is
+        taken back. Taking back an irreversible move brings back the window
+        before it, with its counts worked out again.
+        '''
+        key = self.keys.pop()
+        self.counts[key] -= 1
+        if self.counts[key] == 0:
+            del self.counts[key]
+        if len(self.keys) == 0 and len(self.windows) > 0:
+            self.keys = self.windows.pop()
+            self.counts = {}
+            for key in self.keys:
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def count(self):
+        '''
+        Returns how many times the current (last added) position has occurred.
+        '''
+        return self.counts[self.keys[-1]]
+
+    def threefold(self):
+        '''
+        Checks if the current position has occurred at least three times,
+        which makes the game a draw (returns True) or not (returns False).
+        '''
+        return self.count() >= 3
+
+
+class AnsiBoard():
+    '''
+    Draws boards in a terminal with ANSI escape codes, keeping the board at
+    the top of the screen and redrawing only the squares that changed since
+    the last board it drew, so a move costs a few short writes instead of
+    the whole board. Text printed after a board appears below it.
+
+    Attributes:
+        shown: piece codes of the 64 squares on screen, None before the
+               first board is drawn
+
+    Methods:
+        draw: returns the text that brings the screen up to date with a board
+        show: writes that text to the console
+    '''
+
+    def __init__(self):
+        self.shown = None
+
+    def draw(self, board):
+        '''
+        Returns the text and escape codes that update the screen to show the
+        board: the whole board after clearing the screen the first time,
+        then only the changed squares, moving the cursor to each of them.
+        Ends with the cursor under the board and the rest of the screen
+        cleared.
+        '''
+        codes = b''.join([board._rank_codes(rank) for rank in range(8)])
+        if self.shown is None:
+            parts = ['\x1b[H\x1b[2J', str(board)]
+        else:
+            parts = []
+            for square in range(64):
+                if codes[square] != self.shown[square]:
+                    rank, file = divmod(square, 8)
+                    # A square is printed on the middle line of its rank,
+                    # after the three characters of the rank label
+                    parts.append(f'\x1b[{rank * 3 + 2};{file * 4 + 4}H')
+                    parts.append(
+                        SQUARE_GLYPHS[(rank + file) % 2][codes[square]])
+        self.shown = codes
+        parts.append(f'\x1b[{BOARD_LINES + 1};1H\x1b[J')
+        return ''.join(parts)
+
+    def show(self, board):
+        '''
+        Writes the update for the board to the console.
+        '''
+        print(self.draw(board), end='', flush=True)
+
+
+def _game_over(board, player, winner, repetitions):
+    # Prints what the last move did for the player now to move: checkmate
+    # (won by winner, 'white' or 'black'), stalemate, threefold repetition or
+    # check. Returns True if the game is over
+    if board.stalemate(player):
+        print()
+        if board.in_check(player):  # stalemate + check = checkmate
+            print(f"Checkmate! {winner.capitalize()} wins!")
+        else:
+            print("Stalemate! The game is a draw!")
+        return True
+
+    # Same position for the third time
+    if repetitions.threefold():
+        print()
+        print("Threefold repetition! The game is a draw!")
+        return True
+
+    # Alert the player if now in check
+    if board.in_check(player):
+        print()
+        if player == 'w':
+            print("White is in check!")
+        else:
+            print("Black is in check!")
+    return False
+
+
+def main(board_class=ChessBoard, computer=None, think_time=1000,
+         table_size=16, book=None, tablebases=None, ansi=False):
     '''
     Runs a chess game that operates through user input in the console. The
-    board is printed in the console. There is full functionality except for
-    draw by repetition of position (but this can be done by players offering
-    draws). main() is built on the ChessBoard class. The board state is stored
-    in the ChessBoard class as well as functions for editing the board state,
-    printing the board state, checking for valid moves, and checking for
-    stalemate. Pawn promotion is the only feature primarily executed in the
-    main() function because it is heavily reliant on user input and editing the
-    board state is only one line of code.
+    board is printed in the console. There is full functionality, including an
+    automatic draw by threefold repetition of position. main() is built on the
+    ChessBoard class. The board state is stored in the ChessBoard class as well
+    as functions for editing the board state, printing the board state,
+    checking for valid moves, and checking for stalemate. For pawn promotion,
+    main() only asks which piece to promote to because it is heavily reliant on
+    user input; the move method places the new piece. board_class picks the
+    board implementation, such as the bitboard backend in bitboard.py. computer
+    is the player ('w' or 'b') that the search engine in engine.py plays, with
+    think_time milliseconds per move and a transposition table of table_size
+    megabytes kept for the whole game; by default both players are human. book
+    is the path of an opening book file built by book.py: the book moves for
+    the position are shown on every turn, and the engine plays from the book
+    while it can. tablebases is the directory of the endgame tables built by
+    tablebase.py, used to show the exact result of the position when it is in
+    them. With ansi, the board stays at the top of the terminal and only the
+    squares that changed are redrawn after each move (see AnsiBoard).
     '''
 
     # Initialize game
     print("Welcome to Chess!\n")
-    board = ChessBoard()
-    print(board)
+    board = board_class()
+
+    # Print the whole board after every move, or redraw the changed squares
+    if ansi == True:
+        show = AnsiBoard().show
+    else:
+        show = print
+    show(board)
     print()
 
-    help = f"Enter a location of a piece in the form 'c4'.\nTo castle, enter 'castle'. To resign, enter 'resign'. To offer a draw, enter 'draw'.\nType 'help' to review the options.\n"
+    # Position keys since the last irreversible move, for threefold
+    # repetition
+    repetitions = RepetitionTracker(board.key())
+
+    help = ("Enter a location of a piece in the form 'c4'.\n"
+            "To castle, enter 'castle'. To resign, enter 'resign'. "
+            "To offer a draw, enter 'draw'.\n"
+            "To take back a move, enter 'undo'.\n"
+            "Type 'help' to review the options.\n")
     print(help)
 
+    # The engine and the book import this module, so they are only loaded
+    # when needed
+    if computer is not None:
+        from engine import Search, TranspositionTable, move_name
+        table = None
+        if table_size > 0:
+            table = TranspositionTable(table_size)
+    opening_book = None
+    if book is not None:
+        from book import OpeningBook
+        from engine import move_name
+        opening_book = OpeningBook(book)
+    endgames = None
+    if tablebases is not None:
+        from tablebase import Tablebases
+        endgames = Tablebases(tablebases)
+
     player = 'w'
     while True:
         # Have variables for the full word and the notation
@@ -815,6 +1931,68 @@ def main():
         else:
             turn = 'black'
 
+        # Computer's turn: search for a move and play it
+        if player == computer:
+            print()
+            print(f"{turn.capitalize()} is thinking...")
+            # Play from the opening book while the position is in it
+            move = None
+            if opening_book is not None:
+                move = opening_book.choose(board)
+            if move is None:
+                move = Search(board, table).search(player, think_time)['move']
+            piece, start, end, promote = move
+            print(f"{turn.capitalize()} plays {move_name(move)}.")
+
+            # Captures, pawn moves and castling can't be undone
+            irreversible = (piece == 'p'
+                            or board.state[end[0]][end[1]] != '')
+            if piece == 'k' and abs(end[1] - start[1]) == 2:  # castling
+                irreversible = True
+                if end[1] == 6:
+                    board.castle(player, 'k')
+                else:
+                    board.castle(player, 'q')
+            else:
+                board.move(player, piece, start, end, promote)
+            print()
+            show(board)
+            repetitions.add(board.key(), irreversible)
+
+            # Change players for next turn
+            if player == 'w':
+                player = 'b'
+            else:
+                player = 'w'
+            if _game_over(board, player, turn, repetitions):
+                break
+            continue
+
+        # Show what the opening book plays here, with how often
+        if opening_book is not None:
+            found = opening_book.moves(board)
+            if found:
+                total = sum(weight for move, weight in found)
+                names = [
+                    f"{move_name(move)} ({round(100 * weight / total)}%)"
+                    for move, weight in found
+                ]
+                print()
+                print(f"Book moves: {', '.join(names)}")
+
+        # Show the exact result of the endgame, with the moves to mate
+        if endgames is not None:
+            result = endgames.probe(board)
+            if result is not None:
+                print()
+                if result[0] == 'draw':
+                    print("Tablebase: the position is a draw.")
+                elif result[0] == 'win':
+                    print(f"Tablebase: {turn} mates in "
+                          f"{(result[1] + 1) // 2}.")
+                else:
+                    print(f"Tablebase: {turn} is mated in {result[1] // 2}.")
+
         # Take input
         print()
         start = input(
@@ -822,7 +2000,8 @@ def main():
         start = start.strip().lower()
 
         # Check if input is valid
-        while (start not in ['resign', 'draw', 'castle']) or start == 'help':
+        while (start not in ['resign', 'draw', 'castle', 'undo']
+               or start == 'help'):
             # Check for valid regular move
             if len(start) == 2:
                 if (start[0] in ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'] and
@@ -866,6 +2045,20 @@ def main():
                 break
             else:
                 pass
+        elif start == 'undo':  # take back a move
+            # Against the computer, its reply is taken back as well so that
+            # it is the player's turn again
+            plies = 1
+            if computer is not None:
+                plies = 2
+            if board.ply < plies:
+                print("There is no move to take back.")
+            else:
+                for ply in range(plies):
+                    board.undo()
+                    repetitions.undo()
+                player = board.turn
+                show(board)
         elif start == 'castle':  # player attempts to castle
             # Grab input for which side to castle on
             side = input("Which side to castle on? [king/queen]: ")
@@ -891,33 +2084,18 @@ def main():
                 print("Illegal move. Please try again.")
             else:  # succeeds
                 print()
-                print(board)
+                show(board)
+
+                # Castling can never be undone, so it starts a new window
+                repetitions.add(board.key(), True)
 
                 # Switch players for next turn
                 if player == 'w':
                     player = 'b'
                 else:
                     player = 'w'
-
-                # Check if position is now stalemate for the next player
-                if board.stalemate(player):
-                    if board.in_check(player):  # stalemate + check = checkmate
-                        print()
-                        print(f"Checkmate! {turn.capitalize()} wins!")
-                        break
-                    else:
-                        print()
-                        print("Stalemate! The game is a draw!")
-                        break
-
-                # Check if the next player is now in check and alert them if so
-                if board.in_check(player):
-                    if player == 'w':
-                        print()
-                        print("White is in check!")
-                    else:
-                        print()
-                        print("Black is in check!")
+                if _game_over(board, player, turn, repetitions):
+                    break
         else:  # player attempts a regular move
             # Convert locations to index notation
             letter_to_num = {
@@ -959,77 +2137,62 @@ def main():
                     # Convert to notation
                     end = (8 - int(end[1]), letter_to_num[end[0]])
 
+                    # Pawn promotion: ask which piece to promote to before
+                    # making the move, so the move method can place it
+                    promote = 'q'
+                    if piece == 'p' and board.valid_move(player, piece, start,
+                                                         end):
+                        if ((player == 'w' and end[0] == 0)
+                                or (player == 'b' and end[0] == 7)):
+                            # Get input
+                            print()
+                            promote = input(
+                                "Promote the pawn [queen/rook/bishop/knight]: "
+                            )
+                            promote = promote.strip().lower()
+
+                            # Check if input is valid
+                            while promote not in [
+                                    'queen', 'rook', 'bishop', 'knight'
+                            ]:
+                                print()
+                                promote = input(
+                                    "Please enter either 'queen', 'rook', 'bishop', or 'knight': "
+                                )
+                                promote = promote.strip().lower()
+
+                            # Convert to notation
+                            if promote == 'queen':
+                                promote = 'q'
+                            elif promote == 'bishop':
+                                promote = 'b'
+                            elif promote == 'rook':
+                                promote = 'r'
+                            else:
+                                promote = 'n'
+
+                    # Captures and pawn moves can't be undone, so no earlier
+                    # position can repeat after them
+                    irreversible = (piece == 'p'
+                                    or board.state[end[0]][end[1]] != '')
+
                     # Attempt to move the piece
-                    move = board.move(player, piece, start, end)
+                    move = board.move(player, piece, start, end, promote)
                     if move == "Illegal Move":  # illegal -> loop through turn
                         print()
                         print("Illegal move. Please try again.")
                     else:  # succeeds
                         print()
-                        print(board)
-
-                        # Pawn promotion
-                        if piece == 'p':
-                            if ((player == 'w' and end[0] == 0)
-                                    or (player == 'b' and end[0] == 7)):
-                                # Get input
-                                print()
-                                promote = input(
-                                    "Promote the pawn [queen/rook/bishop/knight]: "
-                                )
-                                promote = promote.strip().lower()
-
-                                # Check if input is valid
-                                while promote not in [
-                                        'queen', 'rook', 'bishop', 'knight'
-                                ]:
-                                    print()
-                                    promote = input(
-                                        "Please enter either 'queen', 'rook', 'bishop', or 'knight': "
-                                    )
-                                    promote = promote.strip().lower()
-
-                                # Convert to notation
-                                if promote == 'queen':
-                                    promote = 'q'
-                                elif promote == 'bishop':
-                                    promote = 'b'
-                                elif promote == 'rook':
-                                    promote = 'r'
-                                else:
-                                    promote = 'n'
-
-                                # Change board to reflect the promotion
-                                board.state[end[0]][
-                                    end[1]] = f'{player}{promote}'
-                                print()
-                                print(board)
+                        show(board)
+                        repetitions.add(board.key(), irreversible)
 
                         # Change players for next turn
                         if player == 'w':
                             player = 'b'
                         else:
                             player = 'w'
-
-                        # Check if new player now in stalemate
-                        if board.stalemate(player):
-                            if board.in_check(player):  # checkmate
-                                print()
-                                print(f"Checkmate! {turn.capitalize()} wins!")
-                                break
-                            else:
-                                print()
-                                print("Stalemate! The game is a draw!")
-                                break
-
-                        # New player now in check
-                        if board.in_check(player):
-                            if player == 'w':
-                                print()
-                                print("White is in check!")
-                            else:
-                                print()
-                                print("Black is in check!")
+                        if _game_over(board, player, turn, repetitions):
+                            break
                 else: # player's piece not on square, loop through turn again
                     print(
                         "You don't have a piece on this square. Please try again.")
@@ -1039,4 +2202,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(ansi='--ansi' in sys.argv[1:])
@@ -0,0 +1,634 @@
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import chess32
+from chess32 import ChessBoard, PIECE_VALUES, main as play
+from bitboard import BitChessBoard
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+# Score for giving checkmate. Mates further from the root score a little less
+# so that the search prefers the quickest mate
+MATE = 100000
+
+# Kinds of score stored in the transposition table: the exact score, a lower
+# bound (the search was cut off by beta) or an upper bound (no move reached
+# alpha)
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+def is_capture(board, move):
+    '''
+    Checks whether a move tuple (piece, start, end, promote) captures a
+    piece (returns True), including en passant, or not (returns False).
+    '''
+    piece, start, end, promote = move
+    if board.piece_on(end[0] * 8 + end[1]) != '':
+        return True
+    # A pawn moving diagonally to an empty square captures en passant
+    return piece == 'p' and start[1] != end[1]
+
+
+def order_moves(board, moves, first=None):
+    '''
+    Sorts moves so the search tries the likely best ones first: the move
+    first (from the previous iteration's principal variation), then captures
+    of the most valuable victim by the least valuable attacker (MVV-LVA),
+    then promotions, then quiet moves.
+    '''
+    def priority(move):
+        if move == first:
+            return 100000
+        piece, start, end, promote = move
+        score = 0
+        if is_capture(board, move):
+            victim = board.piece_on(end[0] * 8 + end[1])
+            if victim == '':  # en passant
+                victim = 'p'
+            else:
+                victim = victim[1]
+            score += (10000 + 10 * PIECE_VALUES[victim]
+                      - PIECE_VALUES[piece])
+        if promote is not None:
+            score += 5000 + PIECE_VALUES[promote]
+        return score
+
+    return sorted(moves, key=priority, reverse=True)
+
+
+def move_name(move):
+    '''
+    Returns a move tuple (piece, start, end, promote) in UCI notation, such
+    as 'e2e4' or 'e7e8q'.
+    '''
+    piece, start, end, promote = move
+    name = (f"{'abcdefgh'[start[1]]}{8 - start[0]}"
+            f"{'abcdefgh'[end[1]]}{8 - end[0]}")
+    if promote is not None:
+        name += promote
+    return name
+
+
+class TranspositionTable():
+    '''
+    Fixed size table of search results keyed by the 64-bit Zobrist key of a
+    position (ChessBoard.key), so a position reached again through another
+    move order doesn't have to be searched again. The entries live in flat
+    arrays allocated once for the megabyte budget and never grow. Each
+    bucket has two entries: the first keeps the deepest result stored for
+    it and the second is replaced on every store. Methods include:
+
+    probe(key) : Returns (depth, value, bound, move) stored for the position,
+                 or None
+
+    store(key, depth, value, bound, move) : Records the result of searching
+                                            the position to depth
+
+    clear() : Empties the table and resets the statistics
+
+    stats() : Returns a dict of the size, fill and hit, miss and collision
+              counts of the table
+    '''
+    def __init__(self, megabytes=16):
+        # One array per field of an entry: the position key, the score (or
+        # perft count), the best move packed into 16 bits (see
+        # chess32.encode_move, 0 for none), and the depth and bound packed as
+        # ((depth + 1) << 2) | bound, where 0 marks an empty entry
+        entry_bytes = 8 + 8 + 2 + 2
+        buckets = max(1, int(megabytes * 1024 * 1024) // (2 * entry_bytes))
+        self.buckets = buckets
+        self.keys = array('Q', bytes(8 * 2 * buckets))
+        self.values = array('q', bytes(8 * 2 * buckets))
+        self.moves = array('H', bytes(2 * 2 * buckets))
+        self.info = array('H', bytes(2 * 2 * buckets))
+        self.clear()
+
+    def clear(self):
+        '''
+        Empties every entry and resets the statistics.
+        '''
+        for field in [self.keys, self.values, self.moves, self.info]:
+            field[:] = array(field.typecode, bytes(len(field) * field.itemsize))
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # misses where the bucket held other positions
+        self.replaced = 0  # stores that overwrote another position
+
+    def probe(self, key):
+        '''
+        Returns (depth, value, bound, move) stored for the position key, with
+        move as a 16-bit packed move (0 for none), or returns None if the
+        position isn't in the table.
+        '''
+        index = (key % self.buckets) * 2
+        for slot in [index, index + 1]:
+            if self.keys[slot] == key and self.info[slot] != 0:
+                self.hits += 1
+                info = self.info[slot]
+                return ((info >> 2) - 1, self.values[slot], info & 3,
+                        self.moves[slot])
+        self.misses += 1
+        if self.info[index] != 0 or self.info[index + 1] != 0:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, value, bound, move=0):
+        '''
+        Records the result of searching the position key to depth: its value
+        (a score, or a node count for perft), the bound type (EXACT, LOWER or
+        UPPER) and the best move packed into 16 bits (board.pack_move), or 0
+        for none. The first entry of the bucket is only replaced by a result
+        at least as deep, or for the same position; otherwise the second
+        entry is replaced.
+        '''
+        index = (key % self.buckets) * 2
+        info = self.info[index]
+        if (info == 0 or self.keys[index] == key
+                or depth >= (info >> 2) - 1):
+            slot = index
+        else:
+            slot = index + 1
+            info = self.info[slot]
+        if info == 0:
+            self.used += 1
+        elif self.keys[slot] != key:
+            self.replaced += 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.moves[slot] = move
+        self.info[slot] = ((depth + 1) << 2) | bound
+
+    def stats(self):
+        '''
+        Returns a dict with the number of entries, the megabytes they take,
+        the fraction in use, and the hit, miss, collision and replacement
+        counts since the table was created or cleared.
+        '''
+        entries = len(self.keys)
+        size = sum(len(field) * field.itemsize for field in
+                   [self.keys, self.values, self.moves, self.info])
+        return {
+            'entries': entries,
+            'megabytes': round(size / (1024 * 1024), 2),
+            'filled': round(self.used / entries, 4),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'replaced': self.replaced
+        }
+
+
+class Search():
+    '''
+    Searches a ChessBoard position for the best move using negamax with
+    alpha-beta pruning, iterative deepening and a quiescence search of
+    captures at the leaves. Results are shared between move orders (and
+    between searches) through an optional TranspositionTable. The board is
+    changed with make_move and unmake_move during the search and is left as
+    it was. Methods include:
+
+    search(player, time_ms, max_depth) : Returns the best move found within
+                                         the time limit with its principal
+                                         variation, score and search speed
+
+    negamax(player, depth, alpha, beta, ply, hint) : Returns the score of the
+                                                     position and the best
+                                                     line from it
+
+    quiescence(player, alpha, beta, ply) : Returns the score of the position
+                                           once captures have been played
+                                           out
+    '''
+    def __init__(self, board, table=None):
+        self.board = board
+        self.table = table
+
+        # Keep count of the positions visited by the current search
+        self.nodes = 0
+
+        # Time (from time.perf_counter) at which the search must stop, and
+        # whether it has stopped. An unfinished iteration is thrown away
+        self.deadline = None
+        self.stopped = False
+
+    def search(self, player=None, time_ms=1000, max_depth=64):
+        '''
+        Searches the position for player (the side to move by default) one
+        depth at a time until time_ms milliseconds have passed or max_depth
+        is reached. Returns a dict with the best move, the principal
+        variation, its score in centipawns, the last completed depth, the
+        nodes searched and nodes per second. The move is None if the player
+        has no legal moves.
+        '''
+        board = self.board
+        if player is None:
+            player = board.turn
+        start = time.perf_counter()
+        self.deadline = start + time_ms / 1000
+        self.stopped = False
+        self.nodes = 0
+
+        # Fall back to the first ordered move if not even depth 1 finishes
+        moves = order_moves(board, list(board.generate_legal_moves(player)))
+        pv = moves[:1]
+        score = None
+        depth = 0
+        for iteration in range(1, max_depth + 1):
+            value, line = self.negamax(player, iteration, -MATE - 1, MATE + 1,
+                                       0, pv)
+            if self.stopped or not line:
+                break
+            pv = line
+            score = value
+            depth = iteration
+            # A forced mate can't be improved on by searching deeper
+            if abs(score) > MATE - 1000:
+                break
+
+        seconds = time.perf_counter() - start
+        return {
+            'move': pv[0] if pv else None,
+            'pv': pv,
+            'score': score,
+            'depth': depth,
+            'nodes': self.nodes,
+            'seconds': round(seconds, 6),
+            'nps': round(self.nodes / seconds) if seconds > 0 else None,
+            'table': self.table.stats() if self.table is not None else None
+        }
+
+    def _out_of_time(self):
+        # Count the node and check the clock
+        self.nodes += 1
+        if time.perf_counter() >= self.deadline:
+            self.stopped = True
+        return self.stopped
+
+    def negamax(self, player, depth, alpha, beta, ply, hint):
+        '''
+        Returns (score, line): the score of the position for player searched
+        to depth plies, within the window alpha to beta, and the best line of
+        moves from it. ply is the distance from the root, used to score
+        mates, and hint is the previous iteration's best line from this
+        position (empty when the position is off that line).
+        '''
+        if self._out_of_time():
+            return 0, []
+        if depth == 0:
+            return self.quiescence(player, alpha, beta, ply), []
+
+        board = self.board
+        table = self.table
+        first = None
+        if hint:
+            first = hint[0]
+        elif table is not None:
+            entry = table.probe(board.key())
+            if entry is not None:
+                entry_depth, score, bound, code = entry
+                move = None
+                if code != 0:
+                    move = board.unpack_move(code)
+                # Mate scores are stored from the position, not the root
+                if score > MATE - 1000:
+                    score -= ply
+                elif score < -MATE + 1000:
+                    score += ply
+                # A deep enough result settles the position, except at the
+                # root where a whole line is needed
+                if entry_depth >= depth and ply > 0 and (
+                        bound == EXACT or (bound == LOWER and score >= beta)
+                        or (bound == UPPER and score <= alpha)):
+                    if bound == LOWER:
+                        return beta, []
+                    if bound == UPPER:
+                        return alpha, []
+                    return score, [move]
+                first = move
+
+        moves = list(board.generate_legal_moves(player))
+        if not moves:
+            if board.in_check(player):  # checkmate
+                return -MATE + ply, []
+            return 0, []  # stalemate
+
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+
+        start_alpha = alpha
+        line = []
+        for move in order_moves(board, moves, first):
+            # Follow the hint down the line it came from
+            if move == first:
+                child_hint = hint[1:]
+            else:
+                child_hint = []
+            undo = board.make_move(player, *move)
+            score, child_line = self.negamax(enemy, depth - 1, -beta, -alpha,
+                                             ply + 1, child_hint)
+            board.unmake_move(undo)
+            if self.stopped:
+                return 0, []
+            score = -score
+            if score > alpha:
+                alpha = score
+                line = [move] + child_line
+                if alpha >= beta:  # the opponent won't allow this position
+                    break
+
+        if table is not None:
+            if alpha >= beta:
+                bound = LOWER
+            elif alpha > start_alpha:
+                bound = EXACT
+            else:
+                bound = UPPER
+            score = alpha
+            if score > MATE - 1000:
+                score += ply
+            elif score < -MATE + 1000:
+                score -= ply
+            best = 0
+            if line:
+                best = board.pack_move(*line[0])
+            table.store(board.key(), depth, score, bound, best)
+        return alpha, line
+
+    def quiescence(self, player, alpha, beta, ply=0):
+        '''
+        Returns the score of the position for player within the window alpha
+        to beta, searching only captures and promotions until the position
+        is quiet, so the evaluation isn't taken in the middle of an exchange.
+        The player may also stand pat on the current evaluation, except when
+        in check, where every move out of check is searched instead. ply is
+        the distance from the root, used to score mates.
+        '''
+        if self._out_of_time():
+            return 0
+
+        board = self.board
+        if board.in_check(player):
+            moves = list(board.generate_legal_moves(player))
+            if not moves:  # checkmate
+                return -MATE + ply
+        else:
+            stand_pat = board.evaluate(player)
+            if stand_pat >= beta:
+                return beta
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = list(board.generate_captures(player))
+
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+
+        for move in order_moves(board, moves):
+            undo = board.make_move(player, *move)
+            score = -self.quiescence(enemy, -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+
+def search_root_moves(fen, board_class, moves, depth, hint, seconds=None):
+    '''
+    Searches each of the given root moves of the position in fen to depth
+    plies on a board of its own, trying the line hint (the best line of the
+    previous iteration) first where it applies. Runs in the worker processes
+    of best_move. Returns (nodes searched, whether the time ran out, list of
+    (score, line) for the moves searched). A score is exact for a move that
+    improved on the ones before it and an upper bound otherwise.
+    '''
+    board = board_class.from_fen(fen)
+    search = Search(board)
+    search.deadline = float('inf')
+    if seconds is not None:
+        search.deadline = time.perf_counter() + seconds
+    player = board.turn
+    if player == 'w':
+        enemy = 'b'
+    else:
+        enemy = 'w'
+
+    alpha = -MATE - 1
+    results = []
+    for move in moves:
+        child_hint = []
+        if hint and move == hint[0]:
+            child_hint = hint[1:]
+        undo = board.make_move(player, *move)
+        score, line = search.negamax(enemy, depth - 1, -MATE - 1, -alpha, 1,
+                                     child_hint)
+        board.unmake_move(undo)
+        if search.stopped:
+            return search.nodes, True, results
+        score = -score
+        results.append((score, [move] + line))
+        if score > alpha:
+            alpha = score
+    return search.nodes, False, results
+
+
+def best_move(board, player=None, depth=4, workers=None, time_ms=None,
+              pool=None):
+    '''
+    Finds the best move for player (the side to move by default) by
+    searching to depth plies one iteration at a time, with the root moves
+    shared out across workers processes (one per core by default). Each
+    worker searches its share on its own copy of the board. After each
+    iteration the root moves are sorted by score and the best line is sent
+    to the workers as the move ordering hint for the next one. With time_ms
+    the search stops when the time runs out and the last completed iteration
+    is used. pool is a ProcessPoolExecutor already started by the caller to
+    search in, which is left running; by default one is started for the
+    search and shut down after it. Returns a dict like Search.search, with
+    the number of workers.
+    '''
+    if player is None:
+        player = board.turn
+    if workers is None:
+        workers = os.cpu_count()
+    start = time.perf_counter()
+    deadline = None
+    if time_ms is not None:
+        deadline = start + time_ms / 1000
+
+    # The workers rebuild the position from FEN, with player to move
+    fields = board.to_fen().split()
+    fields[1] = player
+    fen = ' '.join(fields)
+
+    moves = order_moves(board, list(board.generate_legal_moves(player)))
+    pv = moves[:1]
+    score = None
+    completed = 0
+    nodes = 0
+    own_pool = None
+    if workers <= 1 or len(moves) <= 1:
+        pool = None
+    elif pool is None:
+        own_pool = pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for iteration in range(1, depth + 1):
+            if not moves:
+                break
+            seconds = None
+            if deadline is not None:
+                seconds = deadline - time.perf_counter()
+                if seconds <= 0:
+                    break
+
+            # Deal the sorted moves out in turn, so that every worker gets
+            # a mix of likely good and likely bad moves
+            shares = [moves[i::workers] for i in range(workers)]
+            shares = [share for share in shares if share]
+            if pool is None:
+                outputs = [
+                    search_root_moves(fen, type(board), moves, iteration, pv,
+                                      seconds)
+                ]
+            else:
+                futures = [
+                    pool.submit(search_root_moves, fen, type(board), share,
+                                iteration, pv, seconds) for share in shares
+                ]
+                outputs = [future.result() for future in futures]
+
+            nodes += sum(output[0] for output in outputs)
+            if any(output[1] for output in outputs):  # out of time
+                break
+
+            # Combine the workers' lines. Sorting is stable, so the first
+            # line with the top score is an exact score, not a bound
+            scored = [line for output in outputs for line in output[2]]
+            scored.sort(key=lambda line: line[0], reverse=True)
+            score, pv = scored[0]
+            moves = [line[1][0] for line in scored]
+            completed = iteration
+            # A forced mate can't be improved on by searching deeper
+            if abs(score) > MATE - 1000:
+                break
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+    seconds = time.perf_counter() - start
+    return {
+        'move': pv[0] if pv else None,
+        'pv': pv,
+        'score': score,
+        'depth': completed,
+        'nodes': nodes,
+        'seconds': round(seconds, 6),
+        'nps': round(nodes / seconds) if seconds > 0 else None,
+        'workers': workers
+    }
+
+
+def main(argv=None):
+    '''
+    Command line entry point: prints the engine's best move for a position
+    as a JSON object, or with --play starts a game in the console against
+    the engine. With --workers the root moves are searched across several
+    processes, and --speedup compares that with one process at the same
+    depth.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Search a position for the best move, or play against '
+        'the engine.')
+    parser.add_argument('--fen', help='position to search (default start)')
+    parser.add_argument('--time', type=int, default=1000,
+                        help='time limit per move in milliseconds '
+                        '(default 1000)')
+    parser.add_argument('--depth', type=int,
+                        help='maximum search depth in plies (default 64, or '
+                        '4 with --speedup)')
+    parser.add_argument('--hash', type=float, default=16,
+                        help='transposition table size in megabytes '
+                        '(default 16, 0 for none)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default='chess32', help='board implementation')
+    parser.add_argument('--play', choices=['white', 'black'],
+                        help='play a game as this colour against the engine')
+    parser.add_argument('--tablebases',
+                        help='directory of endgame tables to show results '
+                        'from during --play')
+    parser.add_argument('--debug-eval', action='store_true',
+                        help='check every evaluation against a full recount '
+                        'of the scores (slow)')
+    parser.add_argument('--ansi', action='store_true',
+                        help='during --play, keep the board at the top of '
+                        'the terminal and redraw only the changed squares')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to split the root moves across, 0 '
+                        'for one per core (default 1)')
+    parser.add_argument('--speedup', action='store_true',
+                        help='search to --depth with no time limit using '
+                        '--workers and using one process, and report the '
+                        'speedup')
+    args = parser.parse_args(argv)
+    chess32.DEBUG_EVALUATION = args.debug_eval
+    workers = args.workers
+    if workers == 0:
+        workers = os.cpu_count()
+    depth = args.depth
+    if depth is None:
+        depth = 4 if args.speedup else 64
+
+    board_class = BACKENDS[args.backend]
+    if args.play is not None:
+        # The engine takes the other colour
+        if args.play == 'white':
+            computer = 'b'
+        else:
+            computer = 'w'
+        play(board_class, computer, args.time, args.hash,
+             tablebases=args.tablebases, ansi=args.ansi)
+        return 0
+
+    if args.fen is None:
+        board = board_class()
+    else:
+        board = board_class.from_fen(args.fen)
+    if args.speedup:
+        # Time only the searches: the worker processes are started, and
+        # import this module, in a depth 1 search before the timed one
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            best_move(board, board.turn, 1, workers, pool=pool)
+            result = best_move(board, board.turn, depth, workers, pool=pool)
+        serial = best_move(board, board.turn, depth, 1)
+        result['serial_seconds'] = serial['seconds']
+        result['speedup'] = round(serial['seconds'] / result['seconds'], 2)
+    elif workers > 1:
+        result = best_move(board, board.turn, depth, workers, args.time)
+    else:
+        table = None
+        if args.hash > 0:
+            table = TranspositionTable(args.hash)
+        result = Search(board, table).search(board.turn, args.time, depth)
+    if result['move'] is not None:
+        result['move'] = move_name(result['move'])
+    result['pv'] = [move_name(move) for move in result['pv']]
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import argparse
+import copy
+import json
+import sys
+import time
+import tracemalloc
+
+from chess32 import ChessBoard
+from bitboard import BitChessBoard
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+# Positions to measure: the start and a middlegame with every kind of piece
+POSITIONS = {
+    'start': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'middlegame': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/'
+                   'R4RK1 w - - 0 10')
+}
+
+
+def load(board_class, fen, printed=False):
+    '''
+    Returns a board loaded from fen that has built its state view, as a
+    board in use usually has. With printed, the board has also been printed
+    once, which keeps the text of each rank for the next print.
+    '''
+    board = board_class.from_fen(fen)
+    board.state
+    if printed:
+        str(board)
+    return board
+
+
+def footprint(board_class, fen, count=2000, printed=False):
+    '''
+    Returns the average number of bytes held by each of count boards loaded
+    with load, as measured by tracemalloc. The boards are kept alive until
+    the measurement is taken, so this is what holding that many boards in
+    memory costs.
+    '''
+    # Load one board first, so anything created only once is left out
+    load(board_class, fen, printed)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    boards = [load(board_class, fen, printed) for number in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del boards
+    return size / count
+
+
+def copy_time(function, board, count=2000):
+    '''
+    Returns the average time in microseconds for function(board) to copy the
+    board.
+    '''
+    start = time.perf_counter()
+    for number in range(count):
+        function(board)
+    return (time.perf_counter() - start) / count * 1000000
+
+
+def measure(board_class, fen, count=2000):
+    '''
+    Returns a dict with the bytes per board, loaded and once printed, and
+    the microseconds per board.copy() and copy.deepcopy(board) for the
+    position in fen.
+    '''
+    board = load(board_class, fen)
+    return {
+        'bytes_per_board': round(footprint(board_class, fen, count)),
+        'printed_bytes_per_board': round(
+            footprint(board_class, fen, count, True)),
+        'copy_us': round(copy_time(board_class.copy, board, count), 2),
+        'deepcopy_us': round(copy_time(copy.deepcopy, board, count), 2)
+    }
+
+
+def main(argv=None):
+    '''
+    Command line entry point: prints one JSON object per backend and
+    position with its memory footprint and copy speed.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Memory footprint and copy speed of the boards.')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), action='append',
+                        help='only measure this board (repeatable)')
+    parser.add_argument('--count', type=int, default=2000,
+                        help='boards to copy for each measurement')
+    args = parser.parse_args(argv)
+
+    backends = args.backend or sorted(BACKENDS)
+    for backend in backends:
+        for name, fen in POSITIONS.items():
+            result = {'backend': backend, 'position': name}
+            result.update(measure(BACKENDS[backend], fen, args.count))
+            print(json.dumps(result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import argparse
+import json
+import sys
+import time
+
+from chess32 import ChessBoard
+from bitboard import BitChessBoard
+from engine import TranspositionTable, EXACT
+
+# Reference positions with their known perft node counts by depth. The
+# counts are the published values for these positions, so any difference
+# means a bug in the move rules
+POSITIONS = [
+    {
+        'name': 'start',
+        'fen': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+        'nodes': [20, 400, 8902, 197281, 4865609],
+        'depth': 3
+    },
+    {
+        # Castling, pins and captures of rooks on their home squares
+        'name': 'kiwipete',
+        'fen': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w '
+                'KQkq - 0 1'),
+        'nodes': [48, 2039, 97862, 4085603],
+        'depth': 2
+    },
+    {
+        # En passant captures that uncover a check along the rank
+        'name': 'enpassant',
+        'fen': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        'nodes': [14, 191, 2812, 43238, 674624],
+        'depth': 4
+    },
+    {
+        # Promotions, including capturing promotions with check
+        'name': 'promotion',
+        'fen': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - '
+                '0 1'),
+        'nodes': [6, 264, 9467, 422333],
+        'depth': 3
+    },
+    {
+        'name': 'promotion-check',
+        'fen': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        'nodes': [44, 1486, 62379, 2103487],
+        'depth': 2
+    },
+    {
+        'name': 'middlegame',
+        'fen': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 '
+                'w - - 0 10'),
+        'nodes': [46, 2079, 89890, 3894594],
+        'depth': 2
+    }
+]
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+
+def perft(board, depth, table=None):
+    '''
+    Counts the leaf nodes of the move tree of the given depth from the
+    board's position, with the side to move taken from board.turn. The
+    board is left as it was. With a TranspositionTable, the count below a
+    position reached again through another move order is looked up
+    instead of counted again.
+    '''
+    if depth == 0:
+        return 1
+    if table is not None and depth > 1:
+        entry = table.probe(board.key())
+        if entry is not None and entry[0] == depth:
+            return entry[1]
+
+    player = board.turn
+    moves = list(board.generate_legal_moves(player))
+    # The last ply only needs to be counted, not played
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = board.make_move(player, *move)
+        nodes += perft(board, depth - 1, table)
+        board.unmake_move(undo)
+
+    if table is not None:
+        table.store(board.key(), depth, nodes, EXACT)
+    return nodes
+
+
+def divide(board, depth):
+    '''
+    Returns a dict from each legal move to the perft count below it, which
+    helps find the move where a wrong count comes from.
+    '''
+    player = board.turn
+    counts = {}
+    for move in list(board.generate_legal_moves(player)):
+        undo = board.make_move(player, *move)
+        counts[move] = perft(board, depth - 1)
+        board.unmake_move(undo)
+    return counts
+
+
+def run(positions, board_class, depth=None, table=None):
+    '''
+    Runs perft on every position up to its default depth (or the given
+    depth, capped at the deepest known count) and yields one result dict
+    per position and depth. The table, if given, is cleared before each
+    position and its statistics are added to the results.
+    '''
+    for position in positions:
+        board = board_class.from_fen(position['fen'])
+        max_depth = position['depth']
+        if depth is not None:
+            max_depth = min(depth, len(position['nodes']))
+        if table is not None:
+            table.clear()
+        for ply in range(1, max_depth + 1):
+            start = time.perf_counter()
+            nodes = perft(board, ply, table)
+            seconds = time.perf_counter() - start
+            expected = position['nodes'][ply - 1]
+            result = {
+                'position': position['name'],
+                'depth': ply,
+                'nodes': nodes,
+                'expected': expected,
+                'ok': nodes == expected,
+                'seconds': round(seconds, 6),
+                'nps': round(nodes / seconds) if seconds > 0 else None
+            }
+            if table is not None:
+                result['table'] = table.stats()
+            yield result
+
+
+def main(argv=None):
+    '''
+    Command line harness: runs the reference positions, prints one JSON
+    object per result (or a table with --table) and exits with status 1 if
+    any count is wrong.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Perft correctness and speed check for the move rules.')
+    parser.add_argument('--depth', type=int,
+                        help='depth to search every position to')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default='chess32', help='board implementation')
+    parser.add_argument('--position', action='append',
+                        help='only run the named position (repeatable)')
+    parser.add_argument('--hash', type=float, default=0,
+                        help='transposition table size in megabytes for '
+                        'looking up repeated positions (default 0, none)')
+    parser.add_argument('--table', action='store_true',
+                        help='print a readable table instead of JSON lines')
+    args = parser.parse_args(argv)
+
+    positions = POSITIONS
+    if args.position:
+        positions = [p for p in POSITIONS if p['name'] in args.position]
+
+    failed = False
+    total_nodes = 0
+    total_seconds = 0
+    table = None
+    if args.hash > 0:
+        table = TranspositionTable(args.hash)
+    for result in run(positions, BACKENDS[args.backend], args.depth, table):
+        result['backend'] = args.backend
+        failed = failed or not result['ok']
+        total_nodes += result['nodes']
+        total_seconds += result['seconds']
+        if args.table:
+            status = 'ok' if result['ok'] else f"FAIL (expected {result['expected']})"
+            print(f"{result['position']:<16}{result['depth']:>3}"
+                  f"{result['nodes']:>10}{result['nps'] or 0:>10} nps  "
+                  f"{status}")
+        else:
+            print(json.dumps(result), flush=True)
+
+    summary = {
+        'backend': args.backend,
+        'nodes': total_nodes,
+        'seconds': round(total_seconds, 6),
+        'nps': round(total_nodes / total_seconds) if total_seconds else None,
+        'ok': not failed
+    }
+    if args.table:
+        print(f"total {total_nodes} nodes, {summary['nps']} nps, "
+              f"{'ok' if not failed else 'FAILED'}")
+    else:
+        print(json.dumps(summary))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+import argparse
+import collections
+import fileinput
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess32 import ChessBoard
+from bitboard import BitChessBoard
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+# Tokens that end a game in PGN movetext
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+
+# A PGN tag pair such as [White "Carlsen, Magnus"]
+TAG = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+
+# The next token of PGN movetext: the start of a comment or variation, a
+# numeric annotation, or a run of other characters (moves, move numbers)
+TOKEN = re.compile(r'\s*(\{|;|\(|\)|\$\d+|[^\s{;()$]+)')
+MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+# Standard algebraic notation: piece, disambiguating file and rank, target
+# square and promotion piece. Check marks and annotations are stripped first
+SAN = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$')
+UCI = re.compile(r'^([a-h][1-8])([a-h][1-8])([qrbn])?$')
+
+
+def square(name):
+    '''
+    Converts a square name such as 'e4' to a (rank, file) location on the
+    board state.
+    '''
+    return (8 - int(name[1]), ord(name[0]) - ord('a'))
+
+
+def read_pgn(lines):
+    '''
+    Reads PGN text from an iterable of lines and yields one game at a time as
+    a dict with its tags, its list of moves in SAN and its result token.
+    Comments, variations and numeric annotations are skipped. Only the game
+    being read is held in memory.
+    '''
+    tags = {}
+    moves = []
+    comment = False  # inside a {comment}, which can span lines
+    depth = 0  # nesting of (variations), whose moves are skipped
+    for line in lines:
+        if line.startswith('%'):  # escaped line
+            continue
+        if not comment and depth == 0 and line.lstrip().startswith('['):
+            # A tag section after movetext starts a new game, even if the
+            # previous one had no result token
+            if moves:
+                yield {'tags': tags, 'moves': moves, 'result': '*'}
+                tags = {}
+                moves = []
+            match = TAG.match(line.strip())
+            if match:
+                tags[match.group(1)] = match.group(2)
+            continue
+
+        i = 0
+        while i < len(line):
+            if comment:
+                end = line.find('}', i)
+                if end == -1:
+                    break
+                comment = False
+                i = end + 1
+                continue
+            match = TOKEN.match(line, i)
+            if not match:
+                break
+            i = match.end()
+            token = match.group(1)
+            if token == '{':
+                comment = True
+            elif token == ';':  # comment to the end of the line
+                break
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif depth > 0 or token.startswith('$'):
+                continue
+            elif token in RESULTS:
+                yield {'tags': tags, 'moves': moves, 'result': token}
+                tags = {}
+                moves = []
+            else:
+                # Move numbers can be attached to the move, as in "12.e4"
+                token = MOVE_NUMBER.sub('', token)
+                if token != '':
+                    moves.append(token)
+
+    # Last game without a result token
+    if moves or tags:
+        yield {'tags': tags, 'moves': moves, 'result': '*'}
+
+
+def read_uci(lines):
+    '''
+    Reads games written as one line of space separated UCI moves (such as
+    'e2e4 e7e5 g1f3') and yields them in the same form as read_pgn. Blank
+    lines and lines starting with '#' are skipped.
+    '''
+    for line in lines:
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        moves = line.split()
+        result = '*'
+        if moves[-1] in RESULTS:
+            result = moves.pop()
+        yield {'tags': {}, 'moves': moves, 'result': result}
+
+
+def parse_san(board, player, text):
+    '''
+    Finds the move written in standard algebraic notation for the player and
+    returns it as a tuple (piece, start, end, promote), with castling as the
+    king moving two squares. Returns "Illegal Move" if the text is
+    unreadable or fits no piece, or several pieces legally. The move itself
+    is checked when it is played by play_move.
+    '''
+    text = text.rstrip('+#!?')
+
+    # Castling
+    if player == 'w':
+        home = 7
+    else:
+        home = 0
+    if text in ['O-O', '0-0']:
+        return ('k', (home, 4), (home, 6), None)
+    if text in ['O-O-O', '0-0-0']:
+        return ('k', (home, 4), (home, 2), None)
+
+    match = SAN.match(text)
+    if not match:
+        return "Illegal Move"
+    piece, file, rank, target, promote = match.groups()
+    if piece is None:
+        piece = 'p'
+    piece = piece.lower()
+    end = square(target)
+
+    # Pawns must name a piece exactly when they reach the last rank
+    last = (piece == 'p' and end[0] in [0, 7])
+    if last != (promote is not None):
+        return "Illegal Move"
+
+    # Find the player's pieces of that type that fit the disambiguation
+    starts = []
+    for r in range(8):
+        if rank is not None and r != 8 - int(rank):
+            continue
+        for f in range(8):
+            if file is not None and f != ord(file) - ord('a'):
+                continue
+            if board.state[r][f] == f'{player}{piece}':
+                starts.append((r, f))
+
+    # Only when several pieces fit does legality decide between them
+    if len(starts) > 1:
+        starts = [
+            start for start in starts
+            if board.valid_move(player, piece, start, end)
+        ]
+    if len(starts) != 1:
+        return "Illegal Move"
+
+    if promote is not None:
+        promote = promote.lower()
+    return (piece, starts[0], end, promote)
+
+
+def parse_uci(board, player, text):
+    '''
+    Finds the move written in UCI notation (such as 'e2e4' or 'e7e8q') for
+    the player and returns it as a tuple (piece, start, end, promote), or
+    "Illegal Move" if the text is unreadable or doesn't move one of the
+    player's pieces. The move itself is checked when it is played by
+    play_move.
+    '''
+    match = UCI.match(text)
+    if not match:
+        return "Illegal Move"
+    start = square(match.group(1))
+    end = square(match.group(2))
+    name = board.state[start[0]][start[1]]
+    if name == '' or name[0] != player:
+        return "Illegal Move"
+    piece = name[1]
+
+    last = (piece == 'p' and end[0] in [0, 7])
+    if last != (match.group(3) is not None):
+        return "Illegal Move"
+    return (piece, start, end, match.group(3))
+
+
+def play_move(board, player, move):
+    '''
+    Plays a move tuple (piece, start, end, promote) for the player through
+    ChessBoard.move, or ChessBoard.castle when the king moves two squares
+    from its starting square. Returns None if the move was played and
+    "Illegal Move" if it is illegal.
+    '''
+    if move == "Illegal Move":
+        return move
+    piece, start, end, promote = move
+
+    # Castling is written as the king moving two squares
+    if piece == 'k' and start[1] == 4 and abs(end[1] - start[1]) == 2:
+        if end[1] == 6:
+            return board.castle(player, 'k')
+        return board.castle(player, 'q')
+
+    if promote is None:
+        return board.move(player, piece, start, end)
+    return board.move(player, piece, start, end, promote)
+
+
+def play_san(board, player, text):
+    '''
+    Plays a move written in standard algebraic notation for the player
+    through ChessBoard.move or ChessBoard.castle. Returns None if the move
+    was played and "Illegal Move" if it is illegal, ambiguous or unreadable.
+    '''
+    return play_move(board, player, parse_san(board, player, text))
+
+
+def play_uci(board, player, text):
+    '''
+    Plays a move written in UCI notation (such as 'e2e4' or 'e7e8q') for the
+    player through ChessBoard.move or ChessBoard.castle. Returns None if the
+    move was played and "Illegal Move" if it is not.
+    '''
+    return play_move(board, player, parse_uci(board, player, text))
+
+
+def status(board, player):
+    '''
+    Returns the state of the game for the player to move: 'checkmate',
+    'stalemate', 'check' or 'ongoing'.
+    '''
+    if board.stalemate(player):
+        if board.in_check(player):
+            return 'checkmate'
+        return 'stalemate'
+    if board.in_check(player):
+        return 'check'
+    return 'ongoing'
+
+
+def replay(game, board_class=ChessBoard, notation='san'):
+    '''
+    Replays one game from read_pgn or read_uci on a fresh board and returns
+    a dict describing it: whether every move was legal, the ply of the
+    first illegal move, and the final status of the game.
+    '''
+    if 'FEN' in game['tags']:
+        board = board_class.from_fen(game['tags']['FEN'])
+    else:
+        board = board_class()
+    if notation == 'san':
+        play = play_san
+    else:
+        play = play_uci
+
+    result = {
+        'white': game['tags'].get('White'),
+        'black': game['tags'].get('Black'),
+        'result': game['result'],
+        'plies': 0,
+        'legal': True,
+        'illegal_ply': None,
+        'illegal_move': None,
+        'status': None
+    }
+    player = board.turn
+    for ply, text in enumerate(game['moves'], 1):
+        if play(board, player, text) == "Illegal Move":
+            result['legal'] = False
+            result['illegal_ply'] = ply
+            result['illegal_move'] = text
+            break
+        result['plies'] = ply
+        if player == 'w':
+            player = 'b'
+        else:
+            player = 'w'
+    result['status'] = status(board, player)
+    return result
+
+
+def read_games(lines, notation='san'):
+    '''
+    Returns a generator of games read from lines, in PGN when notation is
+    'san' and as UCI move lists when it is 'uci'.
+    '''
+    if notation == 'san':
+        return read_pgn(lines)
+    return read_uci(lines)
+
+
+def replay_chunk(chunk, backend='chess32', notation='san'):
+    '''
+    Replays a list of games and returns (process id, seconds taken, list of
+    results). Runs inside the worker processes of replay_batches, each of
+    which builds its own boards.
+    '''
+    start = time.perf_counter()
+    results = [replay(game, BACKENDS[backend], notation) for game in chunk]
+    return os.getpid(), time.perf_counter() - start, results
+
+
+def chunks(games, size):
+    '''
+    Groups a stream of games into lists of up to size games, reading only
+    one list ahead.
+    '''
+    chunk = []
+    for game in games:
+        chunk.append(game)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def replay_batches(games, backend='chess32', notation='san', workers=1,
+                   chunk_size=100):
+    '''
+    Replays a stream of games in chunks of chunk_size and yields the result
+    of replay_chunk for each chunk, in input order. With more than one
+    worker the chunks are shared out across a process pool; only a few
+    chunks per worker are in flight at once, so memory stays bounded
+    however long the input is.
+    '''
+    if workers == 1:
+        for chunk in chunks(games, chunk_size):
+            yield replay_chunk(chunk, backend, notation)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks(games, chunk_size):
+            pending.append(pool.submit(replay_chunk, chunk, backend,
+                                       notation))
+            # Wait for the oldest chunk once enough work is queued, which
+            # keeps the output in input order
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv=None):
+    '''
+    Command line pipeline: reads games from the given files (or stdin),
+    replays each one (across several processes with --workers), prints one
+    JSON object per game in input order and finishes with a summary line
+    including throughput in games per second overall and per worker.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Replay and validate recorded games.')
+    parser.add_argument('files', nargs='*',
+                        help='PGN or UCI files to read (default stdin)')
+    parser.add_argument('--format', choices=['pgn', 'uci'], default='pgn',
+                        help='input format (default pgn)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default='chess32', help='board implementation')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, 0 for one per core '
+                        '(default 1)')
+    parser.add_argument('--chunk-size', type=int, default=100,
+                        help='games sent to a worker at a time (default 100)')
+    parser.add_argument('--progress', action='store_true',
+                        help='report progress on stderr after every chunk')
+    args = parser.parse_args(argv)
+
+    notation = 'san' if args.format == 'pgn' else 'uci'
+    workers = args.workers
+    if workers == 0:
+        workers = os.cpu_count()
+
+    games = 0
+    illegal = 0
+    # Games replayed and seconds spent by each worker process
+    worker_stats = {}
+    start = time.perf_counter()
+    with fileinput.input(args.files) as lines:
+        batches = replay_batches(read_games(lines, notation), args.backend,
+                                 notation, workers, args.chunk_size)
+        for pid, seconds, results in batches:
+            for result in results:
+                games += 1
+                result = {'game': games, **result}
+                if not result['legal']:
+                    illegal += 1
+                print(json.dumps(result))
+            sys.stdout.flush()
+
+            stats = worker_stats.setdefault(pid, {'games': 0, 'seconds': 0})
+            stats['games'] += len(results)
+            stats['seconds'] += seconds
+            if args.progress:
+                elapsed = time.perf_counter() - start
+                print(f'{games} games, {games / elapsed:.1f} games/s',
+                      file=sys.stderr, flush=True)
+    seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        'games': games,
+        'legal': games - illegal,
+        'illegal': illegal,
+        'seconds': round(seconds, 6),
+        'games_per_second': round(games / seconds, 2) if seconds else None,
+        'workers': [{
+            'pid': pid,
+            'games': stats['games'],
+            'games_per_second': (round(stats['games'] / stats['seconds'], 2)
+                                 if stats['seconds'] else None)
+        } for pid, stats in worker_stats.items()]
+    }))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
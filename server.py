@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chess32 import ChessBoard, RepetitionTracker
+from bitboard import BitChessBoard
+from replay import parse_uci, play_move, status
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+# Moves the load generator plays in every game (a Ruy Lopez), in UCI
+# notation, before white resigns
+SCRIPT = ('e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 '
+          'd7d6 c2c3 e8g8 h2h3 c6b8 d2d4 b8d7 b1d2 c8b7 b3c2 f8e8 d2f1 e7f8 '
+          'f1g3 g7g6').split()
+
+HELP = ("commands: new | join <game> | <move such as e2e4 or e7e8q> | "
+        "castle k | castle q | board | resign | quit")
+
+
+class Game():
+    '''
+    One game hosted by the server: its board, the connections of both
+    players and the position history for threefold repetition. Methods
+    include:
+
+    play(player, text) : Plays a move for the player and returns the lines
+                         to send to both players
+
+    send(line) : Sends a line to both players
+    '''
+    def __init__(self, game_id, board_class=ChessBoard):
+        self.id = game_id
+        self.board = board_class()
+        self.repetitions = RepetitionTracker(self.board.key())
+        self.players = {'w': None, 'b': None}
+        self.over = False
+
+        # Only one move of a game is checked at a time, even when the rule
+        # checks run in an executor
+        self.lock = asyncio.Lock()
+
+    def play(self, player, text):
+        '''
+        Plays a move for the player, given in UCI notation or as 'castle k'
+        or 'castle q', through ChessBoard.move or ChessBoard.castle. Returns
+        a list of lines to send to both players: the move with the new
+        position as FEN, followed by any check, checkmate, stalemate or
+        repetition event. Returns a one line list starting with 'error' if
+        the move can't be played. Blocks while the rules are checked, so the
+        server may run it in an executor.
+        '''
+        board = self.board
+        if self.over:
+            return ['error game over']
+        if board.turn != player:
+            return ['error not your turn']
+
+        if text.startswith('castle'):
+            side = text[len('castle'):].strip()
+            if side not in ['k', 'q']:
+                return ['error castle k or castle q']
+            if player == 'w':
+                rank = 7
+            else:
+                rank = 0
+            if side == 'k':
+                move = ('k', (rank, 4), (rank, 6), None)
+            else:
+                move = ('k', (rank, 4), (rank, 2), None)
+        else:
+            move = parse_uci(board, player, text)
+        if move == "Illegal Move":
+            return ['error illegal move']
+
+        # Captures, pawn moves and castling can't be undone
+        piece, start, end, promote = move
+        irreversible = (piece == 'p' or board.state[end[0]][end[1]] != ''
+                        or (piece == 'k' and abs(end[1] - start[1]) == 2))
+        if play_move(board, player, move) == "Illegal Move":
+            return ['error illegal move']
+        self.repetitions.add(board.key(), irreversible)
+
+        if player == 'w':
+            enemy = 'b'
+        else:
+            enemy = 'w'
+        lines = [f'move {player} {text} {board.to_fen()}']
+        state = status(board, enemy)
+        if state == 'checkmate':
+            lines.append(f'checkmate {player}')
+            self.over = True
+        elif state == 'stalemate':
+            lines.append('stalemate')
+            self.over = True
+        elif self.repetitions.threefold():
+            lines.append('draw repetition')
+            self.over = True
+        elif state == 'check':
+            lines.append(f'check {enemy}')
+        return lines
+
+    def send(self, line):
+        '''
+        Queues a line to both players that are still connected.
+        '''
+        for writer in self.players.values():
+            if writer is not None:
+                writer.write(f'{line}\n'.encode())
+
+
+class GameServer():
+    '''
+    Hosts any number of games over a line protocol on TCP, on one asyncio
+    event loop. A client starts a game with 'new' (and plays white) or joins
+    one with 'join <game>' (and plays black), then sends moves such as
+    'e2e4', 'e7e8q' or 'castle k'. Every move is pushed to both players as
+    'move <player> <move> <FEN>', followed by 'check <player>',
+    'checkmate <winner>', 'stalemate' or 'draw repetition' when they happen.
+    Methods include:
+
+    handle(reader, writer) : Serves one client connection
+
+    serve(host, port) : Accepts connections until cancelled
+    '''
+    def __init__(self, board_class=ChessBoard, executor=None):
+        self.board_class = board_class
+        self.games = {}
+        self.ids = itertools.count(1)
+
+        # Rule checks run here instead of on the event loop, if given
+        self.executor = executor
+
+    async def handle(self, reader, writer):
+        '''
+        Reads commands from one client until it quits or disconnects, and
+        answers or pushes to both players of its game.
+        '''
+        game = None
+        player = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                text = line.decode().strip().lower()
+                if text == '':
+                    continue
+
+                if text == 'quit':
+                    break
+                elif text == 'help':
+                    writer.write(f'{HELP}\n'.encode())
+                elif text == 'new' or text.startswith('join'):
+                    if game is not None and not game.over:
+                        writer.write(b'error already in a game\n')
+                    elif text == 'new':
+                        game = Game(next(self.ids), self.board_class)
+                        self.games[game.id] = game
+                        player = 'w'
+                        game.players['w'] = writer
+                        writer.write(f'game {game.id} w\n'.encode())
+                    else:
+                        words = text.split()
+                        found = None
+                        if len(words) == 2 and words[1].isdigit():
+                            found = self.games.get(int(words[1]))
+                        if found is None or found.players['b'] is not None:
+                            writer.write(b'error no such game\n')
+                        else:
+                            game = found
+                            player = 'b'
+                            game.players['b'] = writer
+                            game.send(f'start {game.id}')
+                elif game is None:
+                    writer.write(b'error not in a game\n')
+                elif text == 'board':
+                    # Wait for a move being checked, which changes the board
+                    # while it tries the move
+                    async with game.lock:
+                        fen = game.board.to_fen()
+                    writer.write(f'fen {fen}\n'.encode())
+                elif text == 'resign':
+                    async with game.lock:
+                        if not game.over:
+                            game.over = True
+                            game.send(f'resign {player}')
+                            self.games.pop(game.id, None)
+                elif game.players['b'] is None:
+                    writer.write(b'error waiting for an opponent\n')
+                else:
+                    # Check and play the move
+                    async with game.lock:
+                        if self.executor is None:
+                            lines = game.play(player, text)
+                        else:
+                            loop = asyncio.get_running_loop()
+                            lines = await loop.run_in_executor(
+                                self.executor, game.play, player, text)
+                    if lines[0].startswith('error'):
+                        writer.write(f'{lines[0]}\n'.encode())
+                    else:
+                        for result in lines:
+                            game.send(result)
+                        if game.over:
+                            self.games.pop(game.id, None)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # The opponent wins a game left in progress
+            if game is not None:
+                game.players[player] = None
+                if not game.over:
+                    game.over = True
+                    game.send(f'left {player}')
+                    self.games.pop(game.id, None)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8032):
+        '''
+        Listens on host and port and serves clients until cancelled.
+        '''
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def _expect(reader, kind):
+    # Read lines until one of the given kind, skipping events
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        words = line.decode().split()
+        if words[0] == 'error':
+            raise RuntimeError(line.decode().strip())
+        if words[0] == kind:
+            return words
+
+
+async def load_game(host, port, latencies):
+    '''
+    Plays SCRIPT as both players of one game over two connections, adding
+    the time from sending each move to receiving its push to latencies.
+    '''
+    white_reader, white_writer = await asyncio.open_connection(host, port)
+    black_reader, black_writer = await asyncio.open_connection(host, port)
+    white_writer.write(b'new\n')
+    game_id = (await _expect(white_reader, 'game'))[1]
+    black_writer.write(f'join {game_id}\n'.encode())
+    await _expect(white_reader, 'start')
+    await _expect(black_reader, 'start')
+
+    connections = [(white_reader, white_writer), (black_reader, black_writer)]
+    for ply, move in enumerate(SCRIPT):
+        reader, writer = connections[ply % 2]
+        other = connections[1 - ply % 2][0]
+        start = time.perf_counter()
+        writer.write(f'{move}\n'.encode())
+        await _expect(reader, 'move')
+        latencies.append(time.perf_counter() - start)
+        await _expect(other, 'move')
+
+    white_writer.write(b'resign\n')
+    await _expect(black_reader, 'resign')
+    for reader, writer in connections:
+        writer.close()
+
+
+async def load(host, port, games, concurrency):
+    '''
+    Plays games scripted games against the server, concurrency at a time,
+    and returns a dict with the number of moves, moves per second and the
+    p50, p99 and maximum move latency in milliseconds.
+    '''
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one_game():
+        async with limit:
+            await load_game(host, port, latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one_game() for game in range(games)])
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(
+            latencies[min(len(latencies) - 1,
+                          int(fraction * len(latencies)))] * 1000, 3)
+
+    return {
+        'games': games,
+        'moves': len(latencies),
+        'seconds': round(seconds, 3),
+        'moves_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+
+def main(argv=None):
+    '''
+    Command line entry point. 'serve' runs the game server and 'load' runs
+    the load generator against it, printing move latency as JSON.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Game server for many concurrent games.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run the game server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8032)
+    serve_parser.add_argument('--backend', choices=sorted(BACKENDS),
+                              default='chess32', help='board implementation')
+    serve_parser.add_argument('--executor', choices=['thread', 'none'],
+                              default='thread',
+                              help='where rule checks run: a worker thread '
+                              'or the event loop (default thread)')
+
+    load_parser = commands.add_parser('load',
+                                      help='measure move latency of a server')
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=8032)
+    load_parser.add_argument('--games', type=int, default=100,
+                             help='games to play (default 100)')
+    load_parser.add_argument('--concurrency', type=int, default=50,
+                             help='games in progress at once (default 50)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        executor = None
+        if args.executor == 'thread':
+            executor = ThreadPoolExecutor(max_workers=1)
+        server = GameServer(BACKENDS[args.backend], executor)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(
+            asyncio.run(load(args.host, args.port, args.games,
+                             args.concurrency))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess32 import ChessBoard, KING_TARGETS, RAY_SQUARES, SLIDE_DIRECTIONS
+
+# Endgames with a king and one piece against a lone king, by the piece. The
+# tables are built with white as the stronger side; black's positions are
+# looked up with the board flipped
+MATERIALS = {'kqk': 'q', 'krk': 'r', 'kpk': 'p'}
+
+# Positions are indexed by side to move (white first), white king, white
+# piece and black king, each square as rank * 8 + file
+TURN_SIZE = 64 * 64 * 64
+SIZE = 2 * TURN_SIZE
+
+# Squares along each direction from each square, nearest first, for the
+# sliding pieces
+RAYS = {
+    piece: [[rays[direction] for direction in SLIDE_DIRECTIONS[piece]]
+            for rays in RAY_SQUARES]
+    for piece in ['q', 'r']
+}
+
+
+def index(turn, king, piece, enemy_king):
+    '''
+    Returns the position index of a table entry: turn is 0 for white to
+    move and 1 for black, king and piece are white's squares and enemy_king
+    is black's.
+    '''
+    return ((turn * 64 + king) * 64 + piece) * 64 + enemy_king
+
+
+def attacked_squares(piece, square, king):
+    '''
+    Returns the set of squares attacked by white's king on king and its
+    piece ('q', 'r' or 'p') on square, with the white king as the only
+    piece that can block. Used for the black king, which doesn't block
+    attacks on the squares it could step back to.
+    '''
+    attacked = set(KING_TARGETS[king])
+    if piece == 'p':
+        rank = square // 8
+        file = square % 8
+        if rank > 0:
+            if file > 0:
+                attacked.add(square - 9)
+            if file < 7:
+                attacked.add(square - 7)
+    else:
+        for ray in RAYS[piece][square]:
+            for target in ray:
+                if target == king:
+                    break
+                attacked.add(target)
+    return attacked
+
+
+def attack_table(piece):
+    '''
+    Returns a list of attacked_squares(piece, square, king) for every square
+    and king square, indexed by square * 64 + king.
+    '''
+    return [
+        attacked_squares(piece, square, king) for square in range(64)
+        for king in range(64)
+    ]
+
+
+def legal(piece, king, square, enemy_king, turn, attacks):
+    '''
+    Checks whether a position of the table for piece can happen in a game
+    (returns True) or not (returns False): the pieces are on different
+    squares, the kings aren't next to each other, a pawn isn't on the first
+    or last rank, and black isn't in check with white to move. attacks is
+    the piece's attack_table.
+    '''
+    if king == square or king == enemy_king or square == enemy_king:
+        return False
+    if enemy_king in KING_TARGETS[king]:
+        return False
+    if piece == 'p' and (square < 8 or square >= 56):
+        return False
+    if turn == 0 and enemy_king in attacks[square * 64 + king]:
+        return False
+    return True
+
+
+def count_black_moves(material, king):
+    '''
+    Counts the legal moves of the black king in every black-to-move position
+    of the table for material with the white king on king. Runs in the
+    worker processes of generate. Returns (king, bytes of move counts indexed
+    by piece * 64 + enemy_king, list of position indexes where black is
+    checkmated).
+    '''
+    piece = MATERIALS[material]
+    attacks = attack_table(piece)
+    counts = bytearray(64 * 64)
+    mates = []
+    for square in range(64):
+        attacked = attacks[square * 64 + king]
+        for enemy_king in range(64):
+            if not legal(piece, king, square, enemy_king, 1, attacks):
+                continue
+            # Taking an unprotected piece is a legal move that draws
+            moves = 0
+            for target in KING_TARGETS[enemy_king]:
+                if target not in attacked:
+                    moves += 1
+            counts[square * 64 + enemy_king] = moves
+            if moves == 0 and enemy_king in attacked:
+                mates.append(index(1, king, square, enemy_king))
+    return king, bytes(counts), mates
+
+
+def white_predecessors(piece, king, square, enemy_king, attacks):
+    '''
+    Yields the index of every white-to-move position that white could have
+    moved from to reach the black-to-move position (king, square,
+    enemy_king) of the table for piece.
+    '''
+    # King moves
+    for start in KING_TARGETS[king]:
+        if start != square and start != enemy_king and legal(
+                piece, start, square, enemy_king, 0, attacks):
+            yield index(0, start, square, enemy_king)
+
+    # Piece moves, along the rays back from the piece
+    if piece == 'p':
+        starts = []
+        # A pawn can't be on its first rank, and doubles from its second
+        if square + 8 < 56 and square + 8 not in [king, enemy_king]:
+            starts.append(square + 8)
+            if (32 <= square < 40 and square + 16 not in [king, enemy_king]):
+                starts.append(square + 16)
+    else:
+        starts = []
+        for ray in RAYS[piece][square]:
+            for start in ray:
+                if start == king or start == enemy_king:
+                    break
+                starts.append(start)
+    for start in starts:
+        if legal(piece, king, start, enemy_king, 0, attacks):
+            yield index(0, king, start, enemy_king)
+
+
+def promotion_wins(tables):
+    '''
+    Returns a dict from plies to the white-to-move KPK positions where
+    promoting the pawn wins in that many plies, using the finished KQK and
+    KRK tables. Promoting to a rook is used where a queen would stalemate or
+    be lost.
+    '''
+    attacks = attack_table('p')
+    wins = {}
+    for king in range(64):
+        for square in range(8, 16):
+            target = square - 8
+            for enemy_king in range(64):
+                if target in [king, enemy_king]:
+                    continue
+                if not legal('p', king, square, enemy_king, 0, attacks):
+                    continue
+                best = None
+                for table in tables:
+                    value = table[index(1, king, target, enemy_king)]
+                    if value != 0 and (best is None or value < best):
+                        best = value
+                if best is not None:
+                    # One more ply than the loss it leads to
+                    wins.setdefault(best, []).append(
+                        index(0, king, square, enemy_king))
+    return wins
+
+
+def generate(material, directory='tablebases', workers=1):
+    '''
+    Builds the table for material ('kqk', 'krk' or 'kpk') by retrograde
+    analysis and writes it to directory as one byte per position index: 0
+    for a draw (or a position that can't happen), otherwise the number of
+    plies to mate plus one. The black king's moves are counted across
+    workers processes; then the results spread back from the checkmates one
+    ply at a time, so every position gets its shortest distance to mate.
+    KPK needs the KQK and KRK tables in directory. Returns a dict of
+    statistics.
+    '''
+    start = time.perf_counter()
+    piece = MATERIALS[material]
+    attacks = attack_table(piece)
+    values = bytearray(SIZE)
+    counts = bytearray(TURN_SIZE)
+
+    # Legal moves of the black king, and the checkmates to start from
+    levels = {0: []}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(count_black_moves, [material] * 64,
+                                    range(64)))
+    else:
+        results = [count_black_moves(material, king) for king in range(64)]
+    for king, king_counts, mates in results:
+        counts[king * 4096:(king + 1) * 4096] = king_counts
+        for mate in mates:
+            values[mate] = 1
+        levels[0].extend(mates)
+
+    # Promotions leave the table, so their wins come from the other tables
+    seeds = {}
+    if piece == 'p':
+        tables = []
+        for other in ['kqk', 'krk']:
+            with open(os.path.join(directory, f'{other}.tb'), 'rb') as file:
+                tables.append(file.read())
+        seeds = promotion_wins(tables)
+
+    plies = 0
+    while plies in levels or any(ply >= plies for ply in seeds):
+        level = levels.pop(plies, [])
+        for position in seeds.pop(plies, []):
+            if values[position] == 0:
+                values[position] = plies + 1
+                level.append(position)
+        following = []
+        for position in level:
+            turn, rest = divmod(position, TURN_SIZE)
+            king, rest = divmod(rest, 4096)
+            square, enemy_king = divmod(rest, 64)
+            if turn == 1:
+                # Black loses here, so white wins by moving here
+                for before in white_predecessors(piece, king, square,
+                                                 enemy_king, attacks):
+                    if values[before] == 0:
+                        values[before] = plies + 2
+                        following.append(before)
+            else:
+                # White wins here, so black loses once every move does
+                for before_king in KING_TARGETS[enemy_king]:
+                    before = index(1, king, square, before_king)
+                    if (values[before] != 0 or not legal(
+                            piece, king, square, before_king, 1, attacks)):
+                        continue
+                    counts[before - TURN_SIZE] -= 1
+                    if counts[before - TURN_SIZE] == 0:
+                        values[before] = plies + 2
+                        following.append(before)
+        if following:
+            levels[plies + 1] = following
+        plies += 1
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{material}.tb'), 'wb') as file:
+        file.write(values)
+    return {
+        'table': material,
+        'won': sum(1 for value in values[:TURN_SIZE] if value != 0),
+        'lost': sum(1 for value in values[TURN_SIZE:] if value != 0),
+        'longest': max(values) - 1,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+class Tablebases():
+    '''
+    Looks up positions in the tables written by generate, which are memory
+    mapped when first needed. Methods include:
+
+    probe(board) : Returns the exact result of the board's position for the
+                   side to move and the plies to mate, or None
+
+    close() : Closes the table files
+    '''
+    def __init__(self, directory='tablebases'):
+        self.directory = directory
+        self.files = {}
+        self.maps = {}
+
+    def _table(self, material):
+        # Map the table the first time it is needed (None if it is missing)
+        if material not in self.maps:
+            path = os.path.join(self.directory, f'{material}.tb')
+            self.maps[material] = None
+            if os.path.exists(path):
+                self.files[material] = open(path, 'rb')
+                self.maps[material] = mmap.mmap(
+                    self.files[material].fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[material]
+
+    def close(self):
+        '''
+        Closes the memory maps and the table files.
+        '''
+        for table in self.maps.values():
+            if table is not None:
+                table.close()
+        for file in self.files.values():
+            file.close()
+        self.maps = {}
+        self.files = {}
+
+    def probe(self, board):
+        '''
+        Returns (result, plies) for the side to move in the board's
+        position, where result is 'win', 'draw' or 'loss' and plies is the
+        number of plies to mate with best play (None for a draw). Returns
+        None if the position isn't covered by a table: it must be a king
+        and a queen, rook or pawn against a lone king with no castling.
+        '''
+        if True in board.w_castle.values() or True in board.b_castle.values():
+            return None
+        kings = {}
+        extra = []
+        for rank in range(8):
+            for file in range(8):
+                name = board.state[rank][file]
+                if name == '':
+                    continue
+                if name[1] == 'k':
+                    kings[name[0]] = (rank, file)
+                else:
+                    extra.append((name, (rank, file)))
+        if len(extra) != 1 or extra[0][0][1] not in ['q', 'r', 'p']:
+            return None
+        name, location = extra[0]
+        table = self._table('k' + name[1] + 'k')
+        if table is None:
+            return None
+
+        # Flip the board when black has the piece, so that it is white's
+        strong = name[0]
+        if strong == 'w':
+            weak = 'b'
+        else:
+            weak = 'w'
+
+        def square(location):
+            if strong == 'w':
+                return location[0] * 8 + location[1]
+            return (7 - location[0]) * 8 + location[1]
+
+        turn = 0 if board.turn == strong else 1
+        value = table[index(turn, square(kings[strong]), square(location),
+                            square(kings[weak]))]
+        if value == 0:
+            return ('draw', None)
+        if turn == 0:
+            return ('win', value - 1)
+        return ('loss', value - 1)
+
+
+def main(argv=None):
+    '''
+    Command line entry point. 'generate' builds the tables and prints their
+    statistics as JSON, and 'probe' prints the result of a position.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Endgame tablebases for KQK, KRK and KPK.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='build tables')
+    generate_parser.add_argument('tables', nargs='*',
+                                 help='tables to build: kqk, krk or kpk '
+                                 '(default all)')
+    generate_parser.add_argument('--dir', default='tablebases',
+                                 help='directory of the tables')
+    generate_parser.add_argument('--workers', type=int, default=1,
+                                 help='worker processes, 0 for one per core '
+                                 '(default 1)')
+
+    probe_parser = commands.add_parser('probe', help='look up a position')
+    probe_parser.add_argument('fen', help='position to look up')
+    probe_parser.add_argument('--dir', default='tablebases',
+                              help='directory of the tables')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        workers = args.workers
+        if workers == 0:
+            workers = os.cpu_count()
+        # KPK promotes into the other two, so it comes last
+        tables = args.tables or ['kqk', 'krk', 'kpk']
+        for material in tables:
+            if material not in MATERIALS:
+                parser.error(f'unknown table {material}')
+        for material in ['kqk', 'krk', 'kpk']:
+            if material in tables:
+                print(json.dumps(generate(material, args.dir, workers)),
+                      flush=True)
+    else:
+        tablebases = Tablebases(args.dir)
+        result = tablebases.probe(ChessBoard.from_fen(args.fen))
+        tablebases.close()
+        if result is None:
+            print(json.dumps(None))
+        else:
+            print(json.dumps({'result': result[0], 'plies': result[1]}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
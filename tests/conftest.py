@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from chess32 import ChessBoard
+from bitboard import BitChessBoard
+
+BACKENDS = {'chess32': ChessBoard, 'bitboard': BitChessBoard}
+
+
+def random_game(board, rng, plies):
+    '''
+    Plays up to plies random legal moves on the board with make_move and
+    returns the FEN of every position reached, the start included.
+    '''
+    fens = [board.to_fen()]
+    for ply in range(plies):
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        board.make_move(board.turn, *rng.choice(moves))
+        fens.append(board.to_fen())
+    return fens
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def board_class(request):
+    # Every test that takes board_class runs once for each backend
+    return BACKENDS[request.param]
+
+
+@pytest.fixture(scope='session')
+def positions():
+    # Positions from a few seeded random games, covering captures,
+    # promotions, castling and en passant along the way
+    rng = random.Random(32)
+    fens = []
+    for game in range(12):
+        fens += random_game(ChessBoard(), rng, 120)[::3]
+    return fens
@@ -0,0 +1,82 @@
+import random
+import re
+
+from chess32 import BOARD_LINES, AnsiBoard
+
+ESCAPE = re.compile(r'\x1b\[(?:(\d+);(\d+))?([HJ])|\x1b\[2J')
+
+
+def apply(screen, text):
+    # Writes text with the cursor moves and clears AnsiBoard uses onto a
+    # screen, a list of lines, and returns the screen
+    row, column = 0, 0
+    position = 0
+    for match in list(ESCAPE.finditer(text)) + [None]:
+        end = len(text) if match is None else match.start()
+        for char in text[position:end]:
+            if char == '\n':
+                row, column = row + 1, 0
+                continue
+            while len(screen) <= row:
+                screen.append('')
+            line = screen[row].ljust(column)
+            screen[row] = line[:column] + char + line[column + 1:]
+            column += 1
+        if match is None:
+            break
+        position = match.end()
+        if match.group(0) == '\x1b[2J':
+            screen.clear()
+        elif match.group(3) == 'H':
+            row, column = 0, 0
+            if match.group(1) is not None:
+                row, column = int(match.group(1)) - 1, int(match.group(2)) - 1
+        else:  # clear to the end of the screen
+            del screen[row + 1:]
+            screen[row:] = [screen[row][:column]] if row < len(screen) else []
+    return screen
+
+
+def test_screen_matches_the_board_after_every_move(board_class):
+    board = board_class()
+    ansi = AnsiBoard()
+    screen = apply([], ansi.draw(board))
+    assert '\n'.join(screen) == str(board)
+
+    rng = random.Random(19)
+    for ply in range(60):
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        board.move(board.turn, *rng.choice(moves)[:3])
+        update = ansi.draw(board)
+        # Only the changed squares are written, not the whole board
+        assert len(update) < len(str(board)) // 4
+        screen = apply(screen, update)
+        assert '\n'.join(screen) == str(board)
+
+
+def test_only_changed_squares_are_redrawn(board_class):
+    board = board_class()
+    ansi = AnsiBoard()
+    ansi.draw(board)
+    # With nothing changed, only the cursor goes back under the board
+    below = f'{BOARD_LINES + 1};1'
+    assert ansi.draw(board) == f'\x1b[{below}H\x1b[J'
+    # e4 then e2, on the middle line of their ranks
+    board.move('w', 'p', (6, 4), (4, 4))
+    update = ansi.draw(board)
+    assert re.findall(r'\x1b\[(\d+;\d+)H', update) == ['14;20', '20;20',
+                                                      below]
+
+
+def test_printing_keeps_up_with_moves(board_class):
+    # Printing between moves reuses the text of the unchanged ranks
+    board = board_class()
+    rng = random.Random(190)
+    for ply in range(80):
+        assert str(board) == str(board_class.from_fen(board.to_fen()))
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        board.make_move(board.turn, *rng.choice(moves))
@@ -0,0 +1,84 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import batch
+from chess32 import KNIGHT_TARGETS, RAY_SQUARES, ChessBoard
+from bitboard import BitChessBoard
+
+
+def slow_mobility(board):
+    # Squares white's knights and sliders can move to minus black's, one
+    # square at a time
+    total = 0
+    for square in range(64):
+        name = board.piece_on(square)
+        if name == '' or name[1] not in 'nbrq':
+            continue
+
+        def reachable(target):
+            return board.piece_on(target)[:1] != name[0]
+
+        if name[1] == 'n':
+            moves = sum(reachable(target) for target in KNIGHT_TARGETS[square])
+        else:
+            directions = {'r': range(4), 'b': range(4, 8), 'q': range(8)}
+            moves = 0
+            for direction in directions[name[1]]:
+                for target in RAY_SQUARES[square][direction]:
+                    moves += reachable(target)
+                    if board.piece_on(target) != '':
+                        break
+        if name[0] == 'w':
+            total += moves
+        else:
+            total -= moves
+    return total
+
+
+def test_pack_fens_and_boards_agree(positions):
+    codes, turns = batch.pack(positions)
+    assert codes.shape == (len(positions), 64)
+    assert codes.dtype == np.uint8
+    for board_class in [ChessBoard, BitChessBoard]:
+        boards = [board_class.from_fen(fen) for fen in positions]
+        board_codes, board_turns = batch.pack(boards)
+        assert (board_codes == codes).all()
+        assert (board_turns == turns).all()
+
+
+def test_planes(positions):
+    codes, turns = batch.pack(positions)
+    planes = batch.planes(codes)
+    assert planes.shape == (len(positions), 12, 64)
+    assert planes.sum() == (codes != 0).sum()
+    assert (planes[:, 0] == (codes == 1)).all()
+
+
+def test_scores_match_evaluate(positions):
+    expected = [ChessBoard.from_fen(fen).evaluate() for fen in positions]
+    scores = batch.evaluate_batch(positions, mobility_weight=0)
+    assert scores.tolist() == expected
+    # Chunks of any size give the same scores
+    chunked = batch.evaluate_batch(iter(positions), chunk_size=7,
+                                   mobility_weight=0)
+    assert chunked.tolist() == expected
+
+
+def test_mobility(positions):
+    codes, turns = batch.pack(positions)
+    expected = [slow_mobility(ChessBoard.from_fen(fen)) for fen in positions]
+    assert batch.mobility(codes).tolist() == expected
+    scores = batch.evaluate_batch(positions, mobility_weight=3)
+    plain = batch.evaluate_batch(positions, mobility_weight=0)
+    signs = np.where(turns == 1, -1, 1)
+    assert (scores == plain + 3 * signs * np.array(expected)).all()
+
+
+def test_empty_input():
+    assert batch.evaluate_batch([]).shape == (0,)
+
+
+def test_bad_fen():
+    with pytest.raises(ValueError):
+        batch.pack_fens(['8/8/8 w - -'])
@@ -0,0 +1,15 @@
+from chess32 import ChessBoard
+from bitboard import BitChessBoard
+
+
+def test_backends_agree(positions):
+    for fen in positions[::4]:
+        board = ChessBoard.from_fen(fen)
+        bits = BitChessBoard.from_fen(fen)
+        assert bits.key() == board.key()
+        assert bits.evaluate() == board.evaluate()
+        assert bits.kings == board.kings
+        for player in 'wb':
+            assert bits.check_info(player) == board.check_info(player)
+        assert (sorted(bits.generate_legal_moves(bits.turn))
+                == sorted(board.generate_legal_moves(board.turn)))
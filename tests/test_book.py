@@ -0,0 +1,68 @@
+import random
+
+from book import OpeningBook, build
+from chess32 import ChessBoard
+from replay import read_pgn, read_uci
+
+PGN = '''1. e4 e5 2. Nf3 1-0
+1. e4 c5 0-1
+1. d4 d5 1/2-1/2
+1. e4 e5 2. Bc4 1-0
+[FEN "4k3/8/8/8/8/8/8/4K2R w K - 0 1"]
+1. Kf1 1-0
+1. e4 e5 2. Ke3 Nc6 *
+'''
+
+
+def names(found):
+    return [(piece, start, end, weight)
+            for (piece, start, end, promote), weight in found]
+
+
+def test_build_and_probe_round_trip(tmp_path):
+    path = tmp_path / 'book.bin'
+    # Only the moves that scored at least 2 points
+    assert build(read_pgn(PGN.splitlines(True)), path, min_weight=2) == 4
+    # The game from a FEN is left out
+    assert build(read_pgn(PGN.splitlines(True)), path) == 7
+    assert path.stat().st_size == 7 * 12
+
+    board = ChessBoard()
+    with OpeningBook(path) as book:
+        # A win is worth 2 points to the player who moved, a draw (or an
+        # unfinished game) 1 and a loss 0
+        assert names(book.moves(board)) == [
+            ('p', (6, 4), (4, 4), 5), ('p', (6, 3), (4, 3), 1)]
+        board.move('w', 'p', (6, 4), (4, 4))
+        assert names(book.moves(board)) == [
+            ('p', (1, 2), (3, 2), 2), ('p', (1, 4), (3, 4), 1)]
+        board.move('b', 'p', (1, 4), (3, 4))
+        # The illegal king move ended its game
+        assert sorted(names(book.moves(board))) == [
+            ('b', (7, 5), (4, 2), 2), ('n', (7, 6), (5, 5), 2)]
+        board.move('w', 'b', (7, 5), (4, 2))
+        assert book.moves(board) == []
+        assert book.choose(board) is None
+
+
+def test_plies_and_castling(tmp_path):
+    path = tmp_path / 'book.bin'
+    # Black's lost moves score nothing and are left out
+    lines = ['e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 e1g1 1-0']
+    assert build(read_uci(lines), path, plies=6, notation='uci') == 3
+    assert build(read_uci(lines), path, notation='uci') == 4
+
+    board = ChessBoard.from_fen(
+        'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq -')
+    with OpeningBook(path) as book:
+        assert book.moves(board) == [(('k', (7, 4), (7, 6), None), 2)]
+        move = book.choose(board, random.Random(1))
+    assert board.move('w', board.pack_move(*move)) is None
+    assert board.piece_on(61) == 'wr'
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / 'book.bin'
+    assert build([], path) == 0
+    with OpeningBook(path) as book:
+        assert book.moves(ChessBoard()) == []
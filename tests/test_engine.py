@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess32 import ChessBoard
+from engine import MATE, Search, best_move, is_capture, order_moves
+
+
+def test_captures_are_the_capturing_legal_moves(board_class, positions):
+    for fen in positions[::2]:
+        board = board_class.from_fen(fen)
+        for player in 'wb':
+            expected = sorted(
+                move for move in board.generate_legal_moves(player)
+                if move[3] is not None or is_capture(board, move))
+            assert sorted(board.generate_captures(player)) == expected, fen
+
+
+def test_en_passant_is_a_capture(board_class):
+    board = board_class.from_fen(
+        'rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq e3')
+    move = ('p', (4, 3), (5, 4), None)
+    assert is_capture(board, move)
+    assert move in list(board.generate_captures('b'))
+    # Capturing the pawn that took en passant comes first, by MVV-LVA
+    moves = list(board.generate_legal_moves('b'))
+    assert order_moves(board, moves, None)[0] == move
+
+
+def test_quiescence_searches_evasions_in_check(board_class):
+    # Black is checkmated: standing pat would score the lone kings as equal
+    board = board_class.from_fen('6rk/5Npp/8/8/8/8/8/6K1 b - -')
+    search = Search(board)
+    search.deadline = time.perf_counter() + 10
+    assert search.quiescence('b', -MATE - 1, MATE + 1, 3) == -MATE + 3
+    # Out of check, a quiet position is worth its evaluation
+    board = board_class.from_fen('7k/8/8/8/8/8/8/K7 w - -')
+    search = Search(board)
+    search.deadline = time.perf_counter() + 10
+    assert (search.quiescence('w', -MATE - 1, MATE + 1)
+            == board.evaluate('w'))
+
+
+def test_best_move_finds_a_mate(board_class):
+    board = board_class.from_fen(
+        'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq -')
+    for workers in [1, 2]:
+        result = best_move(board, depth=3, workers=workers)
+        assert result['move'] == ('q', (3, 7), (1, 5), None)
+        assert result['score'] == MATE - 1
+        assert result['depth'] == 1 and result['workers'] == workers
+
+
+def test_workers_agree_with_one_process(board_class):
+    board = board_class.from_fen(
+        'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq -')
+    fen = board.to_fen()
+    serial = best_move(board, depth=3, workers=1)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        shared = best_move(board, depth=3, workers=2, pool=pool)
+        # The pool is left running for the caller
+        assert pool.submit(abs, -1).result() == 1
+    assert (shared['score'], shared['pv']) == (serial['score'], serial['pv'])
+    # The workers search copies, leaving the board as it was
+    assert board.to_fen() == fen
+
+
+def test_best_move_without_moves():
+    board = ChessBoard.from_fen('7k/5Q2/6K1/8/8/8/8/8 b - -')
+    result = best_move(board, depth=2, workers=2)
+    assert result['move'] is None and result['depth'] == 0
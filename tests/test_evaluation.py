@@ -0,0 +1,42 @@
+import json
+import random
+
+import pytest
+
+import chess32
+import engine
+
+
+def test_debug_evaluation_recounts_every_score(board_class, monkeypatch):
+    monkeypatch.setattr(chess32, 'DEBUG_EVALUATION', True)
+    board = board_class()
+    rng = random.Random(24)
+    undos = []
+    for ply in range(100):
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        undos.append(board.make_move(board.turn, *rng.choice(moves)))
+        assert board.evaluate('w') == -board.evaluate('b')
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+        board.evaluate()
+
+    # A running score that went wrong is caught, and put right
+    board.middlegame += 1
+    with pytest.raises(RuntimeError, match='differ from the recount'):
+        board.evaluate()
+    assert board.evaluate() == 0
+
+
+def test_running_scores_go_unchecked_by_default(board_class):
+    board = board_class()
+    board.middlegame += 100
+    assert board.evaluate() > 0
+
+
+def test_engine_debug_eval_option(monkeypatch, capsys):
+    monkeypatch.setattr(chess32, 'DEBUG_EVALUATION', False)
+    assert engine.main(['--debug-eval', '--depth', '2']) == 0
+    assert chess32.DEBUG_EVALUATION == True
+    assert json.loads(capsys.readouterr().out)['depth'] == 2
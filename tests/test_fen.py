@@ -0,0 +1,28 @@
+from perft import POSITIONS
+
+
+def test_standard_positions_round_trip(board_class):
+    for position in POSITIONS:
+        fen = position['fen']
+        board = board_class.from_fen(fen)
+        # The move counters are not kept, so only the first four fields
+        # come back
+        assert board.to_fen().split()[:4] == fen.split()[:4]
+
+
+def test_random_positions_round_trip(board_class, positions):
+    for fen in positions:
+        board = board_class.from_fen(fen)
+        assert board.to_fen() == fen
+        again = board_class.from_fen(board.to_fen())
+        assert again.key() == board.key()
+        assert again.evaluate() == board.evaluate()
+
+
+def test_en_passant_and_castling_fields(board_class):
+    fen = 'r3k2r/8/8/3pP3/8/8/8/R3K2R w Kq d6 0 1'
+    board = board_class.from_fen(fen)
+    assert board.enpass == [True, (3, 3)]
+    assert board.w_castle == {'k': True, 'q': False}
+    assert board.b_castle == {'k': False, 'q': True}
+    assert board.to_fen() == fen
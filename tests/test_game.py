@@ -0,0 +1,29 @@
+import builtins
+
+from chess32 import main
+
+
+def play(monkeypatch, capsys, answers, **options):
+    # Runs main with the answers typed in, returning what it printed
+    answers = iter(answers)
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': next(answers))
+    main(**options)
+    return capsys.readouterr().out
+
+
+def test_fools_mate(monkeypatch, capsys):
+    out = play(monkeypatch, capsys, ['f2', 'f3', 'e7', 'e5', 'g2', 'g4',
+                                     'd8', 'h4'])
+    assert out.count('White is in check!') == 0
+    assert out.rstrip().endswith('Checkmate! Black wins!')
+
+
+def test_checks_are_announced(monkeypatch, capsys):
+    # 1.e4 e5 2.Nf3 Nc6 3.Bc4 Bc5 4.O-O Bxf2+ 5.Rxf2 d6 6.Rf1 Qh4 7.Bxf7+
+    answers = ['e2', 'e4', 'e7', 'e5', 'g1', 'f3', 'b8', 'c6', 'f1', 'c4',
+               'f8', 'c5', 'castle', 'king', 'c5', 'f2', 'f1', 'f2', 'd7',
+               'd6', 'f2', 'f1', 'd8', 'h4', 'c4', 'f7', 'resign']
+    out = play(monkeypatch, capsys, answers)
+    assert out.count('White is in check!') == 1
+    assert out.count('Black is in check!') == 1
+    assert out.rstrip().endswith('Black resigns. White wins!')
@@ -0,0 +1,72 @@
+import random
+
+
+def play(board, move):
+    # Play a move tuple through move or castle, which record it
+    piece, start, end, promote = move
+    if piece == 'k' and abs(end[1] - start[1]) == 2:
+        if end[1] == 6:
+            return board.castle(board.turn, 'k')
+        return board.castle(board.turn, 'q')
+    return board.move(board.turn, piece, start, end, promote or 'q')
+
+
+def played_game(board_class, seed, plies=80):
+    # A board after a random game, with the FEN after every ply
+    rng = random.Random(seed)
+    board = board_class()
+    fens = [board.to_fen()]
+    for ply in range(plies):
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        assert play(board, rng.choice(moves)) is None
+        fens.append(board.to_fen())
+    return board, fens
+
+
+def test_undo_and_redo_every_ply(board_class):
+    board, fens = played_game(board_class, 1)
+    key = board.key()
+    for ply in range(len(fens) - 1, 0, -1):
+        assert board.undo() is None
+        assert board.ply == ply - 1
+        assert board.to_fen() == fens[ply - 1]
+    assert board.undo() == "Illegal Move"
+    for ply in range(1, len(fens)):
+        assert board.redo() is None
+        assert board.to_fen() == fens[ply]
+    assert board.redo() == "Illegal Move"
+    assert board.key() == key
+
+
+def test_goto(board_class):
+    board, fens = played_game(board_class, 2)
+    for ply in [0, len(fens) - 1, 10, 3, 40, 40, 0]:
+        assert board.goto(ply) is None
+        assert board.ply == ply
+        assert board.to_fen() == fens[ply]
+        fresh = board_class.from_fen(fens[ply])
+        assert board.key() == fresh.key()
+        assert board.evaluate() == fresh.evaluate()
+    assert board.goto(len(fens)) == "Illegal Move"
+    assert board.goto(-1) == "Illegal Move"
+
+
+def test_new_move_drops_the_moves_taken_back(board_class):
+    board, fens = played_game(board_class, 3, 20)
+    board.goto(10)
+    moves = list(board.generate_legal_moves(board.turn))
+    assert play(board, moves[-1]) is None
+    assert board.ply == 11
+    assert len(board.history) == 11
+    assert board.redo() == "Illegal Move"
+
+
+def test_copy_keeps_its_own_history(board_class):
+    board, fens = played_game(board_class, 4, 20)
+    copy = board.copy()
+    copy.goto(0)
+    assert board.ply == len(fens) - 1
+    assert board.to_fen() == fens[-1]
+    assert copy.to_fen() == fens[0]
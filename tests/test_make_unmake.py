@@ -0,0 +1,48 @@
+import random
+
+
+def snapshot(board):
+    # Everything make_move changes and unmake_move must put back
+    attacks = board.attacks
+    if attacks is not None:
+        attacks = bytes(attacks)
+    return ([rank[:] for rank in board.state], board.rights, board.turn,
+            board.zobrist, dict(board.kings), attacks, board.middlegame,
+            board.endgame, board.phase)
+
+
+def test_unmake_restores_every_tracker(board_class, positions):
+    for fen in positions[::4]:
+        board = board_class.from_fen(fen)
+        before = snapshot(board)
+        for move in list(board.generate_legal_moves(board.turn)):
+            undo = board.make_move(board.turn, *move)
+            board.unmake_move(undo)
+            assert snapshot(board) == before, (fen, move)
+
+
+def test_make_move_matches_a_fresh_board(board_class, positions):
+    # The trackers kept up to date by make_move equal the ones worked out
+    # from scratch for the position reached
+    for fen in positions[::8]:
+        board = board_class.from_fen(fen)
+        for move in list(board.generate_legal_moves(board.turn)):
+            undo = board.make_move(board.turn, *move)
+            fresh = board_class.from_fen(board.to_fen())
+            assert snapshot(board) == snapshot(fresh), (fen, move)
+            board.unmake_move(undo)
+
+
+def test_long_game_unwinds_to_the_start(board_class):
+    rng = random.Random(7)
+    board = board_class()
+    start = snapshot(board)
+    undos = []
+    for ply in range(200):
+        moves = list(board.generate_legal_moves(board.turn))
+        if not moves:
+            break
+        undos.append(board.make_move(board.turn, *rng.choice(moves)))
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+    assert snapshot(board) == start
@@ -0,0 +1,58 @@
+from chess32 import (CASTLE, DOUBLE_PUSH, EN_PASSANT, decode_move, encode_move,
+                     move_buffer)
+
+
+def test_encode_decode_round_trip():
+    for start in range(64):
+        for end in range(64):
+            for flag in range(8):
+                code = encode_move(start, end, flag)
+                assert 0 <= code < 1 << 16
+                assert decode_move(code) == (start, end, flag)
+
+
+def test_packed_moves_match_the_move_tuples(board_class, positions):
+    buffer = move_buffer()
+    for fen in positions:
+        board = board_class.from_fen(fen)
+        count = board.generate_packed_moves(board.turn, buffer)
+        unpacked = [board.unpack_move(code) for code in buffer[:count]]
+        assert sorted(unpacked) == sorted(
+            board.generate_legal_moves(board.turn))
+        for code in buffer[:count]:
+            assert board.pack_move(*board.unpack_move(code)) == code
+
+
+def test_flags(board_class):
+    board = board_class.from_fen('r3k2r/8/8/3pP3/8/8/1p4P1/R3K2R w KQkq d6')
+    assert decode_move(board.pack_move('k', (7, 4), (7, 6), None))[2] == CASTLE
+    assert decode_move(
+        board.pack_move('p', (3, 4), (2, 3), None))[2] == EN_PASSANT
+    assert decode_move(
+        board.pack_move('p', (6, 6), (4, 6), None))[2] == DOUBLE_PUSH
+    code = board.pack_move('p', (6, 1), (7, 1), 'n')
+    assert board.unpack_move(code) == ('p', (6, 1), (7, 1), 'n')
+
+
+def test_move_takes_a_packed_move(board_class):
+    board = board_class()
+    code = board.pack_move('p', (6, 4), (4, 4), None)
+    assert board.move('w', code) is None
+    assert board.to_fen().split()[:4] == [
+        'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR', 'b', 'KQkq', '-']
+
+
+
+def test_only_a_real_castle_is_taken_packed(board_class):
+    for player, home, other in [('w', 60, 4), ('b', 4, 60)]:
+        fen = f'r3k2r/8/8/8/8/8/8/R3K2R {player} KQkq - 0 1'
+        board = board_class.from_fen(fen)
+        # A rank off, one or three files along, or from the other king
+        for start, end in [(home, home - 6), (home, home + 1),
+                           (home, home + 3), (home, other + 2),
+                           (other, other + 2), (other, other - 2)]:
+            assert board.move(player, encode_move(start, end, CASTLE)) \
+                == "Illegal Move", (player, start, end)
+        assert board.to_fen() == fen
+        assert board.move(player, encode_move(home, home - 2, CASTLE)) is None
+        assert board.piece_on(home - 1) == f'{player}r'
@@ -0,0 +1,13 @@
+import pytest
+
+from perft import POSITIONS, perft
+
+
+@pytest.mark.parametrize('position', POSITIONS,
+                         ids=[position['name'] for position in POSITIONS])
+def test_perft(board_class, position):
+    board = board_class.from_fen(position['fen'])
+    for depth in [1, 2, 3]:
+        assert perft(board, depth) == position['nodes'][depth - 1]
+    # The board is left as it was
+    assert board.to_fen() == board_class.from_fen(position['fen']).to_fen()
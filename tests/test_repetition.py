@@ -0,0 +1,58 @@
+import builtins
+
+from chess32 import ChessBoard, RepetitionTracker, main
+
+# 1.e4 Nf6 2.Nf3 Ng8 3.Ng1 Nf6 4.Nf3 Ng8 5.Ng1, which brings back the
+# position after 1.e4 twice
+KNIGHT_DANCE = [('e2', 'e4'), ('g8', 'f6'), ('g1', 'f3'), ('f6', 'g8'),
+                ('f3', 'g1'), ('g8', 'f6'), ('g1', 'f3'), ('f6', 'g8'),
+                ('f3', 'g1')]
+
+
+def square(name):
+    return (8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+
+def test_tracker_counts_and_windows():
+    tracker = RepetitionTracker(1)
+    assert tracker.add(2) == 1
+    assert tracker.add(1) == 2
+    assert tracker.threefold() == False
+    assert tracker.add(1) == 3
+    assert tracker.threefold() == True
+    tracker.undo()
+    assert tracker.count() == 2
+    # An irreversible move starts a new window
+    assert tracker.add(1, True) == 1
+    assert tracker.windows == [[1, 2, 1]]
+    tracker.undo()
+    assert tracker.keys == [1, 2, 1]
+    assert tracker.count() == 2
+
+
+def test_double_push_without_a_capture_keeps_the_key():
+    board = ChessBoard()
+    keys = []
+    for start, end in KNIGHT_DANCE:
+        piece = board.state[square(start)[0]][square(start)[1]][1]
+        assert board.move(board.turn, piece, square(start), square(end)) \
+            is None
+        keys.append(board.key())
+    assert keys[0] == keys[4] == keys[8]
+    assert board.enpass[0] == False
+
+
+def test_en_passant_that_can_be_made_changes_the_key():
+    fen = 'rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq e3'
+    with_capture = ChessBoard.from_fen(fen)
+    assert with_capture.enpass == [True, (4, 4)]
+    without = ChessBoard.from_fen(fen.replace('e3', '-'))
+    assert with_capture.key() != without.key()
+
+
+def test_main_declares_threefold_repetition(monkeypatch, capsys):
+    answers = iter([name for move in KNIGHT_DANCE for name in move])
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': next(answers))
+    main()
+    assert 'Threefold repetition! The game is a draw!' in \
+        capsys.readouterr().out
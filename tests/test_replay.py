@@ -0,0 +1,100 @@
+import json
+
+from replay import (chunks, main, parse_san, read_pgn, read_uci, replay,
+                    replay_batches)
+
+PGN = '''[Event "Casual"]
+[White "Anderssen"]
+[Black "Kieseritzky"]
+
+1. e4 {the king's pawn} e5 2. f4 exf4 3. Bc4 Qh4+ (3... d5 4. Bxd5) 4. Kf1
+b5 $1 5. Bxb5 Nf6 1/2-1/2
+
+[White "Scholar"]
+1.e4 e5 2.Qh5 Nc6 3.Bc4 Nf6?? 4.Qxf7# 1-0
+
+1. e4 e5 2. Ke3 *
+'''
+
+
+def test_read_pgn_skips_comments_variations_and_annotations():
+    games = list(read_pgn(PGN.splitlines(True)))
+    assert len(games) == 3
+    assert games[0]['tags']['Black'] == 'Kieseritzky'
+    assert games[0]['moves'] == ['e4', 'e5', 'f4', 'exf4', 'Bc4', 'Qh4+',
+                                 'Kf1', 'b5', 'Bxb5', 'Nf6']
+    assert games[0]['result'] == '1/2-1/2'
+    assert games[1]['moves'][-1] == 'Qxf7#'
+    assert games[2]['tags'] == {}
+
+
+def test_replay_reports_status_and_the_first_illegal_move(board_class):
+    results = [replay(game, board_class)
+               for game in read_pgn(PGN.splitlines(True))]
+    assert results[0]['legal'] and results[0]['status'] == 'ongoing'
+    assert results[0]['white'] == 'Anderssen'
+    assert results[1]['plies'] == 7 and results[1]['status'] == 'checkmate'
+    assert results[2]['legal'] == False
+    assert (results[2]['illegal_ply'], results[2]['illegal_move']) \
+        == (3, 'Ke3')
+
+
+def test_uci_castling_and_promotion(board_class):
+    lines = ['# a game in UCI', '',
+             'e2e4 d7d5 e4d5 c7c6 d5c6 g8f6 c6b7 e7e6 b7a8q f8e7 g1f3 e8g8 '
+             'f1e2 b8c6 e1g1 1-0']
+    game = next(read_uci(lines))
+    assert game['result'] == '1-0'
+    result = replay(game, board_class, 'uci')
+    assert result['legal'] and result['plies'] == 15
+    game['moves'][8] = 'b7a8'  # a promotion must name the piece
+    assert replay(game, board_class, 'uci')['illegal_ply'] == 9
+
+
+def test_san_disambiguation(board_class):
+    board = board_class.from_fen('4k3/8/8/8/8/8/4K3/R6R w - -')
+    assert parse_san(board, 'w', 'Rd1') == "Illegal Move"
+    assert parse_san(board, 'w', 'Rad1') == ('r', (7, 0), (7, 3), None)
+    assert parse_san(board, 'w', 'Rhd1') == ('r', (7, 7), (7, 3), None)
+    # Of two knights that reach d5, the pinned one can't move
+    board = board_class.from_fen('4r1k1/8/8/8/8/2N1N3/8/4K3 w - -')
+    assert parse_san(board, 'w', 'Nd5') == ('n', (5, 2), (3, 3), None)
+
+
+def test_main_prints_a_line_per_game_and_a_summary(tmp_path, capsys):
+    path = tmp_path / 'games.pgn'
+    path.write_text(PGN)
+    assert main([str(path)]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line['game'] for line in lines[:-1]] == [1, 2, 3]
+    assert lines[-1]['games'] == 3
+    assert (lines[-1]['legal'], lines[-1]['illegal']) == (2, 1)
+
+
+def test_workers_keep_results_in_input_order():
+    games = list(read_pgn((PGN * 7).splitlines(True)))
+    alone = [result for pid, seconds, results in replay_batches(games)
+             for result in results]
+    batches = list(replay_batches(iter(games), workers=2, chunk_size=2))
+    assert [len(results) for pid, seconds, results in batches] \
+        == [2] * 10 + [1]
+    shared = [result for pid, seconds, results in batches
+              for result in results]
+    assert shared == alone
+    assert [result['legal'] for result in shared] == [True, True, False] * 7
+
+
+def test_chunks():
+    assert list(chunks(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunks(iter([]), 2)) == []
+
+
+def test_main_reports_each_worker(tmp_path, capsys):
+    path = tmp_path / 'games.pgn'
+    path.write_text(PGN * 4)
+    assert main([str(path), '--workers', '2', '--chunk-size', '3']) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line['game'] for line in lines[:-1]] == list(range(1, 13))
+    summary = lines[-1]
+    assert summary['illegal'] == 4
+    assert sum(worker['games'] for worker in summary['workers']) == 12
@@ -0,0 +1,105 @@
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server import Game, GameServer
+
+
+async def connect(server):
+    # One end of a socket pair is served, the other is the client
+    served, client = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=served)
+    task = asyncio.ensure_future(server.handle(reader, writer))
+    reader, writer = await asyncio.open_connection(sock=client)
+    return reader, writer, task
+
+
+async def send(writer, reader, line):
+    writer.write(f'{line}\n'.encode())
+    return (await reader.readline()).decode().split()
+
+
+async def fools_mate(executor):
+    server = GameServer(executor=executor)
+    white, white_writer, white_task = await connect(server)
+    black, black_writer, black_task = await connect(server)
+
+    assert await send(white_writer, white, 'new') == ['game', '1', 'w']
+    assert await send(white_writer, white, 'e2e4') == [
+        'error', 'waiting', 'for', 'an', 'opponent']
+    assert await send(black_writer, black, 'join 1') == ['start', '1']
+    assert (await white.readline()).split() == [b'start', b'1']
+    assert await send(black_writer, black, 'e7e5') == [
+        'error', 'not', 'your', 'turn']
+    assert await send(white_writer, white, 'e2e5') == [
+        'error', 'illegal', 'move']
+
+    moves = ['f2f3', 'e7e5', 'g2g4', 'd8h4']
+    for ply, move in enumerate(moves):
+        if ply % 2 == 0:
+            reader, writer, other = white, white_writer, black
+        else:
+            reader, writer, other = black, black_writer, white
+        words = await send(writer, reader, move)
+        assert words[:3] == ['move', 'wb'[ply % 2], move]
+        assert (await other.readline()).split()[:3] == [
+            b'move', 'wb'[ply % 2].encode(), move.encode()]
+    assert (await white.readline()).split() == [b'checkmate', b'b']
+    assert (await black.readline()).split() == [b'checkmate', b'b']
+    assert words[3:] == ['rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR',
+                         'w', 'KQkq', '-', '0', '1']
+    assert server.games == {}
+
+    assert await send(white_writer, white, 'g1f3') == [
+        'error', 'game', 'over']
+    for writer, task in [(white_writer, white_task),
+                         (black_writer, black_task)]:
+        writer.write(b'quit\n')
+        await task
+        writer.close()
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_game_over_a_socket_pair(threads):
+    executor = None
+    if threads:
+        executor = ThreadPoolExecutor(max_workers=1)
+    asyncio.run(fools_mate(executor))
+    if executor is not None:
+        executor.shutdown()
+
+
+async def leave():
+    server = GameServer()
+    white, white_writer, white_task = await connect(server)
+    black, black_writer, black_task = await connect(server)
+    await send(white_writer, white, 'new')
+    await send(black_writer, black, 'join 1')
+    await white.readline()
+    assert await send(white_writer, white, 'board') == [
+        'fen', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR', 'w', 'KQkq',
+        '-', '0', '1']
+    # The opponent is told when a player disconnects mid game
+    white_writer.close()
+    await white_task
+    assert (await black.readline()).split() == [b'left', b'w']
+    black_writer.close()
+    await black_task
+
+
+def test_leaving_ends_the_game():
+    asyncio.run(leave())
+
+
+def test_castling_and_check():
+    game = Game(1)
+    for player, move in [('w', 'e2e4'), ('b', 'e7e5'), ('w', 'g1f3'),
+                         ('b', 'b8c6'), ('w', 'f1c4'), ('b', 'f8c5'),
+                         ('w', 'castle k'), ('b', 'c5f2')]:
+        lines = game.play(player, move)
+        assert lines[0].startswith(f'move {player} {move}')
+    assert lines[1:] == ['check w']
+    assert game.board.piece_on(61) == 'wr'
+    assert game.play('w', 'castle x') == ['error castle k or castle q']
@@ -0,0 +1,55 @@
+import copy
+
+import pytest
+
+from tests.test_make_unmake import snapshot
+
+
+def test_assigning_state_loads_the_position(board_class):
+    board = board_class.from_fen('4k3/8/8/8/8/8/8/4K2R w K -')
+    str(board)
+    state = [[''] * 8 for rank in range(8)]
+    state[0][0] = 'bk'
+    state[7][0] = 'wq'
+    state[7][7] = 'wk'
+    board.state = state
+    fresh = board_class.from_fen(board.to_fen())
+    assert board.kings == {'w': (7, 7), 'b': (0, 0)}
+    assert board.in_check('b') == True
+    assert board.evaluate('w') == fresh.evaluate('w')
+    assert board.key() == fresh.key()
+    assert str(board) == str(fresh)
+
+
+def test_assigning_rights_updates_the_key(board_class):
+    board = board_class.from_fen('r3k2r/8/8/8/3pP3/8/8/R3K2R b KQkq -')
+    board.w_castle = {'k': False, 'q': True}
+    board.b_castle = {'k': True, 'q': False}
+    board.enpass = [True, (4, 4)]
+    fen = board.to_fen()
+    assert fen.split()[2:4] == ['Qk', 'e3']
+    assert board.key() == board_class.from_fen(fen).key()
+
+
+def test_copy_is_independent(board_class, positions):
+    board = board_class.from_fen(positions[40])
+    before = snapshot(board)
+    duplicate = board.copy()
+    assert snapshot(duplicate) == before
+    assert snapshot(copy.deepcopy(board)) == before
+    assert duplicate.check_info('w') == board.check_info('w')
+    move = next(duplicate.generate_legal_moves(duplicate.turn))
+    duplicate.make_move(duplicate.turn, *move)
+    assert snapshot(board) == before
+
+
+def test_boards_are_compared_by_position_and_keyed_explicitly(board_class):
+    board = board_class()
+    other = board_class()
+    assert board == other
+    # A board changes as moves are made, so caches are keyed by key()
+    with pytest.raises(TypeError):
+        {board}
+    assert {board.key(): 1}[other.key()] == 1
+    other.move('w', 'n', (7, 6), (5, 5))
+    assert board != other and board.key() != other.key()
@@ -0,0 +1,75 @@
+from chess32 import ChessBoard
+from engine import EXACT, LOWER, UPPER, Search, TranspositionTable
+from perft import POSITIONS, perft
+
+
+def colliding_keys(table, count):
+    # Keys that all fall in the first bucket
+    return [1 + table.buckets * number for number in range(count)]
+
+
+def test_store_and_probe():
+    table = TranspositionTable(1)
+    board = ChessBoard()
+    move = board.pack_move('n', (7, 6), (5, 5), None)
+    assert table.probe(board.key()) is None
+    table.store(board.key(), 5, -42, LOWER, move)
+    assert table.probe(board.key()) == (5, -42, LOWER, move)
+    assert board.unpack_move(move) == ('n', (7, 6), (5, 5), None)
+    table.store(board.key() ^ 1, 0, 7, UPPER)
+    assert table.probe(board.key() ^ 1) == (0, 7, UPPER, 0)
+    stats = table.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_replacement():
+    table = TranspositionTable(0.01)
+    first, second, third = colliding_keys(table, 3)
+    table.store(first, 6, 1, EXACT)
+    # A shallower result goes to the second entry of the bucket
+    table.store(second, 2, 2, EXACT)
+    assert table.probe(first) == (6, 1, EXACT, 0)
+    assert table.probe(second) == (2, 2, EXACT, 0)
+    # and the second entry is replaced on every store
+    table.store(third, 1, 3, EXACT)
+    assert table.probe(second) is None
+    assert table.probe(third) == (1, 3, EXACT, 0)
+    assert table.stats()['collisions'] == 1
+    # A deeper result, or the same position, takes the first entry
+    table.store(first, 3, 4, UPPER)
+    assert table.probe(first) == (3, 4, UPPER, 0)
+    table.store(second, 3, 5, EXACT)
+    assert table.probe(first) is None
+    assert table.probe(second) == (3, 5, EXACT, 0)
+    assert table.stats()['replaced'] == 2
+
+
+def test_clear():
+    table = TranspositionTable(0.01)
+    table.store(12345, 4, 9, EXACT)
+    table.clear()
+    assert table.probe(12345) is None
+    assert table.stats()['filled'] == 0
+
+
+def test_search_with_table_finds_the_same_score():
+    fen = ('r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - '
+           '2 3')
+    plain = Search(ChessBoard.from_fen(fen)).search(None, 10 ** 7, 3)
+    table = TranspositionTable(1)
+    cached = Search(ChessBoard.from_fen(fen), table).search(None, 10 ** 7, 3)
+    assert cached['score'] == plain['score']
+    assert cached['move'] == ('q', (5, 5), (1, 5), None)  # Qxf7 mate
+    assert cached['nodes'] <= plain['nodes']
+
+
+def test_perft_with_table():
+    # A second count of the same tree is looked up from the table
+    position = POSITIONS[1]
+    board = ChessBoard.from_fen(position['fen'])
+    table = TranspositionTable(1)
+    assert perft(board, 3, table) == position['nodes'][2]
+    assert table.hits == 0
+    assert perft(board, 3, table) == position['nodes'][2]
+    assert table.hits > 0
@@ -0,0 +1,58 @@
+import pytest
+
+from chess32 import ChessBoard
+from tablebase import Tablebases, generate
+
+
+@pytest.fixture(scope='module')
+def tables(tmp_path_factory):
+    # KPK is built from the KQK and KRK tables, so they go first
+    directory = tmp_path_factory.mktemp('tablebases')
+    stats = {material: generate(material, str(directory))
+             for material in ['kqk', 'krk', 'kpk']}
+    bases = Tablebases(str(directory))
+    yield stats, bases
+    bases.close()
+
+
+def test_longest_mates(tables):
+    stats, bases = tables
+    assert stats['kqk']['longest'] == 20
+    assert stats['krk']['longest'] == 32
+    assert stats['kpk']['longest'] == 56
+
+
+@pytest.mark.parametrize('fen, result', [
+    ('k7/8/1K6/8/8/8/7Q/8 w - -', ('win', 1)),
+    ('k7/8/1Q6/8/8/8/8/1K6 b - -', ('draw', None)),  # stalemate
+    ('K7/8/1k6/8/8/8/7q/8 b - -', ('win', 1)),
+    ('k6Q/8/1K6/8/8/8/8/8 b - -', ('loss', 0)),
+    ('4k3/4P3/4K3/8/8/8/8/8 b - -', ('draw', None)),
+    ('k6R/8/K7/8/8/8/8/8 b - -', ('loss', 0)),
+    ('4k3/8/8/8/8/8/8/R3K3 w Q -', None),  # castling rights
+    ('4k3/8/8/8/8/8/8/RR2K3 w - -', None),
+])
+def test_probe(tables, fen, result):
+    stats, bases = tables
+    assert bases.probe(ChessBoard.from_fen(fen)) == result
+
+
+def test_mate_comes_one_ply_closer_each_move(tables):
+    stats, bases = tables
+    board = ChessBoard.from_fen('8/8/8/4k3/8/8/8/R3K3 w - -')
+    result = bases.probe(board)
+    assert result[0] == 'win'
+    plies = result[1]
+    while plies > 0:
+        # Some move, the best for either side, is exactly one ply closer
+        player = board.turn
+        for move in list(board.generate_legal_moves(player)):
+            undo = board.make_move(player, *move)
+            after = bases.probe(board)
+            if after is not None and after[1] == plies - 1:
+                break
+            board.unmake_move(undo)
+        else:
+            pytest.fail(f'no move to mate in {plies - 1} plies')
+        plies -= 1
+    assert board.stalemate(board.turn) and board.in_check(board.turn)